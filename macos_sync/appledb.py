@@ -0,0 +1,270 @@
+"""
+appledb.py: Incremental AppleDB main.json parsing
+
+main.json covers every Apple OS and is tens of megabytes, while only macOS
+entries with IPSW links are of interest. Rather than loading the entire
+document, the response is streamed and only its outer object and the
+requested group's array are walked in Python; each entry is decoded whole by
+the C scanner, and the stream is closed once the group has been read.
+
+The filtered entries are cached alongside the response's ETag/Last-Modified,
+so an unchanged document is answered with a 304 and costs no transfer.
+"""
+
+import re
+import json
+import codecs
+import logging
+
+from pathlib import Path
+
+from . import telemetry
+from .network import NetworkUtilities
+
+
+APPLE_DB_URL = "https://api.appledb.dev/main.json"
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER    = json.JSONDecoder()
+
+
+class _JSONStream:
+    """
+    Buffered reader over a chunked JSON document
+
+    Only the outer containers are walked here, their members are decoded
+    whole with the C scanner (JSONDecoder.raw_decode). A member cut off by the
+    end of the buffer fails to decode, and is retried once more data is read.
+    """
+
+    def __init__(self, chunks) -> None:
+        self.buffer:    str  = ""
+        self.position:  int  = 0
+        self.exhausted: bool = False
+
+        self._chunks = iter(chunks)
+
+
+    def _read(self) -> None:
+        if self.exhausted:
+            raise json.JSONDecodeError("Unexpected end of document", self.buffer, len(self.buffer))
+
+        # Drop everything already consumed
+        self.buffer, self.position = self.buffer[self.position:], 0
+        try:
+            self.buffer += next(self._chunks)
+        except StopIteration:
+            self.exhausted = True
+
+
+    def peek(self) -> str:
+        """
+        Next non-whitespace character, without consuming it
+        """
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            self._read()
+
+
+    def expect(self, character: str) -> None:
+        if self.peek() != character:
+            raise json.JSONDecodeError(f"Expecting {character!r}", self.buffer, self.position)
+        self.position += 1
+
+
+    def decode(self) -> tuple:
+        """
+        Decode the next value
+
+        Returns:
+            tuple: (value, raw text of the value)
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+                self._read()
+                continue
+
+            # A number ending the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.exhausted:
+                self._read()
+                continue
+
+            raw = self.buffer[self.position:end]
+            self.position = end
+            return value, raw
+
+
+    def members(self):
+        """
+        Step through the array or object at the current position
+
+        The caller must consume each member's value (decode() or skip()) before
+        the next is yielded.
+
+        Yields:
+            str: Member key, None for array elements
+        """
+        opening = self.peek()
+        if opening not in "[{":
+            raise json.JSONDecodeError("Expecting array or object", self.buffer, self.position)
+        closing = "]" if opening == "[" else "}"
+        self.position += 1
+
+        if self.peek() == closing:
+            self.position += 1
+            return
+
+        while True:
+            key = None
+            if opening == "{":
+                key, _ = self.decode()
+                self.expect(":")
+            yield key
+
+            if self.peek() == closing:
+                self.position += 1
+                return
+            self.expect(",")
+
+
+    def skip(self) -> None:
+        """
+        Consume the next value, a container one member at a time to bound memory
+        """
+        if self.peek() in "[{":
+            for _ in self.members():
+                self.decode()
+        else:
+            self.decode()
+
+
+def iter_group_entries(chunks, group: str, markers: list = None):
+    """
+    Yield entries of a top-level array from a streamed JSON object
+
+    Parameters:
+        chunks  (iterable): Decoded text chunks of the document
+        group   (str):      Top-level key holding the array, ex. 'ios'
+        markers (list):     Substrings an entry's raw text must contain to be yielded
+
+    Yields:
+        dict: Decoded entries
+    """
+
+    markers = markers or []
+    stream = _JSONStream(chunks)
+
+    for key in stream.members():
+        if key != group or stream.peek() != "[":
+            stream.skip()
+            continue
+
+        for _ in stream.members():
+            entry, raw = stream.decode()
+            if isinstance(entry, dict) and all(marker in raw for marker in markers):
+                yield entry
+
+        # Group finished, no need to read the rest of the document
+        return
+
+
+class AppleDBCatalog:
+    """
+    Fetch macOS entries from AppleDB
+
+    Parameters:
+        cache_path (Path): Where to cache filtered entries and validators, None to disable
+        url        (str):  main.json URL, override to point at a local stand-in
+
+    Usage:
+        >>> for item in AppleDBCatalog("appledb_cache.json").entries():
+        ...     print(item["build"])
+    """
+
+    def __init__(self, cache_path: Path = None, url: str = APPLE_DB_URL) -> None:
+        self.cache_path: Path = Path(cache_path) if cache_path else None
+        self.url:        str  = url
+
+
+    def _load_cache(self, filter: list) -> dict:
+        if self.cache_path is None or not self.cache_path.exists():
+            return None
+        try:
+            cache = json.loads(self.cache_path.read_text())
+        except json.JSONDecodeError:
+            return None
+        if cache.get("URL") != self.url or cache.get("Filter") != filter:
+            return None
+        return cache
+
+
+    def _save_cache(self, response, filter: list, entries: list) -> None:
+        if self.cache_path is None:
+            return
+        if not response.headers.get("ETag") and not response.headers.get("Last-Modified"):
+            return
+
+        temp_path = Path(f"{self.cache_path}.tmp")
+        temp_path.write_text(json.dumps({
+            "URL":           self.url,
+            "Filter":        filter,
+            "ETag":          response.headers.get("ETag"),
+            "Last-Modified": response.headers.get("Last-Modified"),
+            "Entries":       entries,
+        }))
+        temp_path.replace(self.cache_path)
+
+
+    def _stream_text(self, response):
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            telemetry.count("bytes", len(chunk))
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+
+    def entries(self, os_str: str = "macOS", variant: str = ".ipsw") -> list:
+        """
+        Entries of the given OS with at least one link of the given variant
+
+        Returns:
+            list: Raw AppleDB entries
+        """
+
+        filter = [os_str, variant]
+        cache = self._load_cache(filter)
+
+        headers = {}
+        if cache:
+            if cache.get("ETag"):
+                headers["If-None-Match"] = cache["ETag"]
+            if cache.get("Last-Modified"):
+                headers["If-Modified-Since"] = cache["Last-Modified"]
+
+        with telemetry.span("catalog_fetch", url=self.url):
+            response = NetworkUtilities().get(self.url, headers=headers, stream=True, timeout=60)
+            if response.status_code == 304:
+                response.close()
+                return cache["Entries"]
+            if response.status_code != 200:
+                logging.error(f"Failed to fetch {self.url}: {response.status_code}")
+                return cache["Entries"] if cache else []
+
+            try:
+                markers = [f'"{os_str}"', variant]
+                entries = [
+                    entry for entry in iter_group_entries(self._stream_text(response), "ios", markers)
+                    if entry.get("osStr") == os_str
+                ]
+            finally:
+                response.close()
+
+        self._save_cache(response, filter, entries)
+        return entries
@@ -0,0 +1,87 @@
+"""
+archive.py: Lightweight archive.org lookups
+
+Queries archive.org's search and metadata APIs directly through the shared
+network utilities, avoiding the cost of importing the internetarchive library
+for read-only lookups.
+"""
+
+import logging
+
+from .network import NetworkUtilities
+
+
+class ArchiveLookup:
+    """
+    Read-only queries against archive.org
+
+    Parameters:
+        base_url (str): archive.org base URL, override to point at a local stand-in
+    """
+
+    def __init__(self, base_url: str = "https://archive.org") -> None:
+        self.base_url: str = base_url.rstrip("/")
+
+
+    def search(self, query: str, fields: list = ["identifier"], rows: int = 10000) -> list:
+        """
+        Search archive.org items
+
+        Parameters:
+            query  (str):  Lucene-style query, ex. 'uploader:khronokernel title:(22G720)'
+            fields (list): Metadata fields to return for each item
+            rows   (int):  Maximum number of results
+
+        Returns:
+            list: Dictionaries of the requested fields per item
+        """
+        response = NetworkUtilities().get(
+            f"{self.base_url}/advancedsearch.php",
+            params={
+                "q":      query,
+                "fl[]":   fields,
+                "rows":   rows,
+                "output": "json",
+            },
+            timeout=30,
+        )
+        if response.status_code != 200:
+            raise Exception(f"Failed to search archive.org: {response.status_code}")
+
+        return response.json()["response"]["docs"]
+
+
+    def identifier_exists(self, identifier: str) -> bool:
+        """
+        Check if an item identifier is in use
+
+        Returns:
+            bool: True if the item exists
+        """
+        response = NetworkUtilities().get(f"{self.base_url}/metadata/{identifier}", timeout=30)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch metadata for {identifier}: {response.status_code}")
+
+        # Unknown identifiers return an empty object
+        return bool(response.json())
+
+
+    def item_files(self, identifier: str) -> dict:
+        """
+        Files of an item and their sizes
+
+        Returns:
+            dict: File name to size in bytes, empty if the item doesn't exist
+        """
+        response = NetworkUtilities().get(f"{self.base_url}/metadata/{identifier}", timeout=30)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch metadata for {identifier}: {response.status_code}")
+
+        return {file["name"]: int(file.get("size", 0)) for file in response.json().get("files", [])}
+
+
+    def download_url(self, identifier: str, file: str) -> str:
+        """
+        URL of a file within an item
+        """
+        return f"{self.base_url}/download/{identifier}/{file}"
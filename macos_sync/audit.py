@@ -0,0 +1,189 @@
+"""
+audit.py: Spot-check installers already archived on archive.org
+
+Rather than re-downloading an entire InstallAssistant.pkg, fetch the uploaded
+.integrityDataV1 and verify a random sample of chunks via HTTP Range requests.
+"""
+
+import random
+import logging
+
+from pathlib import Path
+
+from . import integrity_verification
+from .archive import ArchiveLookup
+from .network import NetworkUtilities
+
+
+class ArchiveAudit:
+    """
+    Audit archived InstallAssistants by sampling chunks
+
+    Parameters:
+        contributor (str): archive.org uploader to audit
+        samples     (int): Number of chunks to verify per item (last chunk is always included)
+        base_url    (str): archive.org base URL, override to point at a local stand-in
+        seed        (int): Optional seed for chunk selection, for reproducible audits
+
+    Usage:
+        >>> audit_obj = ArchiveAudit("khronokernel", samples=8)
+        >>> for result in audit_obj.audit():
+        ...     print(result["Identifier"], result["Status"], result["Confidence"])
+    """
+
+    def __init__(self, contributor: str, samples: int = 8, base_url: str = "https://archive.org", seed: int = None) -> None:
+        if samples < 1:
+            raise ValueError(f"At least one chunk must be sampled, got {samples}")
+
+        self.contributor: str = contributor
+        self.samples:     int = samples
+        self.base_url:    str = base_url.rstrip("/")
+
+        self._lookup: ArchiveLookup = ArchiveLookup(self.base_url)
+        self._random: random.Random = random.Random(seed)
+
+
+    def archived_items(self, file: str = "InstallAssistant.pkg") -> list:
+        """
+        List archived items containing the given file
+
+        Parameters:
+            file (str): File name the item title must reference
+
+        Returns:
+            list: Item identifiers
+        """
+
+        try:
+            docs = self._lookup.search(f"uploader:{self.contributor} title:({file})")
+        except Exception as e:
+            logging.error(str(e))
+            return []
+
+        return [doc["identifier"] for doc in docs]
+
+
+    def _fetch_range(self, url: str, offset: int, length: int) -> bytes:
+        """
+        Fetch a byte range of a remote file
+
+        Returns:
+            bytes: Contents of the range, or None if the server did not honour the request
+
+        Raises:
+            Exception: The request failed (ex. timed out), no response to read
+        """
+
+        response = NetworkUtilities().get(
+            url,
+            headers={"Range": f"bytes={offset}-{offset + length - 1}"},
+            stream=True,
+            timeout=30,
+        )
+
+        # NetworkUtilities returns an empty Response on network errors, it has no body to close
+        if response.status_code is None:
+            raise Exception(f"Range request to {url} failed")
+
+        try:
+            # A 200 means the Range header was ignored, don't pull the entire file
+            if response.status_code != 206:
+                logging.error(f"Range request to {url} returned {response.status_code}")
+                return None
+            return response.content
+        finally:
+            response.close()
+
+
+    def audit_item(self, identifier: str, file: str = "InstallAssistant.pkg") -> dict:
+        """
+        Spot-check a single archived item
+
+        Confidence is the probability that the sample would have caught
+        corruption affecting at least 1% of the file's chunks
+
+        Parameters:
+            identifier (str): archive.org identifier
+            file       (str): Payload to verify, chunklist is expected at '{file}.integrityDataV1'
+
+        Returns:
+            dict: Audit result
+        """
+
+        result = {
+            "Identifier":   identifier,
+            "File":         file,
+            "Status":       integrity_verification.ChunklistStatus.FAILURE,
+            "TotalChunks":  0,
+            "Sampled":      0,
+            "FailedChunks": [],
+            "BytesRead":    0,
+            "Coverage":     0.0,
+            "Confidence":   0.0,
+            "Error":        "",
+        }
+
+        response = NetworkUtilities().get(self._lookup.download_url(identifier, f"{file}.integrityDataV1"), timeout=30)
+        if response.status_code != 200:
+            result["Error"] = f"Failed to fetch integrity data: {response.status_code}"
+            return result
+
+        chunk_obj = integrity_verification.ChunklistVerification(Path(file), response.content)
+        ranges = chunk_obj.chunk_ranges()
+        if not ranges:
+            result["Error"] = "Invalid integrity data"
+            return result
+
+        # Always include the last chunk to catch truncated uploads
+        indexes = set(self._random.sample(range(len(ranges) - 1), min(self.samples - 1, len(ranges) - 1)))
+        indexes.add(len(ranges) - 1)
+
+        result["TotalChunks"] = len(ranges)
+
+        url = self._lookup.download_url(identifier, file)
+        for index in sorted(indexes):
+            offset, length = ranges[index]
+            try:
+                data = self._fetch_range(url, offset, length)
+            except Exception as e:
+                logging.error(str(e))
+                result["Error"] = f"Failed to fetch chunk {index}: {e}"
+                return result
+            if data is None:
+                result["Error"] = "Server did not honour Range request"
+                return result
+
+            result["Sampled"]   += 1
+            result["BytesRead"] += len(data)
+            if not chunk_obj.verify_chunk(index, data):
+                result["FailedChunks"].append(index)
+
+        total_size = sum(length for _, length in ranges)
+        result["Coverage"]   = result["BytesRead"] / total_size
+        result["Confidence"] = 1 - (0.99 ** result["Sampled"])
+
+        if result["FailedChunks"]:
+            result["Error"] = f"{len(result['FailedChunks'])} of {result['Sampled']} sampled chunks failed verification"
+            return result
+
+        result["Status"] = integrity_verification.ChunklistStatus.SUCCESS
+        return result
+
+
+    def audit(self, file: str = "InstallAssistant.pkg", limit: int = None) -> list:
+        """
+        Spot-check every archived item containing the given file
+
+        Parameters:
+            file  (str): Payload to verify
+            limit (int): Maximum number of items to audit
+
+        Returns:
+            list: Audit results
+        """
+
+        results = []
+        for identifier in self.archived_items(file)[:limit]:
+            results.append(self.audit_item(identifier, file))
+
+        return results
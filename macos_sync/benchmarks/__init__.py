@@ -0,0 +1,18 @@
+"""
+benchmarks: Performance benchmarks for sync components
+
+Each benchmark is runnable as a module and appends its results to a JSON
+history, flagging configurations that regressed since the previous run on the
+same host.
+
+- integrity: ChunklistVerification throughput
+    python3 -m macos_sync.benchmarks.integrity --help
+- download: Download write path throughput and CPU time
+    python3 -m macos_sync.benchmarks.download --help
+- distribution: Distribution file parsing, against the previous parser
+    python3 -m macos_sync.benchmarks.distribution --help
+- appledb: AppleDB main.json parsing, against json.loads and the previous parser
+    python3 -m macos_sync.benchmarks.appledb --help
+"""
+
+from .history import BenchmarkHistory
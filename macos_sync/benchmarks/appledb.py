@@ -0,0 +1,239 @@
+"""
+appledb.py: AppleDB main.json parsing benchmark
+
+Compares iter_group_entries() against loading the whole document with
+json.loads() and against the regex tokenizer it replaced. All three must
+select the same entries from both a compact and an indented document, fed in
+chunks of several sizes.
+
+The generated document follows main.json's layout: an "ios" array of entries
+for every OS, macOS ones among them, placed after the other top-level groups
+so skipping them is measured too.
+
+Usage:
+    python3 -m macos_sync.benchmarks.appledb --size 27 --repeats 3
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+
+from .history import BenchmarkHistory
+from ..appledb import iter_group_entries
+
+
+MB = 1000 * 1000
+
+METHODS = ["json_loads", "tokenizer", "raw_decode"]
+
+OS_STRS = ["iOS", "iPadOS", "watchOS", "tvOS", "audioOS", "macOS", "Bridge"]
+
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"\s*:|"(?:[^"\\]|\\.)*"|[{}\[\]]|"')
+
+
+def iter_group_entries_tokenizer(chunks, group: str, markers: list = None):
+    """
+    The parser preceding the raw_decode stream reader
+    """
+    markers   = markers or []
+    group_key = json.dumps(group)
+
+    buffer    = ""
+    position  = 0
+    depth     = 0
+    in_group  = False
+    start     = None
+    last_key  = None
+    exhausted = False
+    chunks    = iter(chunks)
+
+    while True:
+        match = _TOKEN.search(buffer, position)
+        if match is None or match.group() == '"' or (match.end() == len(buffer) and not exhausted):
+            if exhausted:
+                return
+            keep = start if start is not None else position
+            buffer, position = buffer[keep:], position - keep
+            if start is not None:
+                start = 0
+            try:
+                buffer += next(chunks)
+            except StopIteration:
+                exhausted = True
+            continue
+
+        token = match.group()
+        position = match.end()
+
+        if token in ("{", "["):
+            depth += 1
+            if depth == 2 and token == "[" and last_key == group_key:
+                in_group = True
+            elif depth == 3 and token == "{" and in_group:
+                start = match.start()
+        elif token in ("}", "]"):
+            depth -= 1
+            if depth == 2 and token == "}" and start is not None:
+                entry = buffer[start:position]
+                start = None
+                if all(marker in entry for marker in markers):
+                    yield json.loads(entry)
+            elif depth == 1 and in_group:
+                return
+        elif token.endswith(":"):
+            if depth == 1:
+                last_key = token[:-1].rstrip()
+        else:
+            last_key = None
+
+
+def _entry(rng: random.Random, index: int) -> dict:
+    os_str  = OS_STRS[index % len(OS_STRS)]
+    version = f"{rng.randint(10, 18)}.{rng.randint(0, 7)}"
+    build   = f"{rng.randint(17, 24)}{'ABCDEFGH'[rng.randint(0, 7)]}{rng.randint(10, 9999)}"
+    devices = [f"Device{rng.randint(1, 20)},{rng.randint(1, 9)}" for _ in range(rng.randint(5, 40))]
+    variant = ".ipsw" if rng.random() < 0.5 else ".zip"
+    return {
+        "osStr":      os_str,
+        "version":    version,
+        "build":      build,
+        "released":   f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+        "beta":       rng.random() < 0.3,
+        "deviceMap":  devices,
+        "appledbWebImage": {"id": f"{os_str.lower()}{version}", "align": "left"},
+        "sources": [
+            {
+                "type":      variant.lstrip("."),
+                "deviceMap": devices[:3],
+                "hashes":    {"sha1": f"{rng.getrandbits(160):040x}"},
+                "links":     [{"url": f"https://updates.cdn-apple.com/{build}/{device}{variant}", "active": True} for device in devices[:3]],
+                "size":      rng.randint(1, 20) * 1000 * MB,
+            }
+        ],
+    }
+
+
+def generate_document(size: int, seed: int = 0, indent: int = None) -> str:
+    """
+    AppleDB-shaped main.json of roughly the given size in bytes
+    """
+    rng = random.Random(seed)
+    entries = []
+    length = 0
+    while length < size * 0.8:
+        entry = _entry(rng, len(entries))
+        entries.append(entry)
+        length += len(json.dumps(entry))
+
+    devices = [{"name": f"Device {index}", "key": f"Device{index}", "soc": ["A", "M"][index % 2] + str(index % 18)} for index in range(int(size * 0.2) // 60)]
+    # Other groups ahead of "ios", so they are skipped rather than left unread
+    return json.dumps({"device": devices, "jailbreak": [], "ios": entries}, indent=indent)
+
+
+def _chunks(document: str, chunk_size: int):
+    for offset in range(0, len(document), chunk_size):
+        yield document[offset:offset + chunk_size]
+
+
+def select(method: str, document: str, chunk_size: int = 1024 * 1024) -> list:
+    """
+    macOS entries with IPSW links, as AppleDBCatalog.entries() selects them
+    """
+    markers = ['"macOS"', ".ipsw"]
+    if method == "json_loads":
+        entries = [
+            entry for entry in json.loads(document)["ios"]
+            if entry.get("osStr") == "macOS" and all(marker in json.dumps(entry) for marker in markers)
+        ]
+    elif method == "tokenizer":
+        entries = list(iter_group_entries_tokenizer(_chunks(document, chunk_size), "ios", markers))
+    else:
+        entries = list(iter_group_entries(_chunks(document, chunk_size), "ios", markers))
+    return [entry for entry in entries if entry.get("osStr") == "macOS"]
+
+
+def verify(document: str) -> None:
+    """
+    Every method must select the same entries, whatever the chunk boundaries
+    """
+    expected = select("json_loads", document)
+    for chunk_size in [1, 7, 4096, 1024 * 1024]:
+        for method in ["tokenizer", "raw_decode"]:
+            if method == "tokenizer" and chunk_size < 4096:
+                # Known to lose keys split from their colon by a chunk boundary
+                continue
+            if select(method, document, chunk_size) != expected:
+                raise Exception(f"{method} disagrees with json_loads at {chunk_size} byte chunks")
+
+
+def measure(method: str, document: str, repeats: int = 1) -> float:
+    """
+    Time selecting entries, best of the given repeats
+
+    Returns:
+        float: Seconds taken
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        select(method, document)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmark(size: int, methods: list = METHODS, repeats: int = 1) -> list:
+    """
+    Verify the methods agree, then measure each
+
+    Returns:
+        list: Result per method, with throughput in MB/s
+    """
+    print("Verifying on small compact and indented documents")
+    for indent in [None, 1]:
+        verify(generate_document(200 * 1000, seed=1, indent=indent))
+
+    document = generate_document(size)
+    print(f"Parsing a {len(document) / MB:.1f} MB document")
+
+    results = []
+    for method in methods:
+        seconds = measure(method, document, repeats)
+        results.append({
+            "Method":  method,
+            "Seconds": seconds,
+            "MBps":    len(document) / MB / seconds,
+        })
+        print(f"  {method:<12} {seconds:6.2f} s, {len(document) / MB / seconds:7.1f} MB/s")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark AppleDB main.json parsing')
+    parser.add_argument('--size',    type=float, help='Document size in MB', default=27)
+    parser.add_argument('--methods', type=str,   help='Parsers to compare', nargs='+', choices=METHODS, default=METHODS)
+    parser.add_argument('--repeats', type=int,   help='Passes per method, the fastest is kept', default=3)
+    parser.add_argument('--history', type=str,   help='JSON history file', default='appledb_benchmark_history.json')
+    args = parser.parse_args()
+
+    parameters = {
+        "Size":    int(args.size * MB),
+        "Methods": args.methods,
+    }
+
+    history  = BenchmarkHistory(args.history)
+    previous = history.previous("appledb", parameters)
+
+    results = run_benchmark(parameters["Size"], methods=args.methods, repeats=args.repeats)
+    history.record("appledb", parameters, results)
+
+    by_method = {result["Method"]: result for result in results}
+    for baseline in ["json_loads", "tokenizer"]:
+        if baseline in by_method and "raw_decode" in by_method:
+            print(f"raw_decode: {by_method[baseline]['Seconds'] / by_method['raw_decode']['Seconds']:.2f}x faster than {baseline}")
+
+    for configuration, before, after in history.regressions(results, previous, ["Method"], "MBps"):
+        print(f"  Regression: {configuration}: {before:.1f} -> {after:.1f} MB/s")
@@ -0,0 +1,255 @@
+"""
+distribution.py: Distribution file parsing benchmark
+
+Compares parse_distribution() against the parser it replaced, which loaded
+every file with both plistlib and ElementTree and decoded it again for the
+SU_TITLE search. Both parsers must agree on every file the legacy parser
+reads; it raises on XML without a <title>, such as XML plists.
+
+The corpus is generated in the shapes found in catalogs:
+
+- installassistant: placeholder title, large script, <auxinfo> build and
+  version, English localization strings
+- update:           placeholder title, no <auxinfo>, parsed to the end
+- titled:           literal title, <auxinfo> with macOSProduct* keys
+- plist:            XML plist
+- bplist:           binary plist
+
+Or pass --corpus with a directory of real .dist files.
+
+Usage:
+    python3 -m macos_sync.benchmarks.distribution --files 200 --repeats 5
+"""
+
+import re
+import time
+import random
+import argparse
+import plistlib
+
+import xml.etree.ElementTree as ET
+
+from pathlib import Path
+
+from .history import BenchmarkHistory
+from ..sucatalog.distribution import parse_distribution
+
+
+KINDS = ["installassistant", "update", "titled", "plist", "bplist"]
+
+
+def parse_legacy(data: bytes) -> dict:
+    """
+    The parser preceding parse_distribution()
+
+    Raises:
+        AttributeError: XML without a <title>, ex. an XML plist
+    """
+    try:
+        plist_contents = plistlib.loads(data)
+    except plistlib.InvalidFileException:
+        plist_contents = None
+
+    try:
+        xml_contents = ET.fromstring(data)
+    except ET.ParseError:
+        xml_contents = None
+
+    _product_map = {
+        "Title":   None,
+        "Build":   None,
+        "Version": None,
+    }
+
+    if plist_contents:
+        if "macOSProductBuildVersion" in plist_contents:
+            _product_map["Build"] = plist_contents["macOSProductBuildVersion"]
+        if "macOSProductVersion" in plist_contents:
+            _product_map["Version"] = plist_contents["macOSProductVersion"]
+        if "BUILD" in plist_contents:
+            _product_map["Build"] = plist_contents["BUILD"]
+        if "VERSION" in plist_contents:
+            _product_map["Version"] = plist_contents["VERSION"]
+
+    if xml_contents:
+        item_title = xml_contents.find(".//title").text
+        if item_title in ["SU_TITLE", "MANUAL_TITLE", "MAN_TITLE"]:
+            title_search = re.search(r'"SU_TITLE"\s*=\s*"(.*)";', data.decode("utf-8"))
+            if title_search:
+                item_title = title_search.group(1)
+
+        _product_map["Title"] = item_title
+
+    return _product_map
+
+
+def _script(rng: random.Random, board_ids: int) -> str:
+    boards = ",".join(f"'Mac-{rng.getrandbits(64):016X}'" for _ in range(board_ids))
+    models = ",".join(f"'J{rng.randint(100, 999)}AP'" for _ in range(board_ids // 4))
+    return f"""
+var boardIds = [{boards}];
+var nonSupportedModels = [{models}];
+function InstallationCheck(prefix) {{
+    if (!system.compareVersions(system.version.ProductVersion, '10.9') < 0) {{
+        my.result.message = system.localizedStringWithFormat('ERROR_0', '10.9');
+        my.result.type = 'Fatal';
+        return false;
+    }}
+    var board = system.ioregistry.fromPath('IOService:/')['board-id'];
+    return boardIds.indexOf(board) >= 0 && nonSupportedModels.indexOf(board) < 0;
+}}
+"""
+
+
+def _distribution(rng: random.Random, title: str, auxinfo: dict, strings: dict, board_ids: int) -> bytes:
+    aux = ""
+    if auxinfo:
+        entries = "".join(f"\n            <key>{key}</key>\n            <string>{value}</string>" for key, value in auxinfo.items())
+        aux = f"\n    <auxinfo>\n        <dict>{entries}\n        </dict>\n    </auxinfo>"
+    localized = "\n".join(f'"{key}" = "{value}";' for key, value in strings.items())
+    build = auxinfo.get("BUILD", auxinfo.get("macOSProductBuildVersion", "0"))
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<installer-gui-script minSpecVersion="2">
+    <title>{title}</title>
+    <options hostArchitectures="x86_64,arm64" customize="never" allow-external-scripts="no" require-scripts="false"/>
+    <volume-check script="InstallationCheck()"/>
+    <installation-check script="InstallationCheck()"/>
+    <script><![CDATA[{_script(rng, board_ids)}]]></script>
+    <choices-outline>
+        <line choice="manual"/>
+    </choices-outline>
+    <choice id="manual" title="{title}" versStr="{build}">
+        <pkg-ref id="com.apple.pkg.InstallAssistant"/>
+    </choice>
+    <pkg-ref id="com.apple.pkg.InstallAssistant" version="{build}" auth="Root" onConclusion="RequireRestart">#InstallAssistant.pkg</pkg-ref>{aux}
+    <localization>
+        <strings language="English"><![CDATA[{localized}
+]]></strings>
+    </localization>
+</installer-gui-script>
+""".encode("utf-8")
+
+
+def generate_corpus(count: int, seed: int = 0) -> list:
+    """
+    Distribution files of every kind, in equal proportions
+
+    Returns:
+        list: (kind, bytes) pairs
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        kind    = KINDS[index % len(KINDS)]
+        major   = rng.randint(11, 15)
+        version = f"{major}.{rng.randint(0, 7)}.{rng.randint(0, 3)}"
+        build   = f"{major + 9}{'ABCDEFGH'[rng.randint(0, 7)]}{rng.randint(10, 9999)}"
+        name    = f"macOS {['Big Sur', 'Monterey', 'Ventura', 'Sonoma', 'Sequoia'][major - 11]}"
+        strings = {"SU_TITLE": name, "SU_VERS": version, "SU_SERVERCOMMENT": "Installs " + name}
+
+        if kind == "installassistant":
+            data = _distribution(rng, "SU_TITLE", {"BUILD": build, "VERSION": version}, strings, 600)
+        elif kind == "update":
+            data = _distribution(rng, "SU_TITLE", {}, strings, 200)
+        elif kind == "titled":
+            data = _distribution(rng, name, {"macOSProductBuildVersion": build, "macOSProductVersion": version}, strings, 600)
+        elif kind == "plist":
+            data = plistlib.dumps({"BUILD": build, "VERSION": version, "Padding": ["x" * 64] * 100})
+        else:
+            data = plistlib.dumps({"BUILD": build, "VERSION": version, "Padding": ["x" * 64] * 100}, fmt=plistlib.FMT_BINARY)
+
+        corpus.append((kind, data))
+    return corpus
+
+
+def load_corpus(directory: Path) -> list:
+    return [("corpus", path.read_bytes()) for path in sorted(Path(directory).rglob("*.dist"))]
+
+
+def measure(parser, corpus: list, repeats: int = 1) -> float:
+    """
+    Time parsing the corpus, best of the given repeats
+
+    Returns:
+        float: Seconds taken
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _, data in corpus:
+            try:
+                parser(data)
+            except AttributeError:
+                pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmark(corpus: list, repeats: int = 1) -> list:
+    """
+    Verify both parsers agree, then measure each per corpus kind
+
+    Returns:
+        list: Result per parser and kind, with microseconds per file
+    """
+    legacy_failures = 0
+    for kind, data in corpus:
+        try:
+            expected = parse_legacy(data)
+        except AttributeError:
+            legacy_failures += 1
+            continue
+        if parse_distribution(data) != expected:
+            raise Exception(f"Parsers disagree on a {kind} file: {parse_distribution(data)} != {expected}")
+    if legacy_failures:
+        print(f"  legacy raised on {legacy_failures} file(s), compared on the rest")
+
+    results = []
+    for kind in sorted(set(kind for kind, _ in corpus)):
+        files = [entry for entry in corpus if entry[0] == kind]
+        size  = sum(len(data) for _, data in files)
+        for name, parser in [("legacy", parse_legacy), ("single_pass", parse_distribution)]:
+            seconds = measure(parser, files, repeats)
+            results.append({
+                "Parser":        name,
+                "Kind":          kind,
+                "Files":         len(files),
+                "Seconds":       seconds,
+                "MicrosPerFile": seconds / len(files) * 1000 * 1000,
+                "MBps":          size / 1000 / 1000 / seconds,
+            })
+            print(f"  {kind:<16} {name:<12} {seconds / len(files) * 1000 * 1000:9.1f} us/file, {size / 1000 / 1000 / seconds:7.1f} MB/s")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark distribution file parsing')
+    parser.add_argument('--files',   type=int, help='Generated corpus size', default=200)
+    parser.add_argument('--corpus',  type=str, help='Directory of real .dist files to use instead', default=None)
+    parser.add_argument('--repeats', type=int, help='Passes over the corpus, the best is kept', default=5)
+    parser.add_argument('--history', type=str, help='JSON history file', default='distribution_benchmark_history.json')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.files)
+    if not corpus:
+        raise SystemExit(f"No .dist files found in {args.corpus}")
+
+    parameters = {
+        "Corpus": args.corpus or "generated",
+        "Files":  len(corpus),
+    }
+
+    history  = BenchmarkHistory(args.history)
+    previous = history.previous("distribution", parameters)
+
+    print(f"Parsing {len(corpus)} distribution file(s)")
+    results = run_benchmark(corpus, repeats=args.repeats)
+    history.record("distribution", parameters, results)
+
+    totals = {name: sum(result["Seconds"] for result in results if result["Parser"] == name) for name in ["legacy", "single_pass"]}
+    print(f"single_pass: {totals['legacy'] / totals['single_pass']:.2f}x faster than legacy overall")
+
+    for configuration, before, after in history.regressions(results, previous, ["Parser", "Kind"], "MicrosPerFile", higher_is_better=False):
+        print(f"  Regression: {configuration}: {before:.1f} -> {after:.1f} us/file")
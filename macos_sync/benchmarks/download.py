@@ -0,0 +1,203 @@
+"""
+download.py: Download write path benchmark
+
+Serves a generated file from a local http.server subprocess and measures how
+fast it is streamed to disk, comparing the previous iter_content loop (a new
+4 MiB bytes object per chunk, one write each) against PreallocatedWriter
+(preallocated file, reads coalesced into large writes). Client CPU time
+is reported alongside throughput, as on a small runner the write path
+competes with hashing and uploads for the same cores.
+
+Usage:
+    python3 -m macos_sync.benchmarks.download --size 2 --repeats 3
+"""
+
+import os
+import sys
+import time
+import socket
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+from pathlib import Path
+
+from .history import BenchmarkHistory
+from ..network.transport import TRANSPORT
+from ..network.writer import PreallocatedWriter, response_readinto, SYNC_POLICIES
+
+
+MiB = 1024 * 1024
+GB  = 1000 * 1000 * 1000
+
+METHODS = ["iter_content", "writer"]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise Exception(f"HTTP server on port {port} did not start")
+
+
+def download_iter_content(url: str, path: Path, digest=None, sync_policy: str = "none") -> int:
+    """
+    The download loop preceding PreallocatedWriter
+    """
+    response = TRANSPORT.session.get(url, stream=True, timeout=10)
+    written = 0
+    with open(path, "wb") as file:
+        for chunk in response.iter_content(4 * MiB):
+            file.write(chunk)
+            written += len(chunk)
+            if digest:
+                digest.update(chunk)
+        if sync_policy != "none":
+            file.flush()
+            os.fsync(file.fileno())
+    return written
+
+
+def download_writer(url: str, path: Path, digest=None, sync_policy: str = "none") -> int:
+    response = TRANSPORT.session.get(url, stream=True, timeout=10)
+    size = int(response.headers.get("Content-Length", 0)) or None
+    with response, PreallocatedWriter(path, size=size, sync_policy=sync_policy) as writer:
+        return writer.copy(response_readinto(response), on_data=digest.update if digest else None)
+
+
+DOWNLOADERS = {
+    "iter_content": download_iter_content,
+    "writer":       download_writer,
+}
+
+
+def measure(method: str, url: str, path: Path, size: int, hash_data: bool = False, sync_policy: str = "none", repeats: int = 1) -> dict:
+    """
+    Time full downloads, best of the given repeats
+
+    Returns:
+        dict: Seconds and CPUSeconds of the fastest download
+    """
+    best = None
+    for _ in range(repeats):
+        path.unlink(missing_ok=True)
+        digest = hashlib.sha256() if hash_data else None
+
+        start_cpu = time.process_time()
+        start     = time.perf_counter()
+        written   = DOWNLOADERS[method](url, path, digest, sync_policy)
+        elapsed   = time.perf_counter() - start
+        cpu       = time.process_time() - start_cpu
+
+        if written != size or path.stat().st_size != size:
+            raise Exception(f"{method} wrote {written} bytes, expected {size}")
+
+        if best is None or elapsed < best["Seconds"]:
+            best = {"Seconds": elapsed, "CPUSeconds": cpu}
+
+    path.unlink(missing_ok=True)
+    return best
+
+
+def run_benchmark(directory: Path,
+                  size: int = 1 * GB,
+                  methods: list = METHODS,
+                  hash_data: bool = False,
+                  sync_policy: str = "none",
+                  repeats: int = 1
+                 ) -> list:
+    """
+    Measure download throughput and client CPU time of each write path
+
+    Returns:
+        list: Result per method, with throughput in GB/s
+    """
+
+    directory = Path(directory)
+    served = directory / "download-benchmark-served"
+    served.mkdir(exist_ok=True)
+    source = served / "payload.bin"
+
+    print(f"Generating {size / GB:.1f} GB file")
+    block = os.urandom(8 * MiB)
+    with source.open("wb") as file:
+        for offset in range(0, size, len(block)):
+            file.write(block[:size - offset])
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1", "--directory", str(served)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    results = []
+    try:
+        _wait_for_server(port)
+        url = f"http://127.0.0.1:{port}/{source.name}"
+        for method in methods:
+            result = measure(method, url, directory / f"download-benchmark-{method}.bin", size, hash_data, sync_policy, repeats)
+            result.update({
+                "Method": method,
+                "GBps":   size / GB / result["Seconds"],
+            })
+            results.append(result)
+            print(f"  {method:<12} {result['GBps']:6.2f} GB/s, {result['CPUSeconds']:6.2f} CPU seconds")
+    finally:
+        server.terminate()
+        server.wait()
+        source.unlink()
+        served.rmdir()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the download write path')
+    parser.add_argument('--size',        type=float, help='Download size in GB', default=1)
+    parser.add_argument('--methods',     type=str,   help='Write paths to compare', nargs='+', choices=METHODS, default=METHODS)
+    parser.add_argument('--hash',        action='store_true', help='SHA-256 the data as it streams, as downloads with a cache or chunklist do')
+    parser.add_argument('--fsync',       type=str,   help='Sync policy', choices=SYNC_POLICIES, default='none')
+    parser.add_argument('--repeats',     type=int,   help='Downloads per method, the fastest is kept', default=1)
+    parser.add_argument('--directory',   type=str,   help='Where to create the test files, defaults to the system temporary directory', default=None)
+    parser.add_argument('--history',     type=str,   help='JSON history file', default='download_benchmark_history.json')
+    args = parser.parse_args()
+
+    parameters = {
+        "Size":    int(args.size * GB),
+        "Methods": args.methods,
+        "Hash":    args.hash,
+        "Sync":    args.fsync,
+    }
+
+    history  = BenchmarkHistory(args.history)
+    previous = history.previous("download", parameters)
+
+    results = run_benchmark(
+        directory=args.directory or tempfile.gettempdir(),
+        size=parameters["Size"],
+        methods=args.methods,
+        hash_data=args.hash,
+        sync_policy=args.fsync,
+        repeats=args.repeats,
+    )
+    history.record("download", parameters, results)
+
+    by_method = {result["Method"]: result for result in results}
+    if all(method in by_method for method in METHODS):
+        baseline, writer = by_method["iter_content"], by_method["writer"]
+        print(f"writer: {writer['GBps'] / baseline['GBps']:.2f}x throughput, {writer['CPUSeconds'] / baseline['CPUSeconds']:.2f}x CPU time of iter_content")
+
+    for configuration, before, after in history.regressions(results, previous, ["Method"], "GBps"):
+        print(f"  Regression: {configuration}: {before:.2f} -> {after:.2f} GB/s")
@@ -0,0 +1,117 @@
+"""
+history.py: JSON history of benchmark runs, for spotting regressions
+"""
+
+import os
+import json
+import time
+import socket
+import platform
+
+from pathlib import Path
+
+
+class BenchmarkHistory:
+    """
+    Append-only record of benchmark runs
+
+    Runs are compared against the latest earlier run of the same benchmark, on
+    the same host and with the same parameters, as results across runner types
+    aren't comparable.
+
+    Parameters:
+        path (Path): JSON file, created on first record
+
+    Usage:
+        >>> history = BenchmarkHistory("benchmark_history.json")
+        >>> previous = history.previous("integrity", parameters)
+        >>> history.record("integrity", parameters, results)
+        >>> for regression in history.regressions(results, previous, ["ChunkSize"], "GBps"):
+        ...     print(regression)
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path: Path = Path(path)
+
+
+    def load(self) -> list:
+        if not self.path.exists():
+            return []
+        try:
+            return json.loads(self.path.read_text())
+        except json.JSONDecodeError:
+            return []
+
+
+    def previous(self, benchmark: str, parameters: dict) -> dict:
+        """
+        Latest recorded run of a benchmark on this host with the same parameters
+        """
+        for run in reversed(self.load()):
+            if run["Benchmark"] == benchmark and run["Host"] == socket.gethostname() and run["Parameters"] == parameters:
+                return run
+        return None
+
+
+    def record(self, benchmark: str, parameters: dict, results: list) -> dict:
+        """
+        Append a run to the history
+
+        Returns:
+            dict: The recorded run
+        """
+        run = {
+            "Benchmark":  benchmark,
+            "Timestamp":  time.time(),
+            "Host":       socket.gethostname(),
+            "Platform":   platform.platform(),
+            "Machine":    platform.machine(),
+            "Python":     platform.python_version(),
+            "CPUs":       os.cpu_count(),
+            "Parameters": parameters,
+            "Results":    results,
+        }
+
+        runs = self.load()
+        runs.append(run)
+
+        temp_path = Path(f"{self.path}.tmp")
+        temp_path.write_text(json.dumps(runs, indent=4))
+        temp_path.replace(self.path)
+
+        return run
+
+
+    def regressions(self, results: list, previous: dict, keys: list, metric: str, tolerance: float = 0.1, higher_is_better: bool = True) -> list:
+        """
+        Results that got worse than the previous run by more than the tolerance
+
+        Parameters:
+            results          (list):  Results of the current run
+            previous         (dict):  Previous run, from previous()
+            keys             (list):  Fields identifying a configuration within a run
+            metric           (str):   Field to compare
+            tolerance        (float): Allowed relative change
+            higher_is_better (bool):  Whether the metric is a throughput (True) or a duration (False)
+
+        Returns:
+            list: (configuration, previous value, current value) tuples
+        """
+        if previous is None:
+            return []
+
+        baseline = {tuple(result[key] for key in keys): result[metric] for result in previous["Results"]}
+
+        regressions = []
+        for result in results:
+            configuration = tuple(result[key] for key in keys)
+            if configuration not in baseline or not baseline[configuration]:
+                continue
+
+            change = (result[metric] - baseline[configuration]) / baseline[configuration]
+            if not higher_is_better:
+                change = -change
+            if change < -tolerance:
+                regressions.append((dict(zip(keys, configuration)), baseline[configuration], result[metric]))
+
+        return regressions
@@ -0,0 +1,218 @@
+"""
+integrity.py: Integrity verification throughput benchmark
+
+Generates a large file with matching chunklists and measures how fast
+ChunklistVerification validates it across chunk sizes, worker counts and read
+strategies, to tell whether hashing or the disk limits a given runner.
+
+- sparse files read back as zeros without touching the disk, isolating hashing
+- random files are written out in full, and with --cold are evicted from the
+  page cache before each measurement, so disk reads are included
+
+Usage:
+    python3 -m macos_sync.benchmarks.integrity --size 4 --kind random --cold
+"""
+
+import os
+import time
+import hashlib
+import argparse
+import tempfile
+
+from pathlib import Path
+
+from .history import BenchmarkHistory
+from ..integrity_verification import ChunklistVerification, ChunklistWriter, ChunklistStatus, READ_STRATEGIES
+
+
+MiB = 1024 * 1024
+GB  = 1000 * 1000 * 1000
+
+
+def _sparse_chunklist(size: int, chunk_size: int) -> bytes:
+    """
+    Chunklist of an all-zero file, only the distinct chunk lengths need hashing
+    """
+    writer = ChunklistWriter(chunk_size)
+    full_chunk = hashlib.sha256(bytes(chunk_size)).digest()
+    writer.chunks = [(chunk_size, full_chunk)] * (size // chunk_size)
+    if size % chunk_size:
+        writer.chunks.append((size % chunk_size, hashlib.sha256(bytes(size % chunk_size)).digest()))
+    return writer.finalize()
+
+
+def generate_file(path: Path, size: int, kind: str, chunk_sizes: list) -> dict:
+    """
+    Create a test file and its chunklists
+
+    Parameters:
+        path        (Path): File to create
+        size        (int):  Size in bytes
+        kind        (str):  'sparse' or 'random'
+        chunk_sizes (list): Chunk sizes to generate chunklists for
+
+    Returns:
+        dict: Chunk size to chunklist path
+    """
+
+    path = Path(path)
+    writers = {chunk_size: ChunklistWriter(chunk_size) for chunk_size in chunk_sizes}
+
+    if kind == "sparse":
+        with path.open("wb") as file:
+            file.truncate(size)
+        chunklists = {chunk_size: _sparse_chunklist(size, chunk_size) for chunk_size in chunk_sizes}
+    elif kind == "random":
+        # A random block is repeated with a varying prefix, generating GBs of random data is slower than hashing it
+        block = bytearray(os.urandom(64 * MiB))
+        written = 0
+        with path.open("wb") as file:
+            while written < size:
+                block[:8] = written.to_bytes(8, "little")
+                data = memoryview(block)[:size - written]
+                file.write(data)
+                for writer in writers.values():
+                    writer.update(data)
+                written += len(data)
+            file.flush()
+            os.fsync(file.fileno())
+        chunklists = {chunk_size: writer.finalize() for chunk_size, writer in writers.items()}
+    else:
+        raise ValueError(f"Unknown file kind: {kind}")
+
+    paths = {}
+    for chunk_size, chunklist in chunklists.items():
+        paths[chunk_size] = Path(f"{path}.{chunk_size // MiB}MiB.chunklist")
+        paths[chunk_size].write_bytes(chunklist)
+
+    return paths
+
+
+def evict_from_cache(path: Path) -> bool:
+    """
+    Drop a file's pages from the page cache, where supported (Linux)
+
+    Returns:
+        bool: True if the file was evicted
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(descriptor)
+    return True
+
+
+def measure(path: Path, chunklist_path: Path, workers: int, read_strategy: str, cold: bool = False, repeats: int = 1) -> float:
+    """
+    Time a full verification, best of the given repeats
+
+    Returns:
+        float: Seconds taken
+    """
+    best = None
+    for _ in range(repeats):
+        if cold:
+            evict_from_cache(path)
+
+        chunk_obj = ChunklistVerification(path, chunklist_path, workers=workers, read_strategy=read_strategy)
+        start = time.perf_counter()
+        chunk_obj.validate()
+        chunk_obj.active_thread.join()
+        elapsed = time.perf_counter() - start
+
+        if chunk_obj.status != ChunklistStatus.SUCCESS:
+            raise Exception(f"Verification failed: {chunk_obj.error_msg}")
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def run_benchmark(directory: Path,
+                  size: int = 2 * GB,
+                  kind: str = "sparse",
+                  chunk_sizes: list = [1 * MiB, 10 * MiB, 32 * MiB],
+                  workers: list = [1, 2, 4],
+                  read_strategies: list = READ_STRATEGIES,
+                  cold: bool = False,
+                  repeats: int = 1
+                 ) -> list:
+    """
+    Measure verification throughput for every combination of settings
+
+    Returns:
+        list: Result per combination, with throughput in GB/s
+    """
+
+    path = Path(directory) / f"integrity-benchmark-{kind}.bin"
+    print(f"Generating {size / GB:.1f} GB {kind} file")
+    chunklists = generate_file(path, size, kind, chunk_sizes)
+
+    results = []
+    try:
+        for chunk_size in chunk_sizes:
+            for worker_count in workers:
+                for read_strategy in read_strategies:
+                    seconds = measure(path, chunklists[chunk_size], worker_count, read_strategy, cold, repeats)
+                    results.append({
+                        "ChunkSize": chunk_size,
+                        "Workers":   worker_count,
+                        "Strategy":  read_strategy,
+                        "Seconds":   seconds,
+                        "GBps":      size / GB / seconds,
+                    })
+                    print(f"  {chunk_size // MiB:4} MiB chunks, {worker_count:2} worker(s), {read_strategy:<8} {size / GB / seconds:6.2f} GB/s")
+    finally:
+        path.unlink()
+        for chunklist in chunklists.values():
+            chunklist.unlink()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark integrity verification throughput')
+    parser.add_argument('--size',        type=float, help='Test file size in GB', default=2)
+    parser.add_argument('--kind',        type=str,   help='Test file contents', choices=['sparse', 'random'], default='sparse')
+    parser.add_argument('--chunk_sizes', type=int,   help='Chunk sizes in MiB', nargs='+', default=[1, 10, 32])
+    parser.add_argument('--workers',     type=int,   help='Worker counts', nargs='+', default=[1, 2, 4])
+    parser.add_argument('--strategies',  type=str,   help='Read strategies', nargs='+', choices=READ_STRATEGIES, default=READ_STRATEGIES)
+    parser.add_argument('--cold',        action='store_true', help='Evict the file from the page cache before each measurement')
+    parser.add_argument('--repeats',     type=int,   help='Measurements per combination, the best is kept', default=1)
+    parser.add_argument('--directory',   type=str,   help='Where to create the test file, defaults to the system temporary directory', default=None)
+    parser.add_argument('--history',     type=str,   help='JSON history file', default='integrity_benchmark_history.json')
+    args = parser.parse_args()
+
+    parameters = {
+        "Size":       int(args.size * GB),
+        "Kind":       args.kind,
+        "ChunkSizes": [chunk_size * MiB for chunk_size in args.chunk_sizes],
+        "Workers":    args.workers,
+        "Strategies": args.strategies,
+        "Cold":       args.cold,
+    }
+
+    history  = BenchmarkHistory(args.history)
+    previous = history.previous("integrity", parameters)
+
+    results = run_benchmark(
+        directory=args.directory or tempfile.gettempdir(),
+        size=parameters["Size"],
+        kind=args.kind,
+        chunk_sizes=parameters["ChunkSizes"],
+        workers=args.workers,
+        read_strategies=args.strategies,
+        cold=args.cold,
+        repeats=args.repeats,
+    )
+    history.record("integrity", parameters, results)
+
+    best = max(results, key=lambda result: result["GBps"])
+    print(f"Best: {best['GBps']:.2f} GB/s with {best['ChunkSize'] // MiB} MiB chunks, {best['Workers']} worker(s), {best['Strategy']}")
+
+    for configuration, before, after in history.regressions(results, previous, ["ChunkSize", "Workers", "Strategy"], "GBps"):
+        print(f"  Regression: {configuration}: {before:.2f} -> {after:.2f} GB/s")
@@ -0,0 +1,172 @@
+"""
+failure_registry.py: Remember builds that failed to sync
+
+Builds that 404, serve an HTML page instead of the payload, fail verification
+or fail to upload are recorded with their failure class, and skipped until an
+exponentially growing backoff elapses. This avoids re-downloading gigabytes
+every run for an installer that is gated or broken upstream.
+
+Usage:
+    >>> registry = FailureRegistry("failure_registry.json")
+    >>> registry.seed(["23A5257q"])
+    >>> if not registry.is_backed_off(build, url):
+    ...     ...
+    >>> registry.record(build, url, FailureClass.NOT_FOUND, "404")
+    >>> registry.save()
+"""
+
+import json
+import time
+import logging
+import threading
+
+from enum import StrEnum
+from pathlib import Path
+
+
+class FailureClass(StrEnum):
+    NOT_FOUND       = "not_found"
+    HTML_PAYLOAD    = "html_payload"
+    INVALID_PAYLOAD = "invalid_payload"
+    HASH_MISMATCH   = "hash_mismatch"
+    DOWNLOAD_ERROR  = "download_error"
+    UPLOAD_ERROR    = "upload_error"
+    KNOWN_BAD       = "known_bad"
+
+
+# Initial delay before retrying, doubled per consecutive failure
+DEFAULT_BACKOFF = {
+    FailureClass.NOT_FOUND:       24 * 60 * 60,
+    FailureClass.HTML_PAYLOAD:    24 * 60 * 60,
+    FailureClass.INVALID_PAYLOAD: 24 * 60 * 60,
+    FailureClass.HASH_MISMATCH:   12 * 60 * 60,
+    FailureClass.DOWNLOAD_ERROR:  60 * 60,
+    FailureClass.UPLOAD_ERROR:    60 * 60,
+}
+
+
+class SyncFailure(Exception):
+    """
+    Sync error with a known failure class
+
+    Parameters:
+        failure_class (FailureClass): Kind of failure
+        message       (str):          Description
+    """
+
+    def __init__(self, failure_class: FailureClass, message: str) -> None:
+        super().__init__(message)
+        self.failure_class: FailureClass = failure_class
+
+
+class FailureRegistry:
+    """
+    Persisted failures keyed by build and URL
+
+    Parameters:
+        path      (Path):  JSON file, created on save
+        max_delay (float): Upper bound on the backoff, in seconds
+    """
+
+    def __init__(self, path: Path, max_delay: float = 30 * 24 * 60 * 60) -> None:
+        self.path:      Path  = Path(path)
+        self.max_delay: float = max_delay
+
+        self._entries: dict = {}
+        self._lock          = threading.Lock()
+
+        if self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text())
+            except json.JSONDecodeError:
+                logging.warning(f"Ignoring corrupt failure registry: {self.path}")
+
+
+    def _key(self, build: str, url: str = None, variant: str = None) -> str:
+        # Seeded entries have no URL and match every URL of the build within their variant
+        if variant:
+            return f"{build} [{variant}]"
+        return f"{build} {url}" if url else build
+
+
+    def seed(self, builds: list, variant: str, failure_class: FailureClass = FailureClass.KNOWN_BAD) -> None:
+        """
+        Permanently skip builds of a variant (ex. 'AppleDB IPSW'), regardless of URL
+        """
+        with self._lock:
+            for build in builds:
+                # Earlier registries seeded builds for every variant
+                if self._entries.get(self._key(build), {}).get("Error") == "Seeded":
+                    del self._entries[self._key(build)]
+
+                self._entries.setdefault(self._key(build, variant=variant), {
+                    "Build":       build,
+                    "URL":         None,
+                    "Variant":     variant,
+                    "Class":       failure_class,
+                    "Failures":    0,
+                    "LastFailure": None,
+                    "RetryAfter":  None,
+                    "Error":       "Seeded",
+                })
+
+
+    def record(self, build: str, url: str, failure_class: FailureClass, error: str) -> None:
+        """
+        Record a failure, pushing the next retry further out
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(self._key(build, url), {"Failures": 0})
+            failures = entry["Failures"] + 1 if entry.get("Class") == failure_class else 1
+            delay = min(DEFAULT_BACKOFF.get(failure_class, 60 * 60) * 2 ** (failures - 1), self.max_delay)
+
+            self._entries[self._key(build, url)] = {
+                "Build":       build,
+                "URL":         url,
+                "Class":       failure_class,
+                "Failures":    failures,
+                "LastFailure": now,
+                "RetryAfter":  now + delay,
+                "Error":       error,
+            }
+
+
+    def clear(self, build: str, url: str) -> None:
+        """
+        Forget failures of a build that has since synced
+        """
+        with self._lock:
+            self._entries.pop(self._key(build, url), None)
+
+
+    def lookup(self, build: str, url: str, variant: str = None) -> dict:
+        """
+        Failure entry currently preventing a retry, if any
+        """
+        keys = [self._key(build), self._key(build, url)]
+        if variant:
+            keys.append(self._key(build, variant=variant))
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry["RetryAfter"] is None or entry["RetryAfter"] > time.time():
+                    return entry
+        return None
+
+
+    def is_backed_off(self, build: str, url: str, variant: str = None) -> bool:
+        return self.lookup(build, url, variant) is not None
+
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps(self._entries, indent=4)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = Path(f"{self.path}.tmp")
+        temp_path.write_text(data)
+        temp_path.replace(self.path)
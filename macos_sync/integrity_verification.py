@@ -6,6 +6,7 @@ Based off of chunklist.py:
 """
 
 import enum
+import mmap
 import hashlib
 import logging
 import binascii
@@ -14,8 +15,16 @@ import threading
 from typing import Union
 from pathlib import Path
 
+from . import telemetry
+
 CHUNK_LENGTH = 4 + 32
 
+# How chunks are read from disk:
+# - read:     Buffered read per chunk, allocating a new bytes object each time
+# - readinto: Unbuffered reads into one preallocated buffer per worker
+# - mmap:     Hash slices of a memory mapping of the file, no copies
+READ_STRATEGIES = ["read", "readinto", "mmap"]
+
 
 class ChunklistStatus(enum.Enum):
     """
@@ -35,6 +44,8 @@ class ChunklistVerification:
     Parameters:
         file_path      (Path): Path to the file to validate
         chunklist_path (Path): Path to the chunklist file
+        workers        (int):  Threads hashing chunks concurrently (hashlib releases the GIL)
+        read_strategy  (str):  How chunks are read, see READ_STRATEGIES
 
     Usage:
         >>> chunk_obj = ChunklistVerification("InstallAssistant.pkg", "InstallAssistant.pkg.integrityDataV1")
@@ -46,13 +57,19 @@ class ChunklistVerification:
         ...     print(chunk_obj.error_msg)
     """
 
-    def __init__(self, file_path: Path, chunklist_path: Union[Path, bytes]) -> None:
+    def __init__(self, file_path: Path, chunklist_path: Union[Path, bytes], workers: int = 1, read_strategy: str = "read") -> None:
+        if read_strategy not in READ_STRATEGIES:
+            raise ValueError(f"Unknown read strategy: {read_strategy}")
+
         if isinstance(chunklist_path, bytes):
             self.chunklist_path: bytes = chunklist_path
         else:
             self.chunklist_path: Path = Path(chunklist_path)
         self.file_path:          Path = Path(file_path)
 
+        self.workers:       int = max(1, workers)
+        self.read_strategy: str = read_strategy
+
         self.chunks: dict = self._generate_chunks(self.chunklist_path)
 
         self.error_msg:     str = ""
@@ -61,6 +78,14 @@ class ChunklistVerification:
 
         self.status: ChunklistStatus = ChunklistStatus.IN_PROGRESS
 
+        self.active_thread: threading.Thread = None
+
+        self._span_parent: telemetry.Span = None
+
+        self._lock           = threading.Lock()
+        self._failed_chunk   = None
+        self._bytes_verified = 0
+
 
     def _generate_chunks(self, chunklist: Union[Path, bytes]) -> dict:
         """
@@ -93,11 +118,61 @@ class ChunklistVerification:
         return chunks
 
 
+    def chunk_ranges(self) -> list:
+        """
+        Byte ranges of each chunk within the file
+
+        Returns:
+            list: (offset, length) tuples, in chunklist order
+        """
+
+        if self.chunks is None:
+            return []
+
+        ranges = []
+        offset = 0
+        for chunk in self.chunks:
+            ranges.append((offset, chunk["length"]))
+            offset += chunk["length"]
+
+        return ranges
+
+
+    def verify_chunk(self, index: int, data: bytes) -> bool:
+        """
+        Validate a single chunk's data against the chunklist
+
+        Allows verifying chunks obtained out of order, ex. via HTTP Range requests
+
+        Parameters:
+            index (int):   Zero-based chunk index
+            data  (bytes): Contents of the chunk
+
+        Returns:
+            bool: True if the chunk matches its checksum, False otherwise
+        """
+
+        chunk = self.chunks[index]
+        if len(data) != chunk["length"]:
+            return False
+
+        return hashlib.sha256(data).digest() == chunk["checksum"]
+
+
     def _validate(self) -> None:
         """
         Validates provided file against chunklist
         """
 
+        with telemetry.span("chunklist_verification", parent=self._span_parent, file=self.file_path.name):
+            self._validate_chunks()
+
+
+    def _validate_chunks(self) -> None:
+        """
+        Validates provided file against chunklist, invoked by _validate()
+        """
+
         if self.chunks is None:
             self.status = ChunklistStatus.FAILURE
             return
@@ -114,21 +189,180 @@ class ChunklistVerification:
             logging.info(self.error_msg)
             return
 
-        with self.file_path.open("rb") as f:
-            for chunk in self.chunks:
-                self.current_chunk += 1
-                status = hashlib.sha256(f.read(chunk["length"])).digest()
-                if status != chunk["checksum"]:
-                    self.error_msg = f"Chunk {self.current_chunk} checksum status FAIL: chunk sum {binascii.hexlify(chunk['checksum']).decode()}, calculated sum {binascii.hexlify(status).decode()}"
-                    self.status = ChunklistStatus.FAILURE
-                    logging.info(self.error_msg)
-                    return
+        ranges = self.chunk_ranges()
+
+        # Contiguous slices per worker, keeping each worker's reads sequential
+        slice_length = -(-len(ranges) // self.workers) if ranges else 0
+        slices = [(start, min(start + slice_length, len(ranges))) for start in range(0, len(ranges), slice_length or 1)]
+
+        if len(slices) <= 1:
+            for start, end in slices:
+                self._verify_slice(ranges, start, end)
+        else:
+            threads = [threading.Thread(target=self._verify_slice, args=(ranges, start, end)) for start, end in slices]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        telemetry.count("bytes", self._bytes_verified)
+
+        if self._failed_chunk is not None:
+            index, checksum = self._failed_chunk
+            self.error_msg = f"Chunk {index + 1} checksum status FAIL: chunk sum {binascii.hexlify(self.chunks[index]['checksum']).decode()}, calculated sum {binascii.hexlify(checksum).decode()}"
+            self.status = ChunklistStatus.FAILURE
+            logging.info(self.error_msg)
+            return
 
         self.status = ChunklistStatus.SUCCESS
 
 
+    def _verify_slice(self, ranges: list, start: int, end: int) -> None:
+        """
+        Verify chunks [start, end), stopping early once any worker finds a bad chunk
+        """
+
+        with self.file_path.open("rb", buffering=0 if self.read_strategy == "readinto" else -1) as f:
+            file_size = self.file_path.stat().st_size
+
+            mapping = None
+            buffer  = None
+            if self.read_strategy == "mmap" and file_size:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                view    = memoryview(mapping)
+            elif self.read_strategy == "readinto":
+                buffer = memoryview(bytearray(max(length for _, length in ranges[start:end])))
+
+            try:
+                f.seek(ranges[start][0])
+                for index in range(start, end):
+                    if self._failed_chunk is not None and self._failed_chunk[0] < index:
+                        return
+
+                    offset, length = ranges[index]
+                    if mapping is not None:
+                        data = view[offset:offset + length]
+                    elif buffer is not None:
+                        read = 0
+                        while read < length:
+                            count = f.readinto(buffer[read:length])
+                            if not count:
+                                break
+                            read += count
+                        data = buffer[:read]
+                    else:
+                        data = f.read(length)
+
+                    checksum = hashlib.sha256(data).digest()
+                    read = len(data)
+                    # Views into the mapping must be released before it's closed
+                    del data
+
+                    with self._lock:
+                        self.current_chunk   += 1
+                        self._bytes_verified += read
+                        if checksum != self.chunks[index]["checksum"]:
+                            if self._failed_chunk is None or index < self._failed_chunk[0]:
+                                self._failed_chunk = (index, checksum)
+                            return
+            finally:
+                if mapping is not None:
+                    view.release()
+                    mapping.close()
+
+
     def validate(self) -> None:
         """
         Spawns _validate() thread
         """
-        threading.Thread(target=self._validate).start()
+        self._span_parent = telemetry.current()
+        self.active_thread = threading.Thread(target=self._validate)
+        self.active_thread.start()
+
+
+class ChunklistWriter:
+    """
+    Generate a chunklist for a file, in the same CNKL format Apple uses
+    Data can be fed incrementally, ex. while the file is being downloaded
+
+    Resulting chunklists are unsigned (sigMethod 0) and parse with ChunklistVerification
+
+    Parameters:
+        chunk_size (int): Length of each chunk, defaults to Apple's 10 MiB
+
+    Usage:
+        >>> writer = ChunklistWriter()
+        >>> for data in stream:
+        ...     writer.update(data)
+        >>> writer.write("UniversalMac.ipsw.chunklist")
+    """
+
+    HEADER_LENGTH: int = 36
+
+    def __init__(self, chunk_size: int = 10 * 1024 * 1024) -> None:
+        self.chunk_size: int = chunk_size
+        self.chunks:    list = []
+
+        self._hash      = hashlib.sha256()
+        self._remaining = chunk_size
+
+
+    def update(self, data: bytes) -> None:
+        """
+        Add data to the chunklist
+
+        Parameters:
+            data (bytes): Next portion of the file
+        """
+
+        view = memoryview(data)
+        while view:
+            portion = view[:self._remaining]
+            self._hash.update(portion)
+            self._remaining -= len(portion)
+            view = view[len(portion):]
+
+            if self._remaining == 0:
+                self.chunks.append((self.chunk_size, self._hash.digest()))
+                self._hash      = hashlib.sha256()
+                self._remaining = self.chunk_size
+
+
+    def finalize(self) -> bytes:
+        """
+        Close out the final chunk and build the chunklist
+
+        Returns:
+            bytes: Chunklist contents
+        """
+
+        if self._remaining != self.chunk_size:
+            self.chunks.append((self.chunk_size - self._remaining, self._hash.digest()))
+            self._hash      = hashlib.sha256()
+            self._remaining = self.chunk_size
+
+        chunk_offset = self.HEADER_LENGTH
+        sig_offset   = chunk_offset + len(self.chunks) * CHUNK_LENGTH
+
+        # Ref: https://github.com/apple-oss-distributions/xnu/blob/xnu-8020.101.4/bsd/kern/chunklist.h#L59-L69
+        header = b"".join([
+            b"CNKL",
+            self.HEADER_LENGTH.to_bytes(4, "little"),
+            bytes([1, 1, 0, 0]),  # fileVersion, chunkMethod (SHA-256), sigMethod (none), padding
+            len(self.chunks).to_bytes(8, "little"),
+            chunk_offset.to_bytes(8, "little"),
+            sig_offset.to_bytes(8, "little"),
+        ])
+
+        return header + b"".join(length.to_bytes(4, "little") + checksum for length, checksum in self.chunks)
+
+
+    def write(self, path: Path) -> None:
+        """
+        Finalize and write the chunklist to disk
+
+        Parameters:
+            path (Path): Destination of the chunklist
+        """
+
+        Path(path).write_bytes(self.finalize())
@@ -0,0 +1,211 @@
+"""
+mirror.py: Mirror every package listed in the Software Update Catalogs
+
+Packages are stored content-addressed, keyed by their catalog SHA-1 Digest
+(or URL when no digest is listed), so a payload referenced by many products
+and catalogs is downloaded once. Each download is verified against its digest
+as it streams.
+
+Downloads are split into two lanes by size: a few workers move the large
+payloads while the rest work through the long tail of small packages,
+smallest first, so small packages aren't stuck behind multi-GB transfers.
+"""
+
+import json
+import time
+import hashlib
+import concurrent.futures
+
+from pathlib import Path
+
+from . import telemetry
+from .network import DownloadObject, human_fmt
+
+
+class PackageMirror:
+    """
+    Content-addressed mirror of catalog packages
+
+    Parameters:
+        directory       (Path): Mirror root, objects are stored under 'objects' and indexed in 'manifest.json'
+        workers         (int):  Concurrent downloads of small packages
+        large_workers   (int):  Concurrent downloads of large packages
+        large_threshold (int):  Size in bytes from which a package is considered large
+
+    Usage:
+        >>> mirror = PackageMirror("/Volumes/Mirror")
+        >>> mirror.add_catalog(sucatalog.CatalogURL().url_contents, "SEQUOIA/PublicRelease")
+        >>> mirror.run()
+    """
+
+    def __init__(self, directory: Path, workers: int = 8, large_workers: int = 2, large_threshold: int = 256 * 1000 * 1000) -> None:
+        self.directory:       Path = Path(directory)
+        self.workers:         int  = workers
+        self.large_workers:   int  = large_workers
+        self.large_threshold: int  = large_threshold
+
+        self.objects:  dict = {}
+        self.products: dict = {}
+
+        # URL to digest, so packages listed without a digest in one catalog dedupe with those listing it
+        self._digests: dict = {}
+
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return f"url-{hashlib.sha256(url.encode()).hexdigest()}"
+
+
+    def object_path(self, key: str) -> Path:
+        """
+        Location of an object within the mirror
+        """
+        return self.directory / "objects" / key.removeprefix("url-")[:2] / key
+
+
+    def _add_object(self, url: str, size: int, digest: str, product: str) -> str:
+        if digest:
+            self._digests[url] = digest.lower()
+        digest = self._digests.get(url)
+        key = digest or self._url_key(url)
+
+        # A URL first seen without a digest is merged into the digest-keyed object once one is known
+        url_entry = self.objects.pop(self._url_key(url), None) if digest else None
+
+        entry = self.objects.setdefault(key, {
+            "URL":      url,
+            "Size":     size,
+            "Digest":   digest,
+            "Products": [],
+        })
+        for known_product in (url_entry["Products"] if url_entry else []) + [product]:
+            if known_product not in entry["Products"]:
+                entry["Products"].append(known_product)
+
+        if url_entry:
+            for _product in self.products.values():
+                _product["Packages"] = [key if package == self._url_key(url) else package for package in _product["Packages"]]
+
+        return key
+
+
+    def add_catalog(self, catalog: dict, name: str = None) -> None:
+        """
+        Add every package of a catalog to the mirror
+
+        Raw catalog entries are used rather than CatalogProducts, as mirroring
+        doesn't need the per-product metadata it would fetch.
+
+        Parameters:
+            catalog (dict): Parsed catalog
+            name    (str):  Catalog identifier recorded per product, ex. 'SEQUOIA/PublicRelease'
+        """
+        for product_id, entry in catalog.get("Products", {}).items():
+            product = self.products.setdefault(product_id, {
+                "PostDate": str(entry.get("PostDate")),
+                "Catalogs": [],
+                "Packages": [],
+            })
+            if name and name not in product["Catalogs"]:
+                product["Catalogs"].append(name)
+
+            for package in entry.get("Packages", []):
+                if "URL" not in package:
+                    continue
+                key = self._add_object(package["URL"], package.get("Size"), package.get("Digest"), product_id)
+                if key not in product["Packages"]:
+                    product["Packages"].append(key)
+
+                if "IntegrityDataURL" in package:
+                    key = self._add_object(package["IntegrityDataURL"], package.get("IntegrityDataSize"), None, product_id)
+                    if key not in product["Packages"]:
+                        product["Packages"].append(key)
+
+
+    def _download_object(self, key: str) -> int:
+        """
+        Download an object to a partial file, moved into place once its digest matches
+
+        Returns:
+            int: Bytes downloaded
+        """
+        entry = self.objects[key]
+        path = self.object_path(key)
+        partial_path = path.with_name(f"{path.name}.partial")
+
+        with telemetry.span("download", url=entry["URL"]):
+            download_obj = DownloadObject(entry["URL"], partial_path, expected_size=entry["Size"], expected_digest=entry["Digest"])
+            download_obj.download(spawn_thread=False)
+
+        if not download_obj.download_complete:
+            partial_path.unlink(missing_ok=True)
+            raise download_obj.failure or Exception(download_obj.error_msg)
+
+        partial_path.replace(path)
+        return int(download_obj.downloaded_file_size)
+
+
+    def _save_manifest(self) -> None:
+        manifest = {
+            "Objects":  {key: {**entry, "Path": str(self.object_path(key).relative_to(self.directory))} for key, entry in self.objects.items()},
+            "Products": self.products,
+        }
+        path = self.directory / "manifest.json"
+        temp_path = path.with_name(f"{path.name}.tmp")
+        temp_path.write_text(json.dumps(manifest, indent=4))
+        temp_path.replace(path)
+
+
+    def run(self) -> dict:
+        """
+        Download every object not yet mirrored
+
+        Returns:
+            dict: Counts of Objects, Downloaded, Skipped and Failed objects, and Bytes downloaded
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        pending = [key for key in self.objects if not self.object_path(key).exists()]
+        # Largest first in the large lane, smallest first in the small lane
+        large = sorted([key for key in pending if (self.objects[key]["Size"] or 0) >= self.large_threshold], key=lambda key: self.objects[key]["Size"], reverse=True)
+        small = sorted([key for key in pending if (self.objects[key]["Size"] or 0) < self.large_threshold], key=lambda key: self.objects[key]["Size"] or 0)
+
+        total_size = sum(self.objects[key]["Size"] or 0 for key in pending)
+        print(f"Mirroring {len(pending)} of {len(self.objects)} package(s) ({human_fmt(total_size)}), {len(large)} large")
+
+        summary = {
+            "Objects":    len(self.objects),
+            "Downloaded": 0,
+            "Skipped":    len(self.objects) - len(pending),
+            "Failed":     0,
+            "Bytes":      0,
+        }
+        start = time.time()
+
+        with telemetry.span("mirror", objects=len(pending)), \
+             concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mirror-small") as small_executor, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=self.large_workers, thread_name_prefix="mirror-large") as large_executor:
+
+            futures = {}
+            for key in small:
+                futures[small_executor.submit(self._download_object, key)] = key
+            for key in large:
+                futures[large_executor.submit(self._download_object, key)] = key
+
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    summary["Bytes"] += future.result()
+                    summary["Downloaded"] += 1
+                except Exception as e:
+                    summary["Failed"] += 1
+                    print(f"  Failed to mirror {self.objects[key]['URL']}: {e}")
+
+                done = summary["Downloaded"] + summary["Failed"]
+                if done % 100 == 0 or done == len(pending):
+                    print(f"  {done} of {len(pending)} package(s), {human_fmt(summary['Bytes'] / max(time.time() - start, 0.001))}/s")
+
+        self._save_manifest()
+
+        print(f"Mirrored {summary['Downloaded']} package(s) ({human_fmt(summary['Bytes'])}), {summary['Skipped']} already present, {summary['Failed']} failed")
+        return summary
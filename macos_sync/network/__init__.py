@@ -1,2 +1,7 @@
 from .download import DownloadObject, DownloadStatus
-from .utilities import NetworkUtilities, human_fmt, get_free_space
\ No newline at end of file
+from .utilities import NetworkUtilities, human_fmt, get_free_space
+from .upload import MultipartUpload
+from .cache import ArtifactCache
+from .transport import TRANSPORT, Transport
+from .preflight import PREFLIGHT, PreflightCache
+from .writer import PreallocatedWriter, SYNC_POLICIES
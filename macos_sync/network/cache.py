@@ -0,0 +1,311 @@
+"""
+cache.py: Local content-addressed cache of downloaded artifacts
+
+Artifacts are stored once by SHA-256, and found either by URL with the
+validators (ETag, Last-Modified, Content-Length) the server reported, or by a
+known content digest, such as a catalog's SHA-1 Digest. The same installer
+listed in several seed catalogs, or re-downloaded after a failed run, is then
+materialized from the cache instead of the network.
+
+Materialization prefers a reflink (copy-on-write clone), then a hardlink, then
+a plain copy. Cached artifacts are re-hashed before reuse, and the least
+recently used are evicted to stay within the size limit and free space floor.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import ctypes
+import sqlite3
+import hashlib
+import logging
+import threading
+import contextlib
+
+from pathlib import Path
+
+from .utilities import get_free_space, human_fmt
+
+
+# ioctl to clone a file's extents on Linux (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def reflink(source: Path, destination: Path) -> None:
+    """
+    Clone a file without copying its data, where the filesystem supports it
+
+    Raises:
+        OSError: Cloning isn't supported
+    """
+    if sys.platform == "darwin":
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(destination), 0) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return
+
+    import fcntl
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        try:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            destination_file.close()
+            Path(destination).unlink(missing_ok=True)
+            raise
+
+
+def materialize(source: Path, destination: Path) -> str:
+    """
+    Make a file available at another path, as cheaply as the filesystem allows
+
+    Returns:
+        str: 'reflink', 'hardlink' or 'copy'
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)
+
+    try:
+        reflink(source, destination)
+        return "reflink"
+    except (OSError, AttributeError):
+        pass
+
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError as e:
+        if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP]:
+            raise
+
+    shutil.copyfile(source, destination)
+    return "copy"
+
+
+class ArtifactCache:
+    """
+    Content-addressed artifact cache with LRU eviction
+
+    Parameters:
+        directory (Path): Cache root, objects are stored under 'objects' and indexed in 'index.sqlite'
+        max_size  (int):  Bytes the cache may hold, None for no limit
+        min_free  (int):  Free bytes to leave on the cache's disk, artifacts are evicted to keep it
+        verify    (bool): Re-hash artifacts before reuse, evicting any that changed
+
+    Usage:
+        >>> cache = ArtifactCache("/var/cache/macos_sync", max_size=100 * 1000 * 1000 * 1000)
+        >>> if not cache.fetch(url, validators, path):
+        ...     download(url, path)
+        ...     cache.store(path, url, validators)
+    """
+
+    def __init__(self, directory: Path, max_size: int = None, min_free: int = 0, verify: bool = True) -> None:
+        self.directory: Path = Path(directory)
+        self.max_size:  int  = max_size
+        self.min_free:  int  = min_free
+        self.verify:    bool = verify
+
+        self._lock = threading.Lock()
+
+        (self.directory / "objects").mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, size INTEGER, last_used REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT, validators TEXT, digest TEXT, PRIMARY KEY (url, validators))")
+            connection.execute("CREATE TABLE IF NOT EXISTS aliases (algorithm TEXT, value TEXT, digest TEXT, PRIMARY KEY (algorithm, value))")
+            connection.execute("CREATE INDEX IF NOT EXISTS objects_by_use ON objects (last_used)")
+
+
+    def _connect(self) -> contextlib.closing:
+        return contextlib.closing(sqlite3.connect(self.directory / "index.sqlite", timeout=60, isolation_level=None))
+
+
+    @staticmethod
+    def validators(headers: dict) -> str:
+        """
+        Validators identifying a URL's current contents, from its response headers
+
+        Returns:
+            str: Serialized validators, or None if the server reports neither ETag nor Last-Modified
+        """
+        if not any(header in headers for header in ["ETag", "Last-Modified"]):
+            return None
+        return json.dumps({header: headers.get(header) for header in ["ETag", "Last-Modified", "Content-Length"]}, sort_keys=True)
+
+
+    @staticmethod
+    def hash_file(path: Path, algorithm: str = "sha256") -> str:
+        digest = hashlib.new(algorithm)
+        with open(path, "rb") as file:
+            while chunk := file.read(4 * 1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+    def object_path(self, digest: str) -> Path:
+        return self.directory / "objects" / digest[:2] / digest
+
+
+    def size(self) -> int:
+        """
+        Bytes held by the cache
+        """
+        with self._connect() as connection:
+            return connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+
+    def lookup(self, url: str = None, validators: str = None, digests: dict = None) -> str:
+        """
+        Find a cached artifact by URL and validators, or by a content digest
+
+        Parameters:
+            url        (str):  URL the artifact was downloaded from
+            validators (str):  Validators from validators(), URL lookups are skipped without them
+            digests    (dict): Algorithm to hex digest, ex. {"sha1": "..."}
+
+        Returns:
+            str: SHA-256 of the cached artifact, or None
+        """
+        with self._connect() as connection:
+            if url and validators:
+                row = connection.execute("SELECT digest FROM urls WHERE url = ? AND validators = ?", (url, validators)).fetchone()
+                if row:
+                    return row[0]
+
+            for algorithm, value in (digests or {}).items():
+                if algorithm == "sha256":
+                    row = connection.execute("SELECT digest FROM objects WHERE digest = ?", (value.lower(),)).fetchone()
+                else:
+                    row = connection.execute("SELECT digest FROM aliases WHERE algorithm = ? AND value = ?", (algorithm, value.lower())).fetchone()
+                if row:
+                    return row[0]
+
+        return None
+
+
+    def fetch(self, url: str, validators: str, destination: Path, digests: dict = None) -> bool:
+        """
+        Materialize a cached artifact at destination
+
+        Returns:
+            bool: True on a cache hit, False if the artifact must be downloaded
+        """
+        digest = self.lookup(url, validators, digests)
+        if digest is None:
+            return False
+
+        path = self.object_path(digest)
+        if not path.exists():
+            self.discard(digest)
+            return False
+
+        if self.verify and self.hash_file(path) != digest:
+            logging.warning(f"Cached artifact {digest} is corrupt, discarding")
+            self.discard(digest)
+            return False
+
+        method = materialize(path, destination)
+        logging.info(f"Materialized {Path(destination).name} from cache ({method})")
+
+        with self._connect() as connection:
+            connection.execute("UPDATE objects SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            if url and validators:
+                connection.execute("INSERT OR REPLACE INTO urls (url, validators, digest) VALUES (?, ?, ?)", (url, validators, digest))
+
+        return True
+
+
+    def store(self, source: Path, url: str = None, validators: str = None, digest: str = None, aliases: dict = None) -> str:
+        """
+        Add a downloaded artifact to the cache
+
+        Parameters:
+            source     (Path): Downloaded file, linked into the cache where possible
+            url        (str):  URL it was downloaded from
+            validators (str):  Validators from validators()
+            digest     (str):  SHA-256 of the file if already known, saving a re-read
+            aliases    (dict): Other verified digests of the file, ex. {"sha1": "..."}
+
+        Returns:
+            str: SHA-256 of the artifact
+        """
+        digest = (digest or self.hash_file(source)).lower()
+        size   = Path(source).stat().st_size
+
+        with self._lock:
+            path = self.object_path(digest)
+            if not path.exists():
+                temp_path = path.with_name(f"{path.name}.tmp")
+                materialize(source, temp_path)
+                temp_path.replace(path)
+
+            with self._connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO objects (digest, size, last_used) VALUES (?, ?, ?)", (digest, size, time.time()))
+                if url and validators:
+                    connection.execute("INSERT OR REPLACE INTO urls (url, validators, digest) VALUES (?, ?, ?)", (url, validators, digest))
+                for algorithm, value in (aliases or {}).items():
+                    connection.execute("INSERT OR REPLACE INTO aliases (algorithm, value, digest) VALUES (?, ?, ?)", (algorithm, value.lower(), digest))
+
+        self.evict(keep=digest)
+        return digest
+
+
+    def discard(self, digest: str) -> None:
+        """
+        Remove an artifact and every reference to it
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            connection.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+            connection.execute("DELETE FROM aliases WHERE digest = ?", (digest,))
+            self.object_path(digest).unlink(missing_ok=True)
+
+
+    def discard_file(self, path: Path) -> None:
+        """
+        Remove the cached copy of a file, ex. one that failed verification
+        """
+        if Path(path).exists():
+            self.discard(self.hash_file(path))
+
+
+    def _needs_eviction(self, size: int) -> bool:
+        if self.max_size is not None and size > self.max_size:
+            return True
+        if self.min_free and get_free_space(self.directory) < self.min_free:
+            return True
+        return False
+
+
+    def evict(self, keep: str = None) -> int:
+        """
+        Evict least recently used artifacts until within max_size and min_free
+
+        Parameters:
+            keep (str): Digest never to evict, ex. the artifact just stored
+
+        Returns:
+            int: Bytes evicted
+        """
+        evicted = 0
+        with self._connect() as connection:
+            size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            if not self._needs_eviction(size):
+                return 0
+            candidates = connection.execute("SELECT digest, size FROM objects ORDER BY last_used").fetchall()
+
+        for digest, object_size in candidates:
+            if not self._needs_eviction(size):
+                break
+            if digest == keep:
+                continue
+            self.discard(digest)
+            size    -= object_size
+            evicted += object_size
+
+        if evicted:
+            logging.info(f"Evicted {human_fmt(evicted)} from artifact cache")
+        return evicted
@@ -8,13 +8,32 @@ import logging
 import enum
 import hashlib
 import atexit
+import contextlib
 
 from typing import Union
 from pathlib import Path
 
 from .utilities import NetworkUtilities, human_fmt, get_free_space
-
-SESSION = requests.Session()
+from .cache     import ArtifactCache
+from .preflight import PREFLIGHT
+from .writer    import PreallocatedWriter, response_readinto, read_head
+from .. import telemetry
+from ..integrity_verification import ChunklistWriter
+from ..failure_registry import SyncFailure, FailureClass
+
+# Leading bytes of known payloads, used to reject error pages as soon as a download starts
+PAYLOAD_MAGIC = {
+    ".pkg":             b"xar!",
+    ".ipsw":            b"PK",
+    ".integrityDataV1": b"CNKL",
+    ".chunklist":       b"CNKL",
+}
+
+# Hash algorithms of expected digests, by hex digest length
+DIGEST_ALGORITHMS = {
+    40: "sha1",
+    64: "sha256",
+}
 
 
 class DownloadStatus(enum.Enum):
@@ -46,7 +65,7 @@ class DownloadObject:
 
     """
 
-    def __init__(self, url: str, path: str) -> None:
+    def __init__(self, url: str, path: str, expected_size: int = None, expected_digest: str = None, cache: ArtifactCache = None, sync_policy: str = "none") -> None:
         self.url:       str = url
         self.status:    str = DownloadStatus.INACTIVE
         self.error_msg: str = ""
@@ -54,6 +73,27 @@ class DownloadObject:
 
         self.filepath:  Path = Path(path)
 
+        self.expected_size: int   = expected_size
+        self.magic:         bytes = PAYLOAD_MAGIC.get(Path(self.filename).suffix)
+        self.failure:       Exception = None
+
+        # Digest is verified as the payload streams, rather than re-reading it afterwards
+        self.expected_digest: str = expected_digest.lower() if expected_digest else None
+        self._digest:         hash = None
+        if self.expected_digest:
+            if len(self.expected_digest) not in DIGEST_ALGORITHMS:
+                raise ValueError(f"Unknown digest format: {expected_digest}")
+            self._digest = hashlib.new(DIGEST_ALGORITHMS[len(self.expected_digest)])
+
+        # Consulted before the network, downloads are hashed as they stream to be stored afterwards
+        self.cache:         ArtifactCache = cache
+        self.validators:    str  = None
+        self.from_cache:    bool = False
+        self._cache_digest: hash = hashlib.sha256() if cache else None
+
+        # When written data is forced to disk, see writer.SYNC_POLICIES
+        self.sync_policy: str = sync_policy
+
         self.total_file_size:      float = 0.0
         self.downloaded_file_size: float = 0.0
         self.start_time:           float = time.time()
@@ -61,7 +101,10 @@ class DownloadObject:
         self.error:             bool = False
         self.should_stop:       bool = False
         self.download_complete: bool = False
-        self.has_network:       bool = NetworkUtilities(self.url).verify_network_connection()
+        self.has_network:       bool = None
+
+        # Preflight HEAD probe, shared per URL across the run and taken when the download starts
+        self.probe: dict = None
 
         self.active_thread: threading.Thread = None
 
@@ -70,15 +113,17 @@ class DownloadObject:
         self.checksum = None
         self._checksum_storage: hash = None
 
-        if self.has_network:
-            self._populate_file_size()
+        self.chunklist_writer: ChunklistWriter = None
+        self.chunklist_path:   Path = None
+
+        self._span_parent: telemetry.Span = None
 
 
     def __del__(self) -> None:
         self.stop()
 
 
-    def download(self, display_progress: bool = False, spawn_thread: bool = True, verify_checksum: bool = False) -> None:
+    def download(self, display_progress: bool = False, spawn_thread: bool = True, verify_checksum: bool = False, generate_chunklist: bool = False) -> None:
         """
         Download the file
 
@@ -89,9 +134,15 @@ class DownloadObject:
             display_progress (bool): Display progress in console
             spawn_thread (bool): Spawn a thread to download the file, otherwise download in the current thread
             verify_checksum (bool): Calculate checksum of downloaded file if True
+            generate_chunklist (bool): Write a chunklist of the downloaded file to '<path>.chunklist' if True
 
         """
+        if generate_chunklist:
+            self.chunklist_writer = ChunklistWriter()
+            self.chunklist_path   = Path(f"{self.filepath}.chunklist")
+
         self.status = DownloadStatus.DOWNLOADING
+        self._span_parent = telemetry.current()
         logging.info(f"Starting download: {self.filename}")
         if spawn_thread:
             if self.active_thread:
@@ -141,23 +192,35 @@ class DownloadObject:
         return Path(self.url).name
 
 
-    def _populate_file_size(self) -> None:
+    def _preflight(self) -> None:
         """
-        Get the file size of the file to be downloaded
+        Populate network state, file size and cache validators from the URL's preflight probe
 
         If unable to get file size, set to zero
         """
 
-        try:
-            result = SESSION.head(self.url, allow_redirects=True, timeout=5)
-            if 'Content-Length' in result.headers:
-                self.total_file_size = float(result.headers['Content-Length'])
-            else:
-                raise Exception("Content-Length missing from headers")
-        except Exception as e:
-            logging.error(f"Error determining file size {self.url}: {str(e)}")
+        self.probe       = PREFLIGHT.probe(self.url)
+        self.has_network = self.probe["Error"] is None
+        if not self.has_network:
+            return
+
+        if self.probe["Status"] == 200:
+            self.validators = ArtifactCache.validators({
+                header: value
+                for header, value in {
+                    "ETag":           self.probe["ETag"],
+                    "Last-Modified":  self.probe["LastModified"],
+                    "Content-Length": str(self.probe["ContentLength"]) if self.probe["ContentLength"] is not None else None,
+                }.items()
+                if value is not None
+            })
+
+        if self.probe["ContentLength"] is None:
+            logging.error(f"Error determining file size {self.url}: Content-Length missing from headers")
             logging.error("Assuming file size is 0")
             self.total_file_size = 0.0
+        else:
+            self.total_file_size = float(self.probe["ContentLength"])
 
 
     def _update_checksum(self, chunk: bytes) -> None:
@@ -170,12 +233,39 @@ class DownloadObject:
         self._checksum_storage.update(chunk)
 
 
-    def _prepare_working_directory(self, path: Path) -> bool:
+    def _on_data(self, data: memoryview, display_progress: bool = False) -> None:
+        """
+        Observe a block of the payload before it is written, invoked by PreallocatedWriter.copy()
+
+        Parameters:
+            data             (memoryview): Block of the payload, only valid during the call
+            display_progress (bool):       Display progress in console
+        """
+        self.downloaded_file_size += len(data)
+        telemetry.count("bytes", len(data))
+        if self.should_checksum:
+            self._update_checksum(data)
+        if self.chunklist_writer:
+            self.chunklist_writer.update(data)
+        if self._digest:
+            self._digest.update(data)
+        if self._cache_digest:
+            self._cache_digest.update(data)
+        if display_progress:
+            # Don't use logging here, as we'll be spamming the log file
+            if self.total_file_size == 0.0:
+                print(f"Downloaded {human_fmt(self.downloaded_file_size)} of {self.filename}")
+            else:
+                print(f"Downloaded {self.get_percent():.2f}% of {self.filename} ({human_fmt(self.get_speed())}/s) ({self.get_time_remaining():.2f} seconds remaining)")
+
+
+    def _prepare_working_directory(self, path: Path, check_space: bool = True) -> bool:
         """
         Validates working enviroment, including free space and removing existing files
 
         Parameters:
-            path (str): Path to the file
+            path        (str):  Path to the file
+            check_space (bool): Whether to require free space for the full download
 
         Returns:
             bool: True if successful, False if not
@@ -191,11 +281,12 @@ class DownloadObject:
                 logging.info(f"Creating directory: {Path(path).parent}")
                 Path(path).parent.mkdir(parents=True, exist_ok=True)
 
-            available_space = get_free_space(Path(path).parent)
-            if self.total_file_size > available_space:
-                msg = f"Not enough free space to download {self.filename}, need {human_fmt(self.total_file_size)}, have {human_fmt(available_space)}"
-                logging.error(msg)
-                raise Exception(msg)
+            if check_space:
+                available_space = get_free_space(Path(path).parent)
+                if self.total_file_size > available_space:
+                    msg = f"Not enough free space to download {self.filename}, need {human_fmt(self.total_file_size)}, have {human_fmt(available_space)}"
+                    logging.error(msg)
+                    raise Exception(msg)
 
         except Exception as e:
             self.error = True
@@ -218,45 +309,191 @@ class DownloadObject:
             display_progress (bool): Display progress in console
         """
 
+        with telemetry.span("transfer", parent=self._span_parent, url=self.url):
+            self._download_stream(display_progress)
+
+        self.status = DownloadStatus.COMPLETE
+
+
+    def _download_stream(self, display_progress: bool = False) -> None:
+        """
+        Stream the file to disk, invoked by _download()
+
+        Parameters:
+            display_progress (bool): Display progress in console
+        """
+
         try:
+            self._preflight()
             if not self.has_network:
                 raise Exception("No network connection")
 
-            if self._prepare_working_directory(self.filepath) is False:
+            # Missing files, error pages and size mismatches are rejected before any GET
+            if self.probe["Status"] in [200, 404]:
+                self._validate_headers(self.probe["Status"], self.probe["ContentType"], self.probe["ContentLength"])
+
+            # Cache hits are reflinked or hardlinked, only a download needs the free space
+            if self._prepare_working_directory(self.filepath, check_space=not self.cache) is False:
                 raise Exception(self.error_msg)
 
-            response = NetworkUtilities().get(self.url, stream=True, timeout=10)
-
-            with open(self.filepath, 'wb') as file:
-                atexit.register(self.stop)
-                for i, chunk in enumerate(response.iter_content(1024 * 1024 * 4)):
-                    if self.should_stop:
-                        raise Exception("Download stopped")
-                    if chunk:
-                        file.write(chunk)
-                        self.downloaded_file_size += len(chunk)
-                        if self.should_checksum:
-                            self._update_checksum(chunk)
-                        if display_progress and i % 100:
-                            # Don't use logging here, as we'll be spamming the log file
-                            if self.total_file_size == 0.0:
-                                print(f"Downloaded {human_fmt(self.downloaded_file_size)} of {self.filename}")
-                            else:
-                                print(f"Downloaded {self.get_percent():.2f}% of {self.filename} ({human_fmt(self.get_speed())}/s) ({self.get_time_remaining():.2f} seconds remaining)")
-                self.download_complete = True
-                logging.info(f"Download complete: {self.filename}")
-                logging.info("Stats:")
-                logging.info(f"- Downloaded size: {human_fmt(self.downloaded_file_size)}")
-                logging.info(f"- Time elapsed: {(time.time() - self.start_time):.2f} seconds")
-                logging.info(f"- Speed: {human_fmt(self.downloaded_file_size / (time.time() - self.start_time))}/s")
-                logging.info(f"- Location: {self.filepath}")
+            if self.cache:
+                if self._download_from_cache():
+                    return
+                if self._prepare_working_directory(self.filepath) is False:
+                    raise Exception(self.error_msg)
+
+            # Skip the redirect chain the probe already followed
+            url = self.probe["URL"] if self.probe["Status"] == 200 else self.url
+            response = NetworkUtilities().get(url, stream=True, timeout=10)
+            self._validate_response(response)
+
+            # Inspect the first bytes before anything is written to disk
+            readinto = response_readinto(response)
+            head = read_head(readinto)
+            self._validate_payload(head, response)
+
+            atexit.register(self.stop)
+            writer = PreallocatedWriter(self.filepath, size=int(self.total_file_size) or self.expected_size, sync_policy=self.sync_policy)
+            with writer, contextlib.closing(response):
+                writer.copy(
+                    readinto,
+                    initial=head,
+                    on_data=lambda data: self._on_data(data, display_progress),
+                    should_stop=lambda: self.should_stop,
+                )
+            if self._digest and self._digest.hexdigest() != self.expected_digest:
+                raise SyncFailure(FailureClass.HASH_MISMATCH, f"{self.filename} digest is {self._digest.hexdigest()}, expected {self.expected_digest}")
+            if self.chunklist_writer:
+                self.chunklist_writer.write(self.chunklist_path)
+            self.download_complete = True
+            logging.info(f"Download complete: {self.filename}")
+            logging.info("Stats:")
+            logging.info(f"- Downloaded size: {human_fmt(self.downloaded_file_size)}")
+            logging.info(f"- Time elapsed: {(time.time() - self.start_time):.2f} seconds")
+            logging.info(f"- Speed: {human_fmt(self.downloaded_file_size / (time.time() - self.start_time))}/s")
+            logging.info(f"- Location: {self.filepath}")
+            self._store_in_cache()
         except Exception as e:
             self.error = True
             self.error_msg = str(e)
+            self.failure = e
             self.status = DownloadStatus.ERROR
             logging.error(f"Error downloading {self.url}: {self.error_msg}")
 
-        self.status = DownloadStatus.COMPLETE
+
+    def _download_from_cache(self) -> bool:
+        """
+        Materialize the file from the artifact cache, invoked by _download_stream()
+
+        Returns:
+            bool: True if the file was served from the cache
+        """
+        digests = {DIGEST_ALGORITHMS[len(self.expected_digest)]: self.expected_digest} if self.expected_digest else None
+        try:
+            if not self.cache.fetch(self.url, self.validators, self.filepath, digests):
+                return False
+        except Exception as e:
+            logging.error(f"Error reading {self.filename} from cache: {str(e)}")
+            return False
+
+        # Chunklists and expected digests are still produced from the cached copy
+        if self.chunklist_writer or self._digest:
+            with open(self.filepath, "rb") as file:
+                while chunk := file.read(1024 * 1024 * 4):
+                    if self._digest:
+                        self._digest.update(chunk)
+                    if self.chunklist_writer:
+                        self.chunklist_writer.update(chunk)
+            if self._digest and self._digest.hexdigest() != self.expected_digest:
+                logging.error(f"Cached {self.filename} doesn't match {self.expected_digest}, downloading")
+                self.cache.discard_file(self.filepath)
+                self.filepath.unlink()
+                self._digest = hashlib.new(self._digest.name)
+                self.chunklist_writer = ChunklistWriter() if self.chunklist_writer else None
+                return False
+            if self.chunklist_writer:
+                self.chunklist_writer.write(self.chunklist_path)
+
+        self.from_cache = True
+        self.downloaded_file_size = self.filepath.stat().st_size
+        self.download_complete = True
+        telemetry.count("cache_hits")
+        logging.info(f"Download complete: {self.filename} (cached)")
+        return True
+
+
+    def _store_in_cache(self) -> None:
+        """
+        Add a completed download to the artifact cache, failures only cost a future download
+        """
+        if not self.cache or not self.download_complete:
+            return
+
+        try:
+            self.cache.store(
+                self.filepath,
+                url=self.url,
+                validators=self.validators,
+                digest=self._cache_digest.hexdigest(),
+                aliases={self._digest.name: self.expected_digest} if self._digest else None,
+            )
+        except Exception as e:
+            logging.error(f"Error storing {self.filename} in cache: {str(e)}")
+
+
+    def _validate_response(self, response: requests.Response) -> None:
+        """
+        Reject responses that can't be the expected payload, based on headers alone
+
+        Raises:
+            SyncFailure: Response is an error, an HTML page, or of unexpected size
+        """
+
+        content_length = response.headers.get("Content-Length")
+        try:
+            self._validate_headers(response.status_code, response.headers.get("Content-Type"), int(content_length) if content_length else None)
+        except SyncFailure:
+            # Empty Responses from network errors have no body to close
+            if response.raw is not None:
+                response.close()
+            raise
+
+
+    def _validate_headers(self, status: int, content_type: str, content_length: int) -> None:
+        """
+        Shared by the preflight probe and the download response
+
+        Raises:
+            SyncFailure: Status is an error, content is an HTML page, or of unexpected size
+        """
+
+        if status == 404:
+            raise SyncFailure(FailureClass.NOT_FOUND, f"{self.url} is a 404")
+        if status != 200:
+            raise SyncFailure(FailureClass.DOWNLOAD_ERROR, f"{self.url} returned {status}")
+
+        if (content_type or "").startswith("text/html") and not self.filename.endswith("html"):
+            raise SyncFailure(FailureClass.HTML_PAYLOAD, f"{self.url} returned an HTML page")
+
+        if self.expected_size and content_length is not None and content_length != self.expected_size:
+            raise SyncFailure(FailureClass.INVALID_PAYLOAD, f"{self.url} is {content_length} bytes, expected {self.expected_size}")
+
+
+    def _validate_payload(self, first_chunk: bytes, response: requests.Response) -> None:
+        """
+        Reject payloads whose leading bytes don't match the file type
+
+        Raises:
+            SyncFailure: Payload is an HTML page or not of the expected type
+        """
+
+        if self.magic is None or not first_chunk or first_chunk.startswith(self.magic):
+            return
+
+        response.close()
+        if first_chunk.lstrip()[:15].lower().startswith((b"<!doctype html", b"<html")):
+            raise SyncFailure(FailureClass.HTML_PAYLOAD, f"{self.url} returned an HTML page")
+        raise SyncFailure(FailureClass.INVALID_PAYLOAD, f"{self.url} does not start with {self.magic}")
 
 
     def get_percent(self) -> float:
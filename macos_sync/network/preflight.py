@@ -0,0 +1,115 @@
+"""
+preflight.py: One HEAD probe per URL, shared by everything that needs one
+
+Link validation, file size, cache validators and early payload checks all
+read the same probe, rather than each issuing its own HEAD request (with its
+own redirect chain and TLS handshake) before a download.
+"""
+
+import time
+import logging
+import threading
+
+import requests
+
+from .transport import TRANSPORT
+
+
+class PreflightCache:
+    """
+    Per-URL cache of HEAD probes
+
+    Parameters:
+        max_age (float): Seconds a probe stays valid, None to keep it for the whole run
+
+    Usage:
+        >>> probe = PREFLIGHT.probe(url)
+        >>> if probe["Status"] == 404:
+        ...     print("Not found")
+        >>> print(probe["ContentLength"], probe["URL"])
+    """
+
+    def __init__(self, max_age: float = None) -> None:
+        self.max_age: float = max_age
+
+        self._lock   = threading.Lock()
+        self._probes = {}
+        self._locks  = {}
+
+
+    @staticmethod
+    def _head(url: str) -> dict:
+        probe = {
+            "Status":        None,
+            "URL":           url,
+            "ContentLength": None,
+            "ContentType":   None,
+            "AcceptRanges":  False,
+            "ETag":          None,
+            "LastModified":  None,
+            "Error":         None,
+            "Time":          time.time(),
+        }
+
+        try:
+            response = TRANSPORT.session.head(url, timeout=5, allow_redirects=True)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error probing {url}: {str(e)}")
+            probe["Error"] = str(e)
+            return probe
+
+        content_length = response.headers.get("Content-Length")
+        probe.update({
+            "Status":        response.status_code,
+            "URL":           response.url,
+            "ContentLength": int(content_length) if content_length and content_length.isdigit() else None,
+            "ContentType":   response.headers.get("Content-Type"),
+            "AcceptRanges":  response.headers.get("Accept-Ranges", "").lower() == "bytes",
+            "ETag":          response.headers.get("ETag"),
+            "LastModified":  response.headers.get("Last-Modified"),
+        })
+        return probe
+
+
+    def probe(self, url: str, refresh: bool = False) -> dict:
+        """
+        Probe a URL, or return its earlier probe
+
+        Concurrent callers for the same URL wait on a single request.
+
+        Parameters:
+            url     (str):  URL to probe
+            refresh (bool): Ignore any cached probe
+
+        Returns:
+            dict: Status (None if unreachable), final URL after redirects, ContentLength,
+                  ContentType, AcceptRanges, ETag, LastModified, Error and Time of the probe
+        """
+        with self._lock:
+            url_lock = self._locks.setdefault(url, threading.Lock())
+
+        with url_lock:
+            with self._lock:
+                probe = self._probes.get(url)
+            if probe and not refresh and (self.max_age is None or time.time() - probe["Time"] < self.max_age):
+                return probe
+
+            probe = self._head(url)
+            # Unreachable hosts are retried on the next probe, rather than failing the rest of the run
+            if probe["Error"] is None:
+                with self._lock:
+                    self._probes[url] = probe
+            return probe
+
+
+    def forget(self, url: str) -> None:
+        with self._lock:
+            self._probes.pop(url, None)
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._probes.clear()
+
+
+PREFLIGHT = PreflightCache()
@@ -0,0 +1,240 @@
+"""
+transport.py: Shared HTTP transport for every network request
+
+A single requests.Session whose adapters are tuned for the sync's access
+pattern: many small metadata fetches against a handful of hosts, alongside a
+few long transfers.
+
+- Connection pools sized per host, so concurrent fetches reuse warm connections
+- TCP keep-alive on every socket, so idle pooled connections survive NAT timeouts
+- DNS results cached for dns_ttl seconds, new connections skip the resolver
+  and try each cached address in turn
+- Default (connect, read) timeouts for requests that don't pass their own
+- Counters for requests, new connections and DNS lookups, see stats()
+"""
+
+import time
+import socket
+import logging
+import threading
+
+import requests
+import urllib3
+
+from urllib3.util import connection
+from urllib3.exceptions import NameResolutionError, ConnectTimeoutError, NewConnectionError
+
+
+def _keepalive_socket_options() -> list:
+    options = list(urllib3.connection.HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    # Probe idle connections after 60 seconds, where the platform allows tuning it
+    for name, value in [("TCP_KEEPIDLE", 60), ("TCP_KEEPALIVE", 60), ("TCP_KEEPINTVL", 15), ("TCP_KEEPCNT", 4)]:
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+SOCKET_OPTIONS = _keepalive_socket_options()
+
+
+class _TransportConnection:
+    """
+    Mixin for urllib3 connections, resolving through the transport's DNS cache
+    """
+
+    transport: "Transport" = None
+
+    def _new_conn(self) -> socket.socket:
+        self.transport._count("NewConnections")
+        addresses = self.transport.resolve(self._dns_host, self.port)
+
+        # Try every address in turn, as create_connection() would after its own lookup
+        error = None
+        for address in addresses:
+            try:
+                sock = connection.create_connection(
+                    (address, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+            except OSError as e:
+                error = e
+                continue
+
+            if address != addresses[0]:
+                self.transport.prefer(self._dns_host, self.port, address)
+            return sock
+
+        # Every cached address may be stale, resolve again on the next attempt
+        self.transport.forget(self._dns_host)
+        if isinstance(error, socket.timeout):
+            raise ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})") from error
+        raise NewConnectionError(self, f"Failed to establish a new connection: {error}") from error
+
+
+class _TransportAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter applying the transport's connection classes, socket options and timeouts
+    """
+
+    def __init__(self, transport: "Transport", **kwargs) -> None:
+        self._transport = transport
+        super().__init__(**kwargs)
+
+
+    def init_poolmanager(self, connections: int, maxsize: int, block: bool = False, **pool_kwargs) -> None:
+        pool_kwargs["socket_options"] = SOCKET_OPTIONS
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = self._transport._pool_classes
+
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self._transport.timeout
+        self._transport._count("Requests")
+        return super().send(request, **kwargs)
+
+
+class Transport:
+    """
+    Shared, tuned HTTP session
+
+    Parameters:
+        pool_maxsize    (int):   Pooled connections per host
+        host_pool_sizes (dict):  Hostname to pool size, overriding pool_maxsize
+        timeout         (tuple): Default (connect, read) timeout in seconds
+        dns_ttl         (float): Seconds to cache DNS results
+
+    Usage:
+        >>> from macos_sync.network.transport import TRANSPORT
+        >>> TRANSPORT.configure(pool_maxsize=32, timeout=(5, 120))
+        >>> response = TRANSPORT.session.get(url)
+        >>> TRANSPORT.stats()
+        {'Requests': 42, 'NewConnections': 3, 'ReusedConnections': 39, ...}
+    """
+
+    def __init__(self,
+                 pool_maxsize: int = 16,
+                 host_pool_sizes: dict = None,
+                 timeout: tuple = (10, 60),
+                 dns_ttl: float = 300
+                ) -> None:
+        self.pool_maxsize:    int   = pool_maxsize
+        self.host_pool_sizes: dict  = host_pool_sizes or {}
+        self.timeout:         tuple = timeout
+        self.dns_ttl:         float = dns_ttl
+
+        self._lock     = threading.Lock()
+        self._dns      = {}
+        self._counters = {"Requests": 0, "NewConnections": 0, "DNSLookups": 0, "DNSCacheHits": 0}
+
+        http_connection  = type("TransportHTTPConnection",  (_TransportConnection, urllib3.connection.HTTPConnection),  {"transport": self})
+        https_connection = type("TransportHTTPSConnection", (_TransportConnection, urllib3.connection.HTTPSConnection), {"transport": self})
+        self._pool_classes = {
+            "http":  type("TransportHTTPConnectionPool",  (urllib3.HTTPConnectionPool,),  {"ConnectionCls": http_connection}),
+            "https": type("TransportHTTPSConnectionPool", (urllib3.HTTPSConnectionPool,), {"ConnectionCls": https_connection}),
+        }
+
+        self.session: requests.Session = requests.Session()
+        self._mount()
+
+
+    def _mount(self) -> None:
+        for scheme in ["http://", "https://"]:
+            self.session.mount(scheme, _TransportAdapter(self, pool_connections=16, pool_maxsize=self.pool_maxsize))
+            for host, size in self.host_pool_sizes.items():
+                self.session.mount(f"{scheme}{host}", _TransportAdapter(self, pool_connections=1, pool_maxsize=size))
+
+
+    def configure(self, pool_maxsize: int = None, host_pool_sizes: dict = None, timeout: tuple = None, dns_ttl: float = None) -> None:
+        """
+        Change settings, pools are rebuilt so existing connections are dropped
+        """
+        if pool_maxsize is not None:
+            self.pool_maxsize = pool_maxsize
+        if host_pool_sizes is not None:
+            self.host_pool_sizes = host_pool_sizes
+        if timeout is not None:
+            self.timeout = timeout
+        if dns_ttl is not None:
+            self.dns_ttl = dns_ttl
+
+        for adapter in self.session.adapters.values():
+            adapter.close()
+        self.session.adapters.clear()
+        self._mount()
+
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+
+    def resolve(self, host: str, port: int) -> list:
+        """
+        Resolve a hostname to its addresses, cached for dns_ttl seconds
+
+        Returns:
+            list: Addresses in resolver order, or just the hostname if resolving failed
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._dns.get((host, port))
+            if cached and cached[0] > now:
+                self._counters["DNSCacheHits"] += 1
+                return list(cached[1])
+
+        try:
+            results = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            # Let urllib3 report the failure with its usual error
+            return [host]
+
+        addresses = list(dict.fromkeys(result[4][0] for result in results))
+        with self._lock:
+            self._counters["DNSLookups"] += 1
+            self._dns[(host, port)] = (now + self.dns_ttl, addresses)
+
+        logging.debug(f"Resolved {host} to {', '.join(addresses)}")
+        return list(addresses)
+
+
+    def prefer(self, host: str, port: int, address: str) -> None:
+        """
+        Move an address that accepted a connection ahead of the host's other cached addresses
+        """
+        with self._lock:
+            cached = self._dns.get((host, port))
+            if cached and address in cached[1]:
+                self._dns[(host, port)] = (cached[0], [address] + [other for other in cached[1] if other != address])
+
+
+    def forget(self, host: str) -> None:
+        """
+        Drop cached addresses of a host
+        """
+        with self._lock:
+            for key in [key for key in self._dns if key[0] == host]:
+                del self._dns[key]
+
+
+    def stats(self) -> dict:
+        """
+        Request and connection counters since start
+
+        Returns:
+            dict: Requests, NewConnections, ReusedConnections, ReuseRatio, DNSLookups and DNSCacheHits
+        """
+        with self._lock:
+            counters = dict(self._counters)
+
+        counters["ReusedConnections"] = max(counters["Requests"] - counters["NewConnections"], 0)
+        counters["ReuseRatio"] = counters["ReusedConnections"] / counters["Requests"] if counters["Requests"] else 0.0
+        return counters
+
+
+TRANSPORT = Transport()
@@ -0,0 +1,344 @@
+"""
+upload.py: Multipart uploads to archive.org's S3-compatible API (IA-S3)
+
+- Ref: https://archive.org/developers/ias3.html
+"""
+
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+import urllib.parse
+import concurrent.futures
+
+import xml.etree.ElementTree as ET
+
+from pathlib import Path
+
+from .utilities import NetworkUtilities, human_fmt
+from .. import telemetry
+
+
+class MultipartUpload:
+    """
+    Upload a file to an archive.org item using S3 multipart uploads
+
+    Parts are uploaded in parallel and retried individually. Progress is recorded
+    in '<path>.upload.json', so an interrupted upload resumes from the parts the
+    server already holds instead of starting over.
+
+    Parameters:
+        identifier (str):  archive.org item identifier (bucket)
+        path       (Path): File to upload
+        access_key (str):  IA-S3 access key
+        secret_key (str):  IA-S3 secret key
+        metadata   (dict): Item metadata, used if the upload creates the item
+        endpoint   (str):  IA-S3 endpoint, override to point at a local stand-in
+        part_size  (int):  Size of each part in bytes
+        workers    (int):  Number of parts to upload concurrently
+        retries    (int):  Attempts per part before giving up
+
+    Usage:
+        >>> upload_obj = MultipartUpload("macOS-22G720-InstallAssistant", "InstallAssistant.pkg", access_key, secret_key, metadata)
+        >>> if not upload_obj.upload():
+        ...     print(upload_obj.error_msg)
+    """
+
+    def __init__(self,
+                 identifier: str,
+                 path: Path,
+                 access_key: str,
+                 secret_key: str,
+                 metadata: dict = None,
+                 endpoint: str = "https://s3.us.archive.org",
+                 part_size: int = 128 * 1024 * 1024,
+                 workers: int = 4,
+                 retries: int = 5
+                ) -> None:
+        self.identifier: str  = identifier
+        self.path:       Path = Path(path)
+        self.metadata:   dict = metadata or {}
+        self.endpoint:   str  = endpoint.rstrip("/")
+        self.part_size:  int  = part_size
+        self.workers:    int  = workers
+        self.retries:    int  = retries
+
+        self._access_key: str = access_key
+        self._secret_key: str = secret_key
+
+        self.url:        str  = f"{self.endpoint}/{identifier}/{urllib.parse.quote(self.path.name)}"
+        self.state_path: Path = Path(f"{self.path}.upload.json")
+
+        self.error_msg:      str = ""
+        self.uploaded_parts: int = 0
+        self.total_parts:    int = 0
+        self.uploaded_size:  int = 0
+
+        # Parts report progress from the upload threads
+        self._progress_lock = threading.Lock()
+
+
+    def _headers(self, include_metadata: bool = False) -> dict:
+        """
+        Build IA-S3 request headers
+        """
+        headers = {
+            "authorization": f"LOW {self._access_key}:{self._secret_key}",
+        }
+
+        if include_metadata:
+            headers["x-archive-auto-make-bucket"] = "1"
+            headers["x-archive-size-hint"]        = str(self.path.stat().st_size)
+            for key, value in self.metadata.items():
+                value = str(value)
+                # Header values can't carry newlines or non-ASCII text, IA accepts them URI encoded
+                if not value.isascii() or "\n" in value:
+                    value = f"uri({urllib.parse.quote(value)})"
+                headers[f"x-archive-meta-{key}"] = value
+
+        return headers
+
+
+    def _find(self, element: ET.Element, tag: str) -> list:
+        """
+        Find child elements by tag, ignoring the S3 XML namespace
+        """
+        return [child for child in element.iter() if child.tag.split("}")[-1] == tag]
+
+
+    def _load_state(self) -> dict:
+        """
+        Load state of a previously interrupted upload, if it matches this file
+        """
+        if not self.state_path.exists():
+            return None
+
+        try:
+            state = json.loads(self.state_path.read_text())
+        except json.JSONDecodeError:
+            return None
+
+        if state.get("URL") != self.url:
+            return None
+        if state.get("Size") != self.path.stat().st_size:
+            return None
+        if state.get("PartSize") != self.part_size:
+            return None
+
+        return state
+
+
+    def _save_state(self, upload_id: str) -> None:
+        self.state_path.write_text(json.dumps({
+            "URL":      self.url,
+            "UploadId": upload_id,
+            "Size":     self.path.stat().st_size,
+            "PartSize": self.part_size,
+        }))
+
+
+    def _initiate(self) -> str:
+        """
+        Start a new multipart upload
+
+        Returns:
+            str: Upload ID
+        """
+        response = NetworkUtilities().post(f"{self.url}?uploads", headers=self._headers(include_metadata=True), timeout=60)
+        if response.status_code != 200:
+            raise Exception(f"Failed to initiate multipart upload: {response.status_code} {response.text}")
+
+        return self._find(ET.fromstring(response.content), "UploadId")[0].text
+
+
+    def _list_parts(self, upload_id: str) -> dict:
+        """
+        List parts the server already holds for an upload
+
+        Returns:
+            dict: Part number to ETag, or None if the upload no longer exists
+        """
+        parts  = {}
+        marker = 0
+        while True:
+            response = NetworkUtilities().get(
+                self.url,
+                params={"uploadId": upload_id, "part-number-marker": marker},
+                headers=self._headers(),
+                timeout=60
+            )
+            if response.status_code != 200:
+                return None
+
+            root = ET.fromstring(response.content)
+            for part in self._find(root, "Part"):
+                number = int(self._find(part, "PartNumber")[0].text)
+                size   = int(self._find(part, "Size")[0].text)
+                if size != self._part_length(number):
+                    # Partially written part, re-upload it
+                    continue
+                parts[number] = self._find(part, "ETag")[0].text
+
+            truncated = self._find(root, "IsTruncated")
+            if not truncated or truncated[0].text != "true":
+                break
+            marker = int(self._find(root, "NextPartNumberMarker")[0].text)
+
+        return parts
+
+
+    def _part_length(self, number: int) -> int:
+        offset = (number - 1) * self.part_size
+        return min(self.part_size, self.path.stat().st_size - offset)
+
+
+    def _upload_part(self, upload_id: str, number: int, parent: telemetry.Span = None) -> str:
+        """
+        Upload a single part, retrying with exponential backoff
+
+        Returns:
+            str: ETag of the uploaded part
+        """
+        with telemetry.span("upload_part", parent=parent, part=number):
+            return self._upload_part_data(upload_id, number)
+
+
+    def _upload_part_data(self, upload_id: str, number: int) -> str:
+        with self.path.open("rb") as file:
+            file.seek((number - 1) * self.part_size)
+            data = file.read(self.part_size)
+
+        headers = self._headers()
+        headers["Content-MD5"] = base64.b64encode(hashlib.md5(data).digest()).decode()
+
+        for attempt in range(self.retries):
+            response = NetworkUtilities().put(
+                self.url,
+                params={"partNumber": number, "uploadId": upload_id},
+                data=data,
+                headers=headers,
+                timeout=300
+            )
+            if response.status_code == 200:
+                with self._progress_lock:
+                    self.uploaded_parts += 1
+                    self.uploaded_size  += len(data)
+                telemetry.count("bytes", len(data))
+                return response.headers["ETag"]
+
+            logging.warning(f"Part {number} of {self.path.name} failed ({response.status_code}), attempt {attempt + 1} of {self.retries}")
+            if attempt + 1 < self.retries:
+                time.sleep(2 ** attempt)
+
+        raise Exception(f"Failed to upload part {number} of {self.path.name}")
+
+
+    def _complete(self, upload_id: str, parts: dict) -> None:
+        body = "<CompleteMultipartUpload>"
+        for number in sorted(parts):
+            body += f"<Part><PartNumber>{number}</PartNumber><ETag>{parts[number]}</ETag></Part>"
+        body += "</CompleteMultipartUpload>"
+
+        response = NetworkUtilities().post(self.url, params={"uploadId": upload_id}, data=body.encode(), headers=self._headers(), timeout=600)
+        if response.status_code != 200 or b"<Error>" in response.content:
+            raise Exception(f"Failed to complete multipart upload: {response.status_code} {response.text}")
+
+
+    def _upload_single(self) -> None:
+        """
+        Upload files smaller than a part with a single PUT
+        """
+        data = self.path.read_bytes()
+        headers = self._headers(include_metadata=True)
+        headers["Content-MD5"] = base64.b64encode(hashlib.md5(data).digest()).decode()
+
+        for attempt in range(self.retries):
+            response = NetworkUtilities().put(self.url, data=data, headers=headers, timeout=300)
+            if response.status_code == 200:
+                self.uploaded_parts = 1
+                self.uploaded_size  = len(data)
+                telemetry.count("bytes", len(data))
+                return
+            logging.warning(f"Upload of {self.path.name} failed ({response.status_code}), attempt {attempt + 1} of {self.retries}")
+            if attempt + 1 < self.retries:
+                time.sleep(2 ** attempt)
+
+        raise Exception(f"Failed to upload {self.path.name}")
+
+
+    def upload(self) -> bool:
+        """
+        Upload the file, resuming a previous attempt if possible
+
+        Returns:
+            bool: True if successful, False otherwise (see error_msg)
+        """
+
+        with telemetry.span("multipart_upload", file=self.path.name):
+            return self._upload()
+
+
+    def _upload(self) -> bool:
+        try:
+            size = self.path.stat().st_size
+            self.total_parts = max(1, -(-size // self.part_size))
+
+            if self.total_parts == 1:
+                self._upload_single()
+                return True
+
+            parts = {}
+            upload_id = None
+
+            state = self._load_state()
+            if state:
+                parts = self._list_parts(state["UploadId"])
+                if parts is not None:
+                    upload_id = state["UploadId"]
+                    logging.info(f"Resuming upload of {self.path.name}, {len(parts)} of {self.total_parts} parts already uploaded")
+                else:
+                    parts = {}
+
+            if upload_id is None:
+                upload_id = self._initiate()
+                self._save_state(upload_id)
+
+            self.uploaded_parts = len(parts)
+            self.uploaded_size  = sum(self._part_length(number) for number in parts)
+
+            pending = [number for number in range(1, self.total_parts + 1) if number not in parts]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._upload_part, upload_id, number, telemetry.current()): number for number in pending}
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        parts[futures[future]] = future.result()
+                except Exception:
+                    # Report the failure once in-flight parts finish, rather than uploading the rest first
+                    executor.shutdown(cancel_futures=True)
+                    raise
+
+            self._complete(upload_id, parts)
+            self.state_path.unlink()
+
+            logging.info(f"Uploaded {self.path.name} ({human_fmt(size)}) in {self.total_parts} parts")
+        except Exception as e:
+            self.error_msg = str(e)
+            logging.error(f"Error uploading {self.path.name}: {self.error_msg}")
+            return False
+
+        return True
+
+
+    def get_percent(self) -> float:
+        """
+        Query the upload percent
+
+        Returns:
+            float: The upload percent
+        """
+        size = self.path.stat().st_size
+        if size == 0:
+            return 100.0
+        return self.uploaded_size / size * 100
@@ -5,13 +5,17 @@ import shutil
 import logging
 import requests
 
-
-SESSION = requests.Session()
+from .transport import TRANSPORT
+from .preflight import PREFLIGHT
+from .. import telemetry
 
 
 class NetworkUtilities:
     """
     Utilities for network related tasks, primarily used for downloading files
+
+    Requests go through the shared transport (see transport.py), so constructing
+    instances is cheap and every caller reuses the same connection pools.
     """
 
     def __init__(self, url: str = None) -> None:
@@ -29,16 +33,7 @@ class NetworkUtilities:
             bool: True if network is available, False otherwise
         """
 
-        try:
-            requests.head(self.url, timeout=5, allow_redirects=True)
-            return True
-        except (
-            requests.exceptions.Timeout,
-            requests.exceptions.TooManyRedirects,
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError
-        ):
-            return False
+        return PREFLIGHT.probe(self.url)["Error"] is None
 
     def validate_link(self) -> bool:
         """
@@ -47,19 +42,10 @@ class NetworkUtilities:
         Returns:
             bool: True if link is valid, False otherwise
         """
-        try:
-            response = SESSION.head(self.url, timeout=5, allow_redirects=True)
-            if response.status_code == 404:
-                return False
-            else:
-                return True
-        except (
-            requests.exceptions.Timeout,
-            requests.exceptions.TooManyRedirects,
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError
-        ):
+        probe = PREFLIGHT.probe(self.url)
+        if probe["Error"] is not None:
             return False
+        return probe["Status"] != 404
 
 
     def get(self, url: str, **kwargs) -> requests.Response:
@@ -78,7 +64,8 @@ class NetworkUtilities:
         result: requests.Response = None
 
         try:
-            result = SESSION.get(url, **kwargs)
+            result = TRANSPORT.session.get(url, **kwargs)
+            _record_request(result, kwargs)
         except (
             requests.exceptions.Timeout,
             requests.exceptions.TooManyRedirects,
@@ -108,7 +95,8 @@ class NetworkUtilities:
         result: requests.Response = None
 
         try:
-            result = SESSION.post(url, **kwargs)
+            result = TRANSPORT.session.post(url, **kwargs)
+            _record_request(result, kwargs)
         except (
             requests.exceptions.Timeout,
             requests.exceptions.TooManyRedirects,
@@ -122,6 +110,46 @@ class NetworkUtilities:
         return result
 
 
+    def put(self, url: str, **kwargs) -> requests.Response:
+        """
+        Wrapper for requests's put method
+        Implement additional error handling
+
+        Parameters:
+            url (str): URL to put
+            **kwargs: Additional parameters for requests.put
+
+        Returns:
+            requests.Response: Response object from requests.put
+        """
+
+        result: requests.Response = None
+
+        try:
+            result = TRANSPORT.session.put(url, **kwargs)
+            _record_request(result, kwargs)
+        except (
+            requests.exceptions.Timeout,
+            requests.exceptions.TooManyRedirects,
+            requests.exceptions.ConnectionError,
+            requests.exceptions.HTTPError
+        ) as error:
+            logging.warn(f"Error calling requests.put: {error}")
+            # Return empty response object
+            return requests.Response()
+
+        return result
+
+
+def _record_request(response: requests.Response, kwargs: dict) -> None:
+    """
+    Count a request against the current telemetry span
+    """
+    telemetry.count("requests")
+    if not kwargs.get("stream"):
+        telemetry.count("bytes", len(response.content))
+
+
 def human_fmt(num):
     for unit in ["B", "KB", "MB", "GB", "TB", "PB"]:
         if abs(num) < 1000.0:
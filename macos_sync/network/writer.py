@@ -0,0 +1,245 @@
+"""
+writer.py: Preallocated, write-coalescing file writer for downloads
+
+- The full expected size is reserved up front (posix_fallocate where
+  available), so a full disk fails the download before any transfer and the
+  file is laid out contiguously
+- Writes are coalesced into buffer-sized writes, rather than one write per
+  network chunk
+- Reads adapt their size to observed throughput, small while a connection
+  ramps up, larger once it is fast
+- Flushing to disk follows a configurable sync policy
+"""
+
+import os
+import time
+import errno
+import logging
+
+import requests
+
+
+# When written data is forced to disk:
+# - none:     left to the OS
+# - close:    fsync once the file is complete
+# - interval: fdatasync every sync_interval bytes, bounding dirty page cache on small runners
+SYNC_POLICIES = ["none", "close", "interval"]
+
+MiB = 1024 * 1024
+
+
+def response_readinto(response: requests.Response):
+    """
+    readinto() callable for a streamed response's body
+
+    Reads through urllib3's public readinto(), releasing the connection back
+    to the pool once the body ends; compressed bodies fall back to
+    iter_content, which decodes them. urllib3 copies each read into the
+    buffer, so this doesn't avoid per-read allocations.
+
+    Returns:
+        callable: Takes a writable buffer, returns bytes read (0 at end of stream)
+    """
+    if not response.headers.get("Content-Encoding"):
+        raw = response.raw
+
+        def _read_raw(buffer: memoryview) -> int:
+            length = raw.readinto(buffer)
+            if not length:
+                raw.release_conn()
+            return length
+
+        return _read_raw
+
+    chunks  = response.iter_content(MiB)
+    pending = memoryview(b"")
+
+    def _readinto(buffer: memoryview) -> int:
+        nonlocal pending
+        if not pending:
+            pending = memoryview(next(chunks, b""))
+        length = min(len(buffer), len(pending))
+        buffer[:length] = pending[:length]
+        pending = pending[length:]
+        return length
+
+    return _readinto
+
+
+def read_head(readinto, size: int = 64 * 1024) -> bytes:
+    """
+    Read the start of a stream, ex. to check its magic before writing anything
+
+    Returns:
+        bytes: Up to size bytes, fewer only if the stream ends first
+    """
+    head   = memoryview(bytearray(size))
+    filled = 0
+    while filled < size:
+        length = readinto(head[filled:])
+        if not length:
+            break
+        filled += length
+    return bytes(head[:filled])
+
+
+class PreallocatedWriter:
+    """
+    Write a stream to a preallocated file, coalescing reads into large writes
+
+    Parameters:
+        path          (Path): File to write, truncated if it exists
+        size          (int):  Expected size to preallocate, None if unknown
+        buffer_size   (int):  Bytes coalesced per write
+        min_read      (int):  Smallest read size
+        sync_policy   (str):  See SYNC_POLICIES
+        sync_interval (int):  Bytes between syncs with the 'interval' policy
+
+    Usage:
+        >>> with PreallocatedWriter(path, size=content_length) as writer:
+        ...     writer.copy(response_readinto(response), on_data=digest.update)
+    """
+
+    def __init__(self,
+                 path: str,
+                 size: int = None,
+                 buffer_size: int = 8 * MiB,
+                 min_read: int = 64 * 1024,
+                 sync_policy: str = "none",
+                 sync_interval: int = 256 * MiB
+                ) -> None:
+        if sync_policy not in SYNC_POLICIES:
+            raise ValueError(f"Unknown sync policy: {sync_policy}")
+
+        self.path:          str = path
+        self.size:          int = size
+        self.buffer_size:   int = buffer_size
+        self.min_read:      int = min(min_read, buffer_size)
+        self.sync_policy:   str = sync_policy
+        self.sync_interval: int = sync_interval
+
+        self.written:      int  = 0
+        self.preallocated: bool = False
+        self.read_size:    int  = self.min_read
+
+        self._buffer   = memoryview(bytearray(buffer_size))
+        self._unsynced = 0
+        self._fd       = None
+
+
+    def __enter__(self) -> "PreallocatedWriter":
+        self.open()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(complete=exc_type is None)
+
+
+    def open(self) -> None:
+        """
+        Create the file and reserve its expected size
+
+        Raises:
+            OSError: Not enough free space for the expected size
+        """
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        if not self.size:
+            return
+
+        try:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(self._fd, 0, self.size)
+                self.preallocated = True
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                os.close(self._fd)
+                self._fd = None
+                os.unlink(self.path)
+                raise OSError(errno.ENOSPC, f"Not enough free space to preallocate {self.size} bytes for {self.path}") from e
+            # Filesystem doesn't support it (ex. some network mounts), continue without
+            logging.info(f"Preallocation unsupported for {self.path}: {e}")
+
+
+    def _write(self, data: memoryview) -> None:
+        while data:
+            written = os.write(self._fd, data)
+            data = data[written:]
+            self.written   += written
+            self._unsynced += written
+
+        if self.sync_policy == "interval" and self._unsynced >= self.sync_interval:
+            if hasattr(os, "fdatasync"):
+                os.fdatasync(self._fd)
+            else:
+                os.fsync(self._fd)
+            self._unsynced = 0
+
+
+    def _adapt(self, length: int, elapsed: float) -> None:
+        """
+        Aim for reads of about 50ms, in powers of two between min_read and buffer_size
+        """
+        if length < self.read_size:
+            return
+        if elapsed < 0.025 and self.read_size < self.buffer_size:
+            self.read_size = min(self.read_size * 2, self.buffer_size)
+        elif elapsed > 0.1 and self.read_size > self.min_read:
+            self.read_size = max(self.read_size // 2, self.min_read)
+
+
+    def copy(self, readinto, initial: bytes = b"", on_data=None, should_stop=None) -> int:
+        """
+        Copy a stream into the file until it ends
+
+        Parameters:
+            readinto    (callable): Fills a buffer, returns bytes read, see response_readinto()
+            initial     (bytes):    Data already read from the stream, written first
+            on_data     (callable): Called with each coalesced buffer before it is written,
+                                    the view is reused afterwards so must not be kept
+            should_stop (callable): Returns True to abort the copy
+
+        Returns:
+            int: Bytes written
+        """
+        position = len(initial)
+        self._buffer[:position] = initial
+
+        while True:
+            if should_stop and should_stop():
+                raise Exception("Download stopped")
+
+            end = min(position + self.read_size, self.buffer_size)
+            start = time.perf_counter()
+            length = readinto(self._buffer[position:end])
+            self._adapt(length, time.perf_counter() - start)
+            position += length
+
+            if position == self.buffer_size or (length == 0 and position):
+                if on_data:
+                    on_data(self._buffer[:position])
+                self._write(self._buffer[:position])
+                position = 0
+
+            if length == 0:
+                return self.written
+
+
+    def close(self, complete: bool = True) -> None:
+        """
+        Close the file, trimming any preallocated space that wasn't written
+
+        Parameters:
+            complete (bool): Apply the sync policy, False when the copy failed
+        """
+        if self._fd is None:
+            return
+
+        try:
+            if self.preallocated and self.written != self.size:
+                os.ftruncate(self._fd, self.written)
+            if complete and self.sync_policy in ["close", "interval"]:
+                os.fsync(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
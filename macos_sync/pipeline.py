@@ -0,0 +1,450 @@
+"""
+pipeline.py: Staged sync pipeline
+
+Items flow through discover -> check archived -> download -> verify -> upload,
+with each stage on its own thread and bounded queues in between. This lets
+item N+1 download while item N verifies or uploads, while a disk budget caps
+how many payloads may sit on disk at once.
+"""
+
+import enum
+import time
+import queue
+import logging
+import threading
+
+from typing import Callable, Iterable
+
+from . import telemetry
+from .network import human_fmt, get_free_space
+from .work_queue import WorkQueue, LeaseKeeper
+
+
+class PipelineStage(enum.Enum):
+    """
+    Pipeline stages, in order
+    """
+    DISCOVER = "Discover"
+    CHECK    = "Check"
+    DOWNLOAD = "Download"
+    VERIFY   = "Verify"
+    UPLOAD   = "Upload"
+
+
+class DiskBudget:
+    """
+    Tracks bytes reserved against a disk budget
+
+    acquire() blocks until enough earlier reservations have been released.
+    retain() keeps a reservation's bytes on disk past the item, shrinking the budget.
+
+    Parameters:
+        budget (int): Total bytes that may be reserved at once
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget:   int = budget
+        self.reserved: int = 0
+
+        self._condition = threading.Condition()
+
+
+    @classmethod
+    def from_free_space(cls, path: str = None, headroom: float = 0.9) -> "DiskBudget":
+        """
+        Derive a budget from the free space on a disk
+
+        Parameters:
+            path     (str):   Path on the disk to check
+            headroom (float): Fraction of free space usable by the pipeline
+        """
+        return cls(int(get_free_space(path) * headroom))
+
+
+    def fits(self, size: int) -> bool:
+        """
+        Whether a reservation could ever be satisfied
+        """
+        return size <= self.budget
+
+
+    def acquire(self, size: int) -> None:
+        """
+        Reserve bytes, waiting for space if needed
+
+        Parameters:
+            size (int): Bytes to reserve
+
+        Raises:
+            Exception: The budget shrank below the reservation (see retain()), so it can never be satisfied
+        """
+        with self._condition:
+            while self.reserved + size > self.budget:
+                if not self.fits(size):
+                    raise Exception(f"Reservation of {human_fmt(size)} exceeds remaining disk budget of {human_fmt(self.budget)}")
+                self._condition.wait()
+            self.reserved += size
+
+
+    def release(self, size: int) -> None:
+        """
+        Release a reservation
+
+        Parameters:
+            size (int): Bytes to release
+        """
+        with self._condition:
+            self.reserved -= size
+            self._condition.notify_all()
+
+
+    def retain(self, size: int) -> None:
+        """
+        Release a reservation whose bytes stay on disk, ex. payloads kept to resume a failed upload
+
+        Parameters:
+            size (int): Bytes to release from the reservation and the budget
+        """
+        with self._condition:
+            self.reserved -= size
+            self.budget   -= size
+            # Waiters that no longer fit are woken to fail rather than wait forever
+            self._condition.notify_all()
+
+
+class SyncPipeline:
+    """
+    Run sync stages concurrently over a stream of items
+
+    Items are dictionaries, and must contain at least 'Build' and 'Size' (bytes on
+    disk once downloaded, None if unknown). Stage callables raise on failure; failed
+    items are cleaned up and recorded without halting the rest of the pipeline,
+    except failed uploads, whose verified payloads are kept for the next run to resume.
+
+    Parameters:
+        discover    (Callable): Returns an iterable of items, consumed lazily
+        is_archived (Callable): Returns True if an item no longer needs syncing
+        download    (Callable): Downloads an item's payloads
+        verify      (Callable): Verifies an item's payloads
+        upload      (Callable): Uploads an item's payloads
+        cleanup     (Callable): Removes an item's payloads from disk
+        disk_budget (DiskBudget): Limits payloads on disk at once
+        max_items   (int):  Maximum items to download per run
+        queue_size  (int):  Items that may wait between each pair of stages
+        resolve_size (Callable): Optional, determines 'Size' for items discovered without one
+        planner      (RunPlanner): Optional, admits and defers items to fit a time budget
+        work_queue   (WorkQueue):  Optional, claims builds so concurrent workers don't sync the same one
+
+    Usage:
+        >>> pipeline = SyncPipeline(discover, is_archived, download, verify, upload, cleanup, DiskBudget.from_free_space(), max_items=3)
+        >>> pipeline.run()
+        >>> for item, stage, error in pipeline.failures:
+        ...     print(f"{item['Build']} failed during {stage.value}: {error}")
+    """
+
+    def __init__(self,
+                 discover:    Callable[[], Iterable],
+                 is_archived: Callable[[dict], bool],
+                 download:    Callable[[dict], None],
+                 verify:      Callable[[dict], None],
+                 upload:      Callable[[dict], None],
+                 cleanup:     Callable[[dict], None],
+                 disk_budget: DiskBudget,
+                 max_items:   int = 1,
+                 queue_size:  int = 1,
+                 resolve_size: Callable[[dict], int] = None,
+                 planner = None,
+                 work_queue: WorkQueue = None
+                ) -> None:
+        self._discover    = discover
+        self._is_archived = is_archived
+        self._download    = download
+        self._verify      = verify
+        self._upload      = upload
+        self._cleanup     = cleanup
+        self._resolve_size = resolve_size
+
+        self.disk_budget: DiskBudget = disk_budget
+        self.max_items:   int        = max_items
+        self.queue_size:  int        = queue_size
+        self.planner                 = planner
+        self.work_queue: WorkQueue   = work_queue
+
+        self._lease_keeper: LeaseKeeper = LeaseKeeper(work_queue) if work_queue else None
+
+        self.completed: list = []
+        self.failures:  list = []
+        self.deferred:  list = []
+
+        self._stop = threading.Event()
+
+
+    def stop(self) -> None:
+        """
+        Stop admitting new items, items already in flight are finished
+        """
+        self._stop.set()
+
+
+    def _reservation(self, item: dict) -> int:
+        """
+        Bytes to reserve for an item, items of unknown size reserve the entire budget
+        """
+        return item.get("Size") or self.disk_budget.budget
+
+
+    def _fail(self, item: dict, stage: PipelineStage, error: Exception) -> None:
+        logging.error(f"{item['Build']} failed during {stage.value}: {error}")
+        print(f"  {item['Build']} failed during {stage.value}: {error}")
+        self.failures.append((item, stage, error))
+
+
+    def _defer(self, item: dict, stage: PipelineStage) -> None:
+        print(f"  Not enough time left to {stage.value.lower()} {item['Build']}, deferring to the next run")
+        self.deferred.append((item, stage))
+
+
+    def _timed(self, stage: PipelineStage, function: Callable, item: dict) -> None:
+        """
+        Run a stage, recording its throughput with the planner
+        """
+        start = time.time()
+        with telemetry.span(stage.value.lower(), build=item["Build"]):
+            function(item)
+        if self.planner:
+            self.planner.record(item, stage, time.time() - start)
+
+
+    def _claim(self, item: dict) -> bool:
+        if self.work_queue is None:
+            return True
+        if not self.work_queue.claim(item["Build"]):
+            return False
+        self._lease_keeper.add(item["Build"])
+        return True
+
+
+    def _lease_lost(self, item: dict, stage: PipelineStage) -> bool:
+        """
+        Check the build's lease is still held, another worker may have taken it over after it expired
+        """
+        if self.work_queue is None or not self._lease_keeper.is_lost(item["Build"]):
+            return False
+        print(f"  Lost lease on {item['Build']} to another worker, abandoning before {stage.value.lower()}")
+        return True
+
+
+    def _unclaim(self, item: dict, completed: bool = False) -> None:
+        """
+        Hand a claimed build back to the queue, marking it done if it was uploaded
+        """
+        if self.work_queue is None:
+            return
+        lost = self._lease_keeper.is_lost(item["Build"])
+        self._lease_keeper.remove(item["Build"])
+        if lost:
+            # The build is another worker's now
+            return
+        if completed:
+            self.work_queue.complete(item["Build"])
+        else:
+            self.work_queue.release(item["Build"])
+
+
+    def _release(self, item: dict, completed: bool = False, keep: bool = False) -> None:
+        """
+        Hand an item's disk reservation and claim back
+
+        Parameters:
+            completed (bool): The item was uploaded
+            keep      (bool): Leave the payloads on disk, ex. so a failed upload resumes next run
+        """
+        if keep:
+            self.disk_budget.retain(self._reservation(item))
+            self._unclaim(item, completed)
+            return
+
+        try:
+            self._cleanup(item)
+        finally:
+            self.disk_budget.release(self._reservation(item))
+            self._unclaim(item, completed)
+
+
+    def _run_discover(self, output: queue.Queue) -> None:
+        try:
+            for item in self._discover():
+                if self._stop.is_set():
+                    break
+                output.put(item)
+        except Exception as e:
+            self._fail({"Build": "catalog"}, PipelineStage.DISCOVER, e)
+        finally:
+            output.put(None)
+
+
+    def _run_check(self, input: queue.Queue, output: queue.Queue) -> None:
+        admitted = 0
+        seen     = set()
+        while True:
+            item = input.get()
+            if item is None:
+                break
+            if admitted >= self.max_items or self._stop.is_set():
+                # Keep draining so discovery can exit
+                continue
+            if item["Build"] in seen:
+                continue
+            seen.add(item["Build"])
+
+            try:
+                with telemetry.span("archive_lookup", build=item["Build"]):
+                    archived = self._is_archived(item)
+                if archived:
+                    continue
+                # Only resolve sizes for items that need syncing, as this may require a network call
+                if item.get("Size") is None and self._resolve_size:
+                    item["Size"] = self._resolve_size(item)
+            except Exception as e:
+                self._fail(item, PipelineStage.CHECK, e)
+                continue
+
+            if not self.disk_budget.fits(self._reservation(item)):
+                print(f"  {item['Build']} needs {human_fmt(item['Size'])}, exceeding disk budget of {human_fmt(self.disk_budget.budget)}, skipping")
+                continue
+
+            if not self._claim(item):
+                print(f"  {item['Build']} claimed by another worker, skipping")
+                continue
+
+            if self.planner and not self.planner.admit(item):
+                print(f"  {item['Build']} is not expected to finish within the time budget, skipping")
+                self._unclaim(item)
+                continue
+
+            admitted += 1
+            output.put(item)
+
+            if admitted >= self.max_items:
+                print(f"  Reached limit of {self.max_items} item(s) for this run")
+                self._stop.set()
+
+        output.put(None)
+
+
+    def _run_download(self, input: queue.Queue, output: queue.Queue) -> None:
+        while True:
+            item = input.get()
+            if item is None:
+                break
+
+            if self.planner and not self.planner.has_time(item, PipelineStage.DOWNLOAD):
+                self._defer(item, PipelineStage.DOWNLOAD)
+                self._unclaim(item)
+                continue
+
+            if self._lease_lost(item, PipelineStage.DOWNLOAD):
+                self._unclaim(item)
+                continue
+
+            try:
+                self.disk_budget.acquire(self._reservation(item))
+            except Exception as e:
+                self._fail(item, PipelineStage.DOWNLOAD, e)
+                self._unclaim(item)
+                continue
+
+            try:
+                self._timed(PipelineStage.DOWNLOAD, self._download, item)
+            except Exception as e:
+                self._fail(item, PipelineStage.DOWNLOAD, e)
+                self._release(item)
+                continue
+
+            output.put(item)
+
+        output.put(None)
+
+
+    def _run_verify(self, input: queue.Queue, output: queue.Queue) -> None:
+        while True:
+            item = input.get()
+            if item is None:
+                break
+
+            if self._lease_lost(item, PipelineStage.VERIFY):
+                self._release(item)
+                continue
+
+            try:
+                self._timed(PipelineStage.VERIFY, self._verify, item)
+            except Exception as e:
+                self._fail(item, PipelineStage.VERIFY, e)
+                self._release(item)
+                continue
+
+            output.put(item)
+
+        output.put(None)
+
+
+    def _run_upload(self, input: queue.Queue) -> None:
+        while True:
+            item = input.get()
+            if item is None:
+                break
+
+            if self.planner and not self.planner.has_time(item, PipelineStage.UPLOAD):
+                self._defer(item, PipelineStage.UPLOAD)
+                self._release(item)
+                continue
+
+            if self._lease_lost(item, PipelineStage.UPLOAD):
+                self._release(item)
+                continue
+
+            try:
+                self._timed(PipelineStage.UPLOAD, self._upload, item)
+            except Exception as e:
+                self._fail(item, PipelineStage.UPLOAD, e)
+                # Verified payloads and their multipart state are kept, the next run resumes the upload
+                self._release(item, keep=True)
+                continue
+
+            self.completed.append(item)
+            self._release(item, completed=True)
+
+
+    def run(self) -> list:
+        """
+        Run the pipeline to completion
+
+        Returns:
+            list: Items successfully uploaded
+        """
+
+        discovered = queue.Queue(maxsize=self.queue_size)
+        pending    = queue.Queue(maxsize=self.queue_size)
+        downloaded = queue.Queue(maxsize=self.queue_size)
+        verified   = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._run_discover, args=(discovered,),          name=PipelineStage.DISCOVER.value),
+            threading.Thread(target=self._run_check,    args=(discovered, pending),  name=PipelineStage.CHECK.value),
+            threading.Thread(target=self._run_download, args=(pending, downloaded),  name=PipelineStage.DOWNLOAD.value),
+            threading.Thread(target=self._run_verify,   args=(downloaded, verified), name=PipelineStage.VERIFY.value),
+            threading.Thread(target=self._run_upload,   args=(verified,),            name=PipelineStage.UPLOAD.value),
+        ]
+
+        if self._lease_keeper:
+            self._lease_keeper.start()
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._lease_keeper:
+            self._lease_keeper.stop()
+
+        return self.completed
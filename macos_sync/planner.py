@@ -0,0 +1,220 @@
+"""
+planner.py: Fit sync runs within a time budget
+
+GitHub Actions jobs are killed once they exceed their time limit. Using
+throughput observed on previous runs, estimate how long each pending item
+will take and only admit what can finish before the deadline.
+"""
+
+import json
+import time
+import logging
+import urllib.parse
+
+from pathlib import Path
+
+from .pipeline import PipelineStage
+
+
+# Used until a host has recorded history, in bytes per second
+DEFAULT_THROUGHPUT = {
+    PipelineStage.DOWNLOAD: 50 * 1000 * 1000,
+    PipelineStage.VERIFY:   400 * 1000 * 1000,
+    PipelineStage.UPLOAD:   20 * 1000 * 1000,
+}
+
+
+class ThroughputHistory:
+    """
+    Persisted per-host throughput, smoothed with an exponential moving average
+
+    Parameters:
+        path      (Path):  JSON file to persist history to
+        smoothing (float): Weight given to the newest sample
+
+    Usage:
+        >>> history = ThroughputHistory("throughput_history.json")
+        >>> history.record(PipelineStage.DOWNLOAD, "swcdn.apple.com", 12210304673, 240.0)
+        >>> history.throughput(PipelineStage.DOWNLOAD, "swcdn.apple.com")  # Bytes per second
+        >>> history.save()
+    """
+
+    def __init__(self, path: Path, smoothing: float = 0.3) -> None:
+        self.path:      Path  = Path(path)
+        self.smoothing: float = smoothing
+
+        self.history: dict = self._load()
+
+
+    def _load(self) -> dict:
+        if not self.path.exists():
+            return {}
+
+        try:
+            return json.loads(self.path.read_text())
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring corrupt throughput history: {self.path}")
+            return {}
+
+
+    def record(self, stage: PipelineStage, host: str, size: int, seconds: float) -> None:
+        """
+        Record an observed transfer
+
+        Parameters:
+            stage   (PipelineStage): Stage the transfer belongs to
+            host    (str):   Host the data was transferred from/to
+            size    (int):   Bytes transferred
+            seconds (float): Time taken
+        """
+        if size <= 0 or seconds <= 0:
+            return
+
+        entry = self.history.setdefault(stage.value, {}).get(host)
+        sample = size / seconds
+        if entry is None:
+            entry = {"Throughput": sample, "Samples": 0}
+        else:
+            entry["Throughput"] = (self.smoothing * sample) + ((1 - self.smoothing) * entry["Throughput"])
+
+        entry["Samples"] += 1
+        self.history[stage.value][host] = entry
+
+
+    def throughput(self, stage: PipelineStage, host: str) -> float:
+        """
+        Expected throughput for a stage and host
+
+        Returns:
+            float: Bytes per second
+        """
+        entry = self.history.get(stage.value, {}).get(host)
+        if entry is None:
+            return DEFAULT_THROUGHPUT[stage]
+        return entry["Throughput"]
+
+
+    def save(self) -> None:
+        """
+        Persist history to disk
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.history, indent=4))
+
+
+class RunPlanner:
+    """
+    Admit items into a run only if they can finish before the deadline
+
+    Items are expected to carry 'Size' and 'URL' keys. Since stages run
+    concurrently, the run's duration is estimated as a flow shop: an item's stage
+    starts once both its previous stage and the prior item's same stage finish.
+
+    Parameters:
+        history     (ThroughputHistory): Throughput observed on previous runs
+        time_budget (float): Seconds the run may take, None for no limit (history is still recorded)
+        margin      (float): Seconds reserved before the deadline for cleanup
+        upload_host (str):   Host uploads are sent to
+
+    Usage:
+        >>> planner = RunPlanner(ThroughputHistory("throughput_history.json"), time_budget=5 * 60 * 60)
+        >>> if planner.admit(item):
+        ...     ...
+        >>> if not planner.has_time(item, PipelineStage.UPLOAD):
+        ...     # Defer to the next run rather than being killed mid-upload
+    """
+
+    VERIFY_HOST: str = "local"
+
+    def __init__(self,
+                 history: ThroughputHistory,
+                 time_budget: float,
+                 margin: float = 10 * 60,
+                 upload_host: str = "s3.us.archive.org"
+                ) -> None:
+        self.history:     ThroughputHistory = history
+        self.time_budget: float = time_budget
+        self.margin:      float = margin
+        self.upload_host: str   = upload_host
+
+        self.start_time: float = time.time()
+        self.deadline:   float = float("inf") if time_budget is None else self.start_time + time_budget - margin
+
+        self.admitted: list = []
+        self._stage_finish: dict = {stage: 0.0 for stage in self._stages()}
+
+
+    def _stages(self) -> list:
+        return [PipelineStage.DOWNLOAD, PipelineStage.VERIFY, PipelineStage.UPLOAD]
+
+
+    def host(self, item: dict, stage: PipelineStage) -> str:
+        """
+        Host a stage of an item transfers with
+        """
+        if stage == PipelineStage.DOWNLOAD:
+            return urllib.parse.urlparse(item["URL"]).hostname
+        if stage == PipelineStage.UPLOAD:
+            return self.upload_host
+        return self.VERIFY_HOST
+
+
+    def estimate_stage(self, item: dict, stage: PipelineStage) -> float:
+        """
+        Estimated seconds for a single stage of an item
+        """
+        return (item.get("Size") or 0) / self.history.throughput(stage, self.host(item, stage))
+
+
+    def estimate(self, item: dict) -> float:
+        """
+        Estimated seconds for an item to pass through every stage on its own
+        """
+        return sum(self.estimate_stage(item, stage) for stage in self._stages())
+
+
+    def remaining(self) -> float:
+        """
+        Seconds left until the deadline
+        """
+        return self.deadline - time.time()
+
+
+    def admit(self, item: dict) -> bool:
+        """
+        Admit an item if the run, including it, is expected to finish before the deadline
+
+        Returns:
+            bool: True if admitted
+        """
+        elapsed = time.time() - self.start_time
+
+        finish = {}
+        previous = elapsed
+        for stage in self._stages():
+            previous = max(previous, self._stage_finish[stage]) + self.estimate_stage(item, stage)
+            finish[stage] = previous
+
+        if self.start_time + finish[PipelineStage.UPLOAD] > self.deadline:
+            logging.info(f"{item['Build']} estimated to finish {finish[PipelineStage.UPLOAD] - elapsed:.0f}s from now, past the deadline")
+            return False
+
+        self._stage_finish = finish
+        self.admitted.append(item)
+        return True
+
+
+    def has_time(self, item: dict, stage: PipelineStage) -> bool:
+        """
+        Whether the given stage and every later one can still finish before the deadline
+        """
+        stages = self._stages()
+        needed = sum(self.estimate_stage(item, later) for later in stages[stages.index(stage):])
+        return needed <= self.remaining()
+
+
+    def record(self, item: dict, stage: PipelineStage, seconds: float) -> None:
+        """
+        Record how long a stage of an item took
+        """
+        self.history.record(stage, self.host(item, stage), item.get("Size") or 0, seconds)
@@ -0,0 +1,273 @@
+"""
+profiling.py: Profile sync runs
+
+- CPUProfiler:    cProfile across every thread started during the run
+- MemoryProfiler: tracemalloc allocation sites at peak traced memory
+- StackSampler:   Periodic, low-overhead stack sampling of all threads
+
+Each writes a plain text report once the profiled block exits.
+
+Usage:
+    >>> with profiling.CPUProfiler("profile-cpu.txt"):
+    ...     sync_obj.iterate_catalog()
+"""
+
+import io
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import linecache
+import tracemalloc
+import collections
+
+from pathlib import Path
+
+
+class CPUProfiler:
+    """
+    Profile CPU time under cProfile
+
+    cProfile only observes the thread it was enabled on, so threads started
+    while profiling (pipeline stages, downloads, uploads) are given their own
+    profiler through threading.setprofile() and merged into the report.
+
+    Parameters:
+        report_path (Path): Where to write the report
+        limit       (int):  Number of functions to list
+    """
+
+    def __init__(self, report_path: Path, limit: int = 50) -> None:
+        self.report_path: Path = Path(report_path)
+        self.limit:       int  = limit
+
+        self._profilers:    list = []
+        self._lock               = threading.Lock()
+
+
+    def _profile_thread(self, frame, event, arg) -> None:
+        """
+        Profile hook called once per new thread, enabling the profiler replaces it
+        """
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from a single profiler
+            sys.setprofile(None)
+            return
+
+        with self._lock:
+            self._profilers.append(profiler)
+
+
+    def __enter__(self) -> "CPUProfiler":
+        threading.setprofile(self._profile_thread)
+
+        profiler = cProfile.Profile()
+        self._profilers.append(profiler)
+        profiler.enable()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self._profilers[0].disable()
+        threading.setprofile(None)
+        self.write_report()
+
+
+    def write_report(self) -> None:
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profilers[0], stream=stream)
+        for profiler in self._profilers[1:]:
+            try:
+                stats.add(profiler)
+            except TypeError:
+                # Thread never ran any profiled code
+                pass
+
+        stream.write(f"CPU profile across {len(self._profilers)} thread(s)\n\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.limit)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.limit)
+
+        self.report_path.write_text(stream.getvalue())
+
+
+class MemoryProfiler:
+    """
+    Profile allocations under tracemalloc
+
+    Traced memory is polled while profiling, and a snapshot taken whenever it
+    exceeds the largest seen so far, so the report describes the allocations
+    held at peak usage rather than whatever is left once the run ends.
+
+    Parameters:
+        report_path (Path):  Where to write the report
+        limit       (int):   Number of allocation sites to list
+        frames      (int):   Stack depth recorded per allocation
+        interval    (float): Seconds between polls of traced memory
+    """
+
+    def __init__(self, report_path: Path, limit: int = 30, frames: int = 10, interval: float = 1.0) -> None:
+        self.report_path: Path  = Path(report_path)
+        self.limit:       int   = limit
+        self.frames:      int   = frames
+        self.interval:    float = interval
+
+        self.snapshot:      tracemalloc.Snapshot = None
+        self.snapshot_size: int                  = 0
+        self.snapshot_time: float                = None
+        self.start_time:    float                = None
+
+        self._stop   = threading.Event()
+        self._thread = None
+
+
+    def _take_snapshot(self) -> None:
+        """
+        Snapshot if traced memory exceeds the largest snapshot so far
+        """
+        current, _ = tracemalloc.get_traced_memory()
+        if self.snapshot is not None and current <= self.snapshot_size:
+            return
+
+        self.snapshot      = tracemalloc.take_snapshot()
+        self.snapshot_size = current
+        self.snapshot_time = time.time() - self.start_time
+
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._take_snapshot()
+
+
+    def __enter__(self) -> "MemoryProfiler":
+        self.start_time = time.time()
+        tracemalloc.start(self.frames)
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+        self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        snapshot = self.snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+
+        lines = [
+            f"Current traced memory: {current / 1000 / 1000:.1f} MB",
+            f"Peak traced memory:    {peak / 1000 / 1000:.1f} MB",
+            f"Largest snapshot:      {self.snapshot_size / 1000 / 1000:.1f} MB, {self.snapshot_time:.1f}s into the run",
+            "",
+            "Top allocation sites:",
+        ]
+        for stat in snapshot.statistics("lineno")[:self.limit]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size / 1000:10.1f} KB {stat.count:8} blocks  {frame.filename}:{frame.lineno}")
+            source = linecache.getline(frame.filename, frame.lineno).strip()
+            if source:
+                lines.append(f"      {source}")
+
+        lines += ["", "Top allocating files:"]
+        for stat in snapshot.statistics("filename")[:self.limit]:
+            lines.append(f"  {stat.size / 1000:10.1f} KB {stat.count:8} blocks  {stat.traceback[0].filename}")
+
+        lines += ["", "Top allocation stacks:"]
+        for stat in snapshot.statistics("traceback")[:5]:
+            lines.append(f"  {stat.size / 1000:.1f} KB in {stat.count} blocks")
+            for line in stat.traceback.format(most_recent_first=True):
+                lines.append(f"    {line}")
+
+        self.report_path.write_text("\n".join(lines) + "\n")
+
+
+class StackSampler:
+    """
+    Periodically sample the stacks of all threads
+
+    Reports the functions most often on-CPU (innermost frame) and most often
+    on the stack at all, which surfaces where wall time goes without the
+    overhead of deterministic profiling.
+
+    Parameters:
+        report_path (Path):  Where to write the report
+        interval    (float): Seconds between samples
+        limit       (int):   Number of functions to list
+    """
+
+    def __init__(self, report_path: Path, interval: float = 0.01, limit: int = 30) -> None:
+        self.report_path: Path  = Path(report_path)
+        self.interval:    float = interval
+        self.limit:       int   = limit
+
+        self.samples:   int = 0
+        self.start_time: float = None
+        self.innermost: collections.Counter = collections.Counter()
+        self.inclusive: collections.Counter = collections.Counter()
+
+        self._stop   = threading.Event()
+        self._thread = None
+
+
+    def _sample(self) -> None:
+        own_thread = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+
+                self.innermost[self._describe(frame)] += 1
+
+                seen = set()
+                while frame is not None:
+                    name = self._describe(frame)
+                    if name not in seen:
+                        self.inclusive[name] += 1
+                        seen.add(name)
+                    frame = frame.f_back
+
+
+    def _describe(self, frame) -> str:
+        return f"{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_code.co_firstlineno})"
+
+
+    def __enter__(self) -> "StackSampler":
+        self.start_time = time.time()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+        lines = [
+            f"{self.samples} samples every {self.interval}s over {time.time() - self.start_time:.1f}s",
+            "",
+            "Most frequent innermost frames:",
+        ]
+        for name, count in self.innermost.most_common(self.limit):
+            lines.append(f"  {count:8}  {name}")
+
+        lines += ["", "Most frequent frames on stack:"]
+        for name, count in self.inclusive.most_common(self.limit):
+            lines.append(f"  {count:8}  {name}")
+
+        self.report_path.write_text("\n".join(lines) + "\n")
+
+
+PROFILERS = {
+    "cpu":    CPUProfiler,
+    "memory": MemoryProfiler,
+}
@@ -0,0 +1,19 @@
+"""
+standin: Offline stand-ins for the services the sync depends on
+
+Serves synthetic Software Update Catalogs, InstallAssistant payloads with
+matching integrityDataV1, an AppleDB-shaped main.json with IPSWs, and enough
+of archive.org (search, metadata, downloads and IA-S3 uploads) for a full
+sync, with configurable latency and bandwidth.
+
+Usage:
+    >>> from macos_sync import standin, sync
+    >>> with standin.StandinServer("/tmp/standin", installers=2) as server:
+    ...     sync.macOSSync("key", "secret", max_items=2, endpoints=server.endpoints).iterate_catalog()
+
+    End-to-end benchmark:
+    python3 -m macos_sync.standin.benchmark --help
+"""
+
+from .fixtures import StandinFixtures
+from .server   import StandinServer
@@ -0,0 +1,146 @@
+"""
+benchmark.py: End-to-end sync benchmark against the stand-in server
+
+Runs iterate_catalog and iterate_apple_db against StandinServer and reports
+time and throughput per stage, from the telemetry spans recorded during each run.
+
+Usage:
+    python3 -m macos_sync.standin.benchmark --payload_size 64 --bandwidth 100 --latency 0.02
+"""
+
+import json
+import time
+import argparse
+import tempfile
+
+from pathlib import Path
+
+from .server import StandinServer
+from .. import telemetry
+from ..sync import macOSSync
+from ..network import human_fmt
+
+
+VARIANTS = {
+    "SUCatalog":    "iterate_catalog",
+    "AppleDB IPSW": "iterate_apple_db",
+}
+
+# Spans reported per run, in pipeline order
+REPORTED_SPANS = ["catalog_fetch", "metadata_resolution", "archive_lookup", "download", "verify", "upload"]
+
+
+def _subtree_bytes(span: telemetry.Span) -> int:
+    return span.counters.get("bytes", 0) + sum(_subtree_bytes(child) for child in list(span.children))
+
+
+def _summarize(roots: list) -> dict:
+    """
+    Aggregate spans by name: count, seconds and bytes (including child spans)
+    """
+    summary = {}
+    pending = list(roots)
+    while pending:
+        span = pending.pop()
+        pending.extend(span.children)
+        if span.name not in REPORTED_SPANS:
+            continue
+
+        entry = summary.setdefault(span.name, {"Count": 0, "Seconds": 0.0, "Bytes": 0})
+        entry["Count"]   += 1
+        entry["Seconds"] += span.duration
+        entry["Bytes"]   += _subtree_bytes(span)
+
+    for entry in summary.values():
+        entry["Throughput"] = entry["Bytes"] / entry["Seconds"] if entry["Seconds"] else 0.0
+
+    return summary
+
+
+def run_benchmark(directory: Path,
+                  variants: list = list(VARIANTS),
+                  installers: int = 2,
+                  payload_size: int = 32 * 1024 * 1024,
+                  latency: float = 0.0,
+                  bandwidth: float = None
+                 ) -> dict:
+    """
+    Sync every stand-in installer of each variant, timing each stage
+
+    Parameters:
+        directory    (Path):  Scratch directory for fixtures, downloads and uploads
+        variants     (list):  Variants to run, see VARIANTS
+        installers   (int):   Installers (and IPSWs) to serve and sync
+        payload_size (int):   Size of each payload in bytes
+        latency      (float): Seconds added before every response
+        bandwidth    (float): Bytes per second per connection, None for unlimited
+
+    Returns:
+        dict: Per variant, wall time and per-stage summaries
+    """
+
+    directory = Path(directory)
+    results = {}
+
+    with StandinServer(directory, latency=latency, bandwidth=bandwidth, installers=installers, ipsws=installers, payload_size=payload_size) as server:
+        for variant in variants:
+            sync_obj = macOSSync(
+                access_key="standin",
+                secret_key="standin",
+                max_items=installers,
+                disk_budget=payload_size * installers * 4,
+                work_dir=directory / f"work-{variant.replace(' ', '-')}",
+                endpoints=server.endpoints,
+            )
+
+            first_root = len(telemetry.TELEMETRY.roots)
+            start = time.time()
+            getattr(sync_obj, VARIANTS[variant])()
+            elapsed = time.time() - start
+
+            results[variant] = {
+                "Seconds":  elapsed,
+                "Items":    installers,
+                "Requests": server.requests,
+                "Stages":   _summarize(telemetry.TELEMETRY.roots[first_root:]),
+            }
+            server.requests = 0
+
+    return results
+
+
+def print_results(results: dict) -> None:
+    for variant, result in results.items():
+        print(f"{variant}: {result['Items']} item(s) in {result['Seconds']:.2f} seconds, {result['Requests']} requests")
+        for name in REPORTED_SPANS:
+            if name not in result["Stages"]:
+                continue
+            entry = result["Stages"][name]
+            print(f"  {name:<20} {entry['Count']:4}x {entry['Seconds']:8.2f}s {human_fmt(entry['Bytes']):>10} {human_fmt(entry['Throughput']):>10}/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the sync pipeline against local stand-in services')
+    parser.add_argument('--variant',      type=str,   help='Variant to run, defaults to all', choices=VARIANTS.keys(), default=None)
+    parser.add_argument('--installers',   type=int,   help='Installers to serve and sync per variant', default=2)
+    parser.add_argument('--payload_size', type=float, help='Payload size in MiB', default=32)
+    parser.add_argument('--latency',      type=float, help='Seconds added before every response', default=0.0)
+    parser.add_argument('--bandwidth',    type=float, help='Per-connection bandwidth in MB/s, unlimited by default', default=None)
+    parser.add_argument('--directory',    type=str,   help='Scratch directory, defaults to a temporary directory', default=None)
+    parser.add_argument('--json',         type=str,   help='Also write results to this JSON file', default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        results = run_benchmark(
+            directory=args.directory or scratch,
+            variants=[args.variant] if args.variant else list(VARIANTS),
+            installers=args.installers,
+            payload_size=int(args.payload_size * 1024 * 1024),
+            latency=args.latency,
+            bandwidth=args.bandwidth * 1000 * 1000 if args.bandwidth else None,
+        )
+
+    print_results(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=4))
+
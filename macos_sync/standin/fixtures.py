@@ -0,0 +1,219 @@
+"""
+fixtures.py: Synthetic installers, catalogs and AppleDB data for the stand-in server
+"""
+
+import json
+import random
+import hashlib
+import plistlib
+import datetime
+
+from pathlib import Path
+
+from ..integrity_verification import ChunklistWriter
+
+
+class StandinFixtures:
+    """
+    Generate payloads and the documents referencing them
+
+    InstallAssistant.pkgs get a matching integrityDataV1 and MobileAsset plist,
+    IPSWs are listed in an AppleDB-shaped main.json with their SHA-1. Payloads
+    are random (seeded) and written to disk, so they can be served with Range
+    support without being held in memory.
+
+    Parameters:
+        directory      (Path): Where to write payloads
+        base_url       (str):  URL the stand-in server is reachable at
+        installers     (int):  Number of InstallAssistant products in the catalog
+        ipsws          (int):  Number of macOS IPSWs in AppleDB
+        payload_size   (int):  Size of each payload in bytes
+        extra_products (int):  Non-installer products added to the catalog, as in Apple's catalogs
+        seed           (int):  Seed for payload contents
+    """
+
+    def __init__(self,
+                 directory: Path,
+                 base_url: str,
+                 installers: int = 2,
+                 ipsws: int = 2,
+                 payload_size: int = 32 * 1024 * 1024,
+                 extra_products: int = 20,
+                 seed: int = 0
+                ) -> None:
+        self.directory:      Path = Path(directory)
+        self.base_url:       str  = base_url.rstrip("/")
+        self.installers:     int  = installers
+        self.ipsws:          int  = ipsws
+        self.payload_size:   int  = payload_size
+        self.extra_products: int  = extra_products
+
+        self._random = random.Random(seed)
+
+        # URL path to file on disk, or to in-memory contents
+        self.files:     dict = {}
+        self.documents: dict = {}
+
+        self.catalog_products: list = []
+        self.apple_db_items:   list = []
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._generate_installers()
+        self._generate_ipsws()
+
+
+    def _write_payload(self, path: Path, magic: bytes) -> tuple:
+        """
+        Write a random payload starting with the given magic
+
+        Returns:
+            tuple: (ChunklistWriter, sha1 hexdigest) of the payload
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        writer = ChunklistWriter()
+        sha1   = hashlib.sha1()
+
+        remaining = self.payload_size
+        with path.open("wb") as file:
+            data = magic + self._random.randbytes(min(remaining, 1024 * 1024) - len(magic))
+            while remaining > 0:
+                data = data[:remaining]
+                file.write(data)
+                writer.update(data)
+                sha1.update(data)
+                remaining -= len(data)
+                data = self._random.randbytes(min(remaining, 1024 * 1024))
+
+        return writer, sha1.hexdigest()
+
+
+    def _generate_installers(self) -> None:
+        post_date = datetime.datetime(2024, 1, 1)
+        for index in range(self.installers):
+            product_id = f"000-{index:05d}"
+            version    = f"14.{index}"
+            build      = f"23{chr(ord('A') + index)}{100 + index}"
+            prefix     = f"/content/downloads/{product_id}"
+
+            writer, _ = self._write_payload(self.directory / product_id / "InstallAssistant.pkg", b"xar!")
+            integrity_data = writer.finalize()
+
+            self.files[f"{prefix}/InstallAssistant.pkg"] = self.directory / product_id / "InstallAssistant.pkg"
+            self.documents[f"{prefix}/InstallAssistant.pkg.integrityDataV1"] = integrity_data
+            self.documents[f"{prefix}/com_apple_MobileAsset_MacSoftwareUpdate.plist"] = plistlib.dumps({
+                "Assets": [{
+                    "Build":                 build,
+                    "OSVersion":             version,
+                    "SupportedDeviceModels": ["VMM-x86_64", "Mac-27AD2F918AE68F61"],
+                }]
+            })
+            self.documents[f"{prefix}/{product_id}.English.dist"] = (
+                f'<?xml version="1.0" encoding="utf-8"?><installer-gui-script minSpecVersion="2">'
+                f'<title>macOS Sonoma</title><auxinfo><dict><key>BUILD</key><string>{build}</string>'
+                f'<key>VERSION</key><string>{version}</string></dict></auxinfo></installer-gui-script>'
+            ).encode()
+
+            self.catalog_products.append({
+                "ProductID": product_id,
+                "Build":     build,
+                "Version":   version,
+                "Product": {
+                    "PostDate": post_date + datetime.timedelta(days=index),
+                    "ExtendedMetaInfo": {
+                        "InstallAssistantPackageIdentifiers": {
+                            "SharedSupport": "com.apple.pkg.InstallAssistant.macOSSonoma",
+                        }
+                    },
+                    "Distributions": {
+                        "English": f"{self.base_url}{prefix}/{product_id}.English.dist",
+                    },
+                    "Packages": [
+                        {
+                            "URL":               f"{self.base_url}{prefix}/InstallAssistant.pkg",
+                            "Size":              self.payload_size,
+                            "IntegrityDataURL":  f"{self.base_url}{prefix}/InstallAssistant.pkg.integrityDataV1",
+                            "IntegrityDataSize": len(integrity_data),
+                        },
+                        {
+                            "URL":  f"{self.base_url}{prefix}/com_apple_MobileAsset_MacSoftwareUpdate.plist",
+                            "Size": len(self.documents[f"{prefix}/com_apple_MobileAsset_MacSoftwareUpdate.plist"]),
+                        },
+                    ],
+                },
+            })
+
+
+    def _generate_ipsws(self) -> None:
+        for index in range(self.ipsws):
+            version = f"15.{index}"
+            build   = f"24{chr(ord('A') + index)}{200 + index}"
+            name    = f"UniversalMac_{version}_{build}_Restore.ipsw"
+            path    = f"/ipsw/{build}/{name}"
+
+            _, sha1 = self._write_payload(self.directory / "ipsw" / build / name, b"PK\x03\x04")
+            self.files[path] = self.directory / "ipsw" / build / name
+
+            self.apple_db_items.append({
+                "osStr":    "macOS",
+                "version":  version,
+                "build":    build,
+                "released": f"2024-09-{index + 1:02d}",
+                "beta":     False,
+                "appledbWebImage": {"id": "Sequoia"},
+                "sources": [{
+                    "type":   "ipsw",
+                    "links":  [{"url": f"{self.base_url}{path}", "preferred": True, "active": True}],
+                    "hashes": {"sha1": sha1},
+                }],
+            })
+
+
+    def catalog(self) -> bytes:
+        """
+        Software Update Catalog listing every installer, alongside unrelated products
+        """
+        products = {entry["ProductID"]: entry["Product"] for entry in self.catalog_products}
+        for index in range(self.extra_products):
+            # Pairs of products share a payload, as updates re-listed across products do
+            path = f"/content/downloads/001-{index // 2:05d}/Update.pkg"
+            if path not in self.documents:
+                self.documents[path] = b"xar!" + self._random.randbytes(1020)
+            products[f"001-{index:05d}"] = {
+                "PostDate": datetime.datetime(2023, 1, 1) + datetime.timedelta(days=index),
+                "Packages": [{
+                    "URL":    f"{self.base_url}{path}",
+                    "Size":   len(self.documents[path]),
+                    "Digest": hashlib.sha1(self.documents[path]).hexdigest(),
+                }],
+            }
+
+        return plistlib.dumps({
+            "CatalogVersion": 2,
+            "ApplePostURL":   f"{self.base_url}/",
+            "IndexDate":      datetime.datetime(2024, 10, 1),
+            "Products":       products,
+        })
+
+
+    def apple_db(self) -> bytes:
+        """
+        AppleDB main.json, with unrelated iOS entries ahead of the macOS ones
+        """
+        entries = [
+            {
+                "osStr":    "iOS",
+                "version":  f"17.{index}",
+                "build":    f"21A{300 + index}",
+                "released": "2023-09-18",
+                "beta":     False,
+                "sources":  [{"type": "ipsw", "links": [{"url": f"{self.base_url}/ipsw/ios/iPhone_{index}.ipsw"}]}],
+            }
+            for index in range(self.extra_products)
+        ]
+        entries += self.apple_db_items
+
+        return json.dumps({
+            "ios":    entries,
+            "device": [{"name": "Mac", "key": "Mac"}],
+        }).encode()
@@ -0,0 +1,379 @@
+"""
+server.py: Local HTTP stand-in for the Apple CDN, AppleDB and archive.org
+
+Routes:
+- /content/catalogs/...              Software Update Catalogs (same catalog for every seed/version)
+- /content/downloads/...             InstallAssistant.pkg, integrityDataV1 and metadata
+- /appledb/main.json                 AppleDB
+- /ipsw/...                          IPSWs
+- /advancedsearch.php, /metadata/... archive.org search and metadata of uploaded items
+- /download/<identifier>/<file>      Files of uploaded items
+- /s3/<identifier>/<file>            IA-S3 uploads, single PUT and multipart
+"""
+
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import email.utils
+import urllib.parse
+import http.server
+
+from pathlib import Path
+
+from .fixtures import StandinFixtures
+
+
+class StandinServer:
+    """
+    Serve synthetic fixtures with configurable latency and bandwidth
+
+    Parameters:
+        directory  (Path):  Where to write payloads and uploaded items
+        latency    (float): Seconds added before every response
+        bandwidth  (float): Bytes per second per connection, None for unlimited
+        host       (str):   Address to bind
+        port       (int):   Port to bind, 0 for any free port
+        **fixtures:         Passed to StandinFixtures (ex. installers, payload_size)
+
+    Usage:
+        >>> with StandinServer("/tmp/standin", latency=0.05, bandwidth=50 * 1000 * 1000) as server:
+        ...     sync_obj = macOSSync("key", "secret", endpoints=server.endpoints)
+        ...     sync_obj.iterate_catalog()
+    """
+
+    def __init__(self,
+                 directory: Path,
+                 latency: float = 0.0,
+                 bandwidth: float = None,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 **fixtures
+                ) -> None:
+        self.directory: Path  = Path(directory)
+        self.latency:   float = latency
+        self.bandwidth: float = bandwidth
+
+        self._httpd  = http.server.ThreadingHTTPServer((host, port), _StandinHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.standin = self
+        self._thread = None
+
+        self.url: str = f"http://{host}:{self._httpd.server_address[1]}"
+
+        self.fixtures: StandinFixtures = StandinFixtures(self.directory / "fixtures", self.url, **fixtures)
+
+        # Uploaded items: identifier to {"Metadata": dict, "Files": {name: Path}}
+        self.items:    dict = {}
+        self.uploads:  dict = {}
+        self.requests: int  = 0
+
+        self._lock = threading.Lock()
+
+
+    @property
+    def endpoints(self) -> dict:
+        """
+        Endpoint overrides for macOSSync
+        """
+        return {
+            "Catalog": f"{self.url}/content/catalogs",
+            "AppleDB": f"{self.url}/appledb/main.json",
+            "Archive": self.url,
+            "S3":      f"{self.url}/s3",
+        }
+
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+    def __enter__(self) -> "StandinServer":
+        self.start()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+    def _store_item(self, identifier: str, name: str, source: Path, metadata: dict) -> None:
+        destination = self.directory / "archive" / identifier / name
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(source, destination)
+
+        with self._lock:
+            item = self.items.setdefault(identifier, {"Metadata": {}, "Files": {}})
+            item["Metadata"].update(metadata)
+            item["Files"][name] = destination
+
+
+    def search(self, query: str) -> list:
+        """
+        Minimal Lucene subset, 'title:(A AND B)' matches items whose title contains every term
+        """
+        terms = []
+        if "title:(" in query:
+            terms = [term.strip() for term in query.split("title:(", 1)[1].rsplit(")", 1)[0].split(" AND ")]
+
+        with self._lock:
+            return [
+                {"identifier": identifier, **item["Metadata"]}
+                for identifier, item in self.items.items()
+                if all(term in item["Metadata"].get("title", "") for term in terms)
+            ]
+
+
+class _StandinHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+    @property
+    def standin(self) -> StandinServer:
+        return self.server.standin
+
+
+    def _begin(self) -> tuple:
+        with self.standin._lock:
+            self.standin.requests += 1
+        if self.standin.latency:
+            time.sleep(self.standin.latency)
+
+        url = urllib.parse.urlparse(self.path)
+        return url.path, urllib.parse.parse_qs(url.query, keep_blank_values=True)
+
+
+    def _throttle(self, sent: int, start: float) -> None:
+        if not self.standin.bandwidth:
+            return
+        delay = sent / self.standin.bandwidth - (time.time() - start)
+        if delay > 0:
+            time.sleep(delay)
+
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = {}) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+    def _send_json(self, data) -> None:
+        self._send(200, json.dumps(data).encode(), {"Content-Type": "application/json"})
+
+
+    def _send_file(self, path: Path) -> None:
+        """
+        Send a file, honouring single Range requests and the bandwidth limit
+        """
+        size   = path.stat().st_size
+        offset = 0
+        length = size
+        status = 200
+
+        byte_range = self.headers.get("Range")
+        if byte_range and byte_range.startswith("bytes="):
+            first, last = byte_range[len("bytes="):].split("-")
+            offset = int(first)
+            length = min(int(last) if last else size - 1, size - 1) - offset + 1
+            status = 206
+
+        modified = path.stat().st_mtime
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", f'"{size:x}-{int(modified):x}"')
+        self.send_header("Last-Modified", email.utils.formatdate(modified, usegmt=True))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {offset}-{offset + length - 1}/{size}")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        start = time.time()
+        sent  = 0
+        with path.open("rb") as file:
+            file.seek(offset)
+            while sent < length:
+                data = file.read(min(1024 * 1024, length - sent))
+                if not data:
+                    break
+                self.wfile.write(data)
+                sent += len(data)
+                self._throttle(sent, start)
+
+
+    def _read_body(self, destination: Path = None) -> bytes:
+        """
+        Read the request body, streaming to a file if given, under the bandwidth limit
+        """
+        length = int(self.headers.get("Content-Length", 0))
+        start  = time.time()
+        read   = 0
+
+        digest = hashlib.md5()
+        chunks = []
+        file   = destination.open("wb") if destination else None
+        try:
+            while read < length:
+                data = self.rfile.read(min(1024 * 1024, length - read))
+                if not data:
+                    break
+                digest.update(data)
+                if file:
+                    file.write(data)
+                else:
+                    chunks.append(data)
+                read += len(data)
+                self._throttle(read, start)
+        finally:
+            if file:
+                file.close()
+
+        self._md5 = digest.hexdigest()
+        return b"".join(chunks)
+
+
+    def _metadata(self) -> dict:
+        metadata = {}
+        for key, value in self.headers.items():
+            if not key.lower().startswith("x-archive-meta-"):
+                continue
+            if value.startswith("uri(") and value.endswith(")"):
+                value = urllib.parse.unquote(value[len("uri("):-1])
+            metadata[key[len("x-archive-meta-"):].lower()] = value
+        return metadata
+
+
+    def do_HEAD(self) -> None:
+        self.do_GET()
+
+
+    def do_GET(self) -> None:
+        path, query = self._begin()
+        fixtures = self.standin.fixtures
+
+        if path.startswith("/content/catalogs/"):
+            return self._send(200, fixtures.catalog(), {"Content-Type": "application/xml"})
+        if path == "/appledb/main.json":
+            if self.headers.get("If-None-Match") == '"standin"':
+                return self._send(304)
+            return self._send(200, fixtures.apple_db(), {"Content-Type": "application/json", "ETag": '"standin"'})
+        if path in fixtures.files:
+            return self._send_file(fixtures.files[path])
+        if path in fixtures.documents:
+            return self._send(200, fixtures.documents[path], {"Content-Type": "application/octet-stream", "ETag": f'"{hashlib.sha1(fixtures.documents[path]).hexdigest()}"'})
+
+        if path == "/advancedsearch.php":
+            fields = query.get("fl[]", ["identifier"])
+            docs = [{field: doc[field] for field in fields if field in doc} for doc in self.standin.search(query.get("q", [""])[0])]
+            return self._send_json({"response": {"numFound": len(docs), "docs": docs}})
+
+        if path.startswith("/metadata/"):
+            item = self.standin.items.get(path[len("/metadata/"):])
+            if item is None:
+                return self._send_json({})
+            return self._send_json({
+                "metadata": item["Metadata"],
+                "files":    [{"name": name, "size": str(file.stat().st_size)} for name, file in item["Files"].items()],
+            })
+
+        if path.startswith("/download/"):
+            identifier, _, name = path[len("/download/"):].partition("/")
+            item = self.standin.items.get(identifier)
+            name = urllib.parse.unquote(name)
+            if item is None or name not in item["Files"]:
+                return self._send(404)
+            return self._send_file(item["Files"][name])
+
+        if path.startswith("/s3/") and "uploadId" in query:
+            parts = self.standin.uploads.get(query["uploadId"][0])
+            if parts is None:
+                return self._send(404)
+            body = "".join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>\"{etag}\"</ETag><Size>{file.stat().st_size}</Size></Part>"
+                for number, (file, etag) in sorted(parts["Parts"].items())
+            )
+            return self._send(200, f'<ListPartsResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">{body}<IsTruncated>false</IsTruncated></ListPartsResult>'.encode())
+
+        self._send(404)
+
+
+    def do_PUT(self) -> None:
+        path, query = self._begin()
+        if not path.startswith("/s3/"):
+            self._read_body()
+            return self._send(404)
+
+        identifier, _, name = path[len("/s3/"):].partition("/")
+        name = urllib.parse.unquote(name)
+
+        staging = self.standin.directory / "staging"
+        staging.mkdir(parents=True, exist_ok=True)
+
+        if "uploadId" in query:
+            upload = self.standin.uploads.get(query["uploadId"][0])
+            if upload is None:
+                self._read_body()
+                return self._send(404)
+            part = staging / f"{query['uploadId'][0]}.{query['partNumber'][0]}"
+            self._read_body(part)
+            upload["Parts"][int(query["partNumber"][0])] = (part, self._md5)
+            return self._send(200, headers={"ETag": f'"{self._md5}"'})
+
+        metadata = self._metadata()
+        temp = staging / uuid.uuid4().hex
+        self._read_body(temp)
+        self.standin._store_item(identifier, name, temp, metadata)
+        self._send(200, headers={"ETag": f'"{self._md5}"'})
+
+
+    def do_POST(self) -> None:
+        path, query = self._begin()
+        if not path.startswith("/s3/"):
+            self._read_body()
+            return self._send(404)
+
+        identifier, _, name = path[len("/s3/"):].partition("/")
+        name = urllib.parse.unquote(name)
+
+        if "uploads" in query:
+            self._read_body()
+            upload_id = uuid.uuid4().hex
+            self.standin.uploads[upload_id] = {"Metadata": self._metadata(), "Parts": {}}
+            return self._send(200, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>".encode())
+
+        if "uploadId" in query:
+            self._read_body()
+            upload = self.standin.uploads.pop(query["uploadId"][0], None)
+            if upload is None:
+                return self._send(404)
+
+            temp = self.standin.directory / "staging" / uuid.uuid4().hex
+            with temp.open("wb") as file:
+                for number, (part, _) in sorted(upload["Parts"].items()):
+                    with part.open("rb") as source:
+                        shutil.copyfileobj(source, file)
+                    part.unlink()
+            self.standin._store_item(identifier, name, temp, upload["Metadata"])
+            return self._send(200, b"<CompleteMultipartUploadResult/>")
+
+        self._send(404)
@@ -47,6 +47,37 @@ sucatalog: Python module for querying Apple's Software Update Catalog, supportin
     }
 ]
 
+### Parse Software Update Catalog - Lazily
+
+`iter_products()` yields each product as soon as its metadata is resolved, optionally ordered by PostDate and filtered by seed, version range and XNU major. Consumers stopping early skip resolving the rest.
+
+>>> import sucatalog
+
+>>> products = sucatalog.CatalogProducts(catalog).iter_products(order="newest", seeds=[sucatalog.SeedType.PublicRelease], min_version="14.0")
+>>> latest = next(products, None)
+
+### Parse in worker processes
+
+`CatalogParser` parses raw catalogs and product metadata in a process pool, returning compact InstallAssistant records that `CatalogProducts` accepts as-is.
+
+>>> import sucatalog
+
+>>> with sucatalog.CatalogParser(workers=4) as parser:
+...     catalog  = parser.parse_catalog(sucatalog.CatalogURL().url_data)
+...     products = sucatalog.CatalogProducts(catalog, parser=parser).products
+
+### Record catalog history
+
+`CatalogHistory` keeps every fetched catalog as per-product deltas on top of periodic compressed snapshots.
+
+>>> import sucatalog
+
+>>> history = sucatalog.CatalogHistory("catalog_history.sqlite")
+>>> history.record("SEQUOIA/PublicRelease", catalog)
+>>> history.reconstruct("SEQUOIA/PublicRelease", timestamp=1718900000)
+>>> history.first_seen("052-96247")
+{'Catalog': 'SEQUOIA/PublicRelease', 'Timestamp': 1716225501.0, 'Revision': 0}
+
 ### Parse Software Update Catalog - All products
 
 By default, `CatalogProducts` will only return InstallAssistants. To get all products, set `install_assistants_only=False`.
@@ -108,4 +139,7 @@ By default, `CatalogProducts` will only return InstallAssistants. To get all pro
 
 from .url       import CatalogURL
 from .constants import CatalogVersion, SeedType
-from .products  import CatalogProducts
\ No newline at end of file
+from .products  import CatalogProducts
+from .history   import CatalogHistory
+from .parsing   import CatalogParser
+
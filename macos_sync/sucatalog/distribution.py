@@ -0,0 +1,123 @@
+"""
+distribution.py: Resolve Title, Build and Version from distribution files
+
+Distribution files are read in a single pass, the format sniffed from the
+leading bytes:
+
+- Binary plists are loaded directly
+- XML (distribution scripts and XML plists) is streamed with iterparse:
+  - Title from the first <title>, placeholder titles (ex. SU_TITLE) resolved
+    from the first SU_TITLE in any localization strings, before or after it
+  - Build and Version from the top-level <dict> (ex. <auxinfo>'s)
+  - Parsing stops once all three are known, skipping the rest of the file
+"""
+
+import io
+import re
+import plistlib
+
+import xml.etree.ElementTree as ET
+
+
+# Titles that refer to a localized string rather than naming the product
+PLACEHOLDER_TITLES = ["SU_TITLE", "MANUAL_TITLE", "MAN_TITLE"]
+
+# Dictionary keys holding the build and version, later keys take precedence
+BUILD_KEYS   = ["macOSProductBuildVersion", "BUILD"]
+VERSION_KEYS = ["macOSProductVersion", "VERSION"]
+
+SU_TITLE_PATTERN = re.compile(r'"SU_TITLE"\s*=\s*"(.*)";')
+
+
+def _apply_keys(product_map: dict, contents: dict) -> None:
+    for key in BUILD_KEYS:
+        if key in contents:
+            product_map["Build"] = contents[key]
+    for key in VERSION_KEYS:
+        if key in contents:
+            product_map["Version"] = contents[key]
+
+
+def _dict_strings(element: ET.Element) -> dict:
+    """
+    String values of a plist <dict> element, by key
+    """
+    contents = {}
+    children = list(element)
+    for key, value in zip(children[::2], children[1::2]):
+        if key.tag == "key" and value.tag == "string":
+            contents[key.text] = value.text or ""
+    return contents
+
+
+def _parse_xml(data: bytes, product_map: dict) -> None:
+    title_found = False
+    title_placeholder = False
+    dict_found = False
+
+    # First SU_TITLE from any <strings>, which may come before or after <title>
+    su_title = None
+
+    # Elements enclosing the current one, to tell a top-level dict from a nested one
+    stack = []
+    try:
+        for event, element in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+            if event == "start":
+                stack.append(element.tag)
+                continue
+            stack.pop()
+
+            if element.tag == "title" and not title_found:
+                title_found = True
+                product_map["Title"] = element.text
+                title_placeholder = element.text in PLACEHOLDER_TITLES
+            elif element.tag == "dict" and not dict_found and not any(tag in ["dict", "array"] for tag in stack):
+                dict_found = True
+                _apply_keys(product_map, _dict_strings(element))
+            elif element.tag == "strings" and su_title is None:
+                title_search = SU_TITLE_PATTERN.search(element.text or "")
+                if title_search:
+                    su_title = title_search.group(1)
+
+            if title_placeholder and su_title is not None:
+                product_map["Title"] = su_title
+                title_placeholder = False
+
+            if title_found and not title_placeholder and dict_found:
+                break
+
+            # Children of the root are done with, drop them (ex. large <script> blocks)
+            if len(stack) == 1:
+                element.clear()
+    except ET.ParseError:
+        # Keep whatever was resolved before the malformed part
+        pass
+
+
+def parse_distribution(data: bytes) -> dict:
+    """
+    Resolve Title, Build and Version from a distribution file
+
+    Parameters:
+        data (bytes): Distribution file, or a plist
+
+    Returns:
+        dict: Title, Build and Version, None where not found
+    """
+    product_map = {
+        "Title":   None,
+        "Build":   None,
+        "Version": None,
+    }
+
+    if data.startswith(b"bplist"):
+        try:
+            contents = plistlib.loads(data)
+        except (plistlib.InvalidFileException, ValueError):
+            return product_map
+        if isinstance(contents, dict):
+            _apply_keys(product_map, contents)
+        return product_map
+
+    _parse_xml(data, product_map)
+    return product_map
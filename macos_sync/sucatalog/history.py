@@ -0,0 +1,282 @@
+"""
+history.py: Compact history of Software Update Catalog snapshots
+
+Each recorded catalog is stored as a delta of its product entries (added,
+changed and removed) against the previous revision, with a compressed full
+snapshot every snapshot_interval revisions. Reconstructing a past catalog
+replays at most snapshot_interval deltas onto the nearest earlier snapshot.
+
+An index of product first and last appearances is maintained as revisions are
+recorded, so provenance questions don't require replaying the history.
+"""
+
+import zlib
+import time
+import sqlite3
+import plistlib
+import threading
+import contextlib
+
+from pathlib import Path
+
+
+class CatalogHistory:
+    """
+    SQLite store of catalog revisions
+
+    Parameters:
+        path              (Path): Database file, created if missing
+        snapshot_interval (int):  Revisions between full snapshots, at a 4 hour sync
+                                  interval the default snapshots weekly
+
+    Usage:
+        >>> history = CatalogHistory("catalog_history.sqlite")
+        >>> history.record("SEQUOIA/PublicRelease", CatalogURL().url_contents)
+        >>> catalog = history.reconstruct("SEQUOIA/PublicRelease", timestamp=time.time() - 30 * 24 * 60 * 60)
+        >>> history.first_seen("072-12345")
+        {'Catalog': 'SEQUOIA/PublicRelease', 'Timestamp': 1718900000.0, 'Revision': 12}
+    """
+
+    def __init__(self, path: Path, snapshot_interval: int = 42) -> None:
+        self.path:              Path = Path(path)
+        self.snapshot_interval: int  = snapshot_interval
+
+        self._lock = threading.Lock()
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS revisions ("
+                "catalog TEXT, revision INTEGER, timestamp REAL, kind TEXT, data BLOB, "
+                "PRIMARY KEY (catalog, revision)"
+                ")"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                "catalog TEXT, product_id TEXT, first_seen REAL, first_revision INTEGER, last_seen REAL, removed REAL, "
+                "PRIMARY KEY (catalog, product_id)"
+                ")"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS products_by_id ON products (product_id, first_seen)")
+
+
+    def _connect(self) -> contextlib.closing:
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        return contextlib.closing(sqlite3.connect(self.path, timeout=60, isolation_level=None))
+
+
+    @staticmethod
+    def _pack(data: dict) -> bytes:
+        return zlib.compress(plistlib.dumps(data, fmt=plistlib.FMT_BINARY, sort_keys=False), 9)
+
+
+    @staticmethod
+    def _unpack(data: bytes) -> dict:
+        return plistlib.loads(zlib.decompress(data))
+
+
+    @staticmethod
+    def _apply(catalog: dict, delta: dict) -> dict:
+        products = catalog.get("Products", {})
+        for product in delta["Removed"]:
+            products.pop(product, None)
+        products.update(delta["Added"])
+        products.update(delta["Changed"])
+        return {**delta["Header"], "Products": products}
+
+
+    def _load(self, connection: sqlite3.Connection, catalog: str, revision: int) -> dict:
+        """
+        Replay deltas onto the nearest snapshot at or before a revision
+        """
+        base = connection.execute(
+            "SELECT MAX(revision) FROM revisions WHERE catalog = ? AND revision <= ? AND kind = 'snapshot'",
+            (catalog, revision)
+        ).fetchone()[0]
+        if base is None:
+            return None
+
+        rows = connection.execute(
+            "SELECT kind, data FROM revisions WHERE catalog = ? AND revision >= ? AND revision <= ? ORDER BY revision",
+            (catalog, base, revision)
+        ).fetchall()
+
+        contents = self._unpack(rows[0][1])
+        for _, data in rows[1:]:
+            contents = self._apply(contents, self._unpack(data))
+        return contents
+
+
+    def record(self, catalog: str, contents: dict, timestamp: float = None) -> int:
+        """
+        Record a fetched catalog
+
+        Parameters:
+            catalog   (str):   Identifier of the catalog, ex. 'SEQUOIA/PublicRelease'
+            contents  (dict):  Parsed catalog
+            timestamp (float): When the catalog was fetched, defaults to now
+
+        Returns:
+            int: New revision, or None if the products are unchanged since the last revision
+        """
+        timestamp = timestamp or time.time()
+        products  = contents.get("Products", {})
+        header    = {key: value for key, value in contents.items() if key != "Products"}
+
+        with self._lock, self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                latest, last_snapshot = connection.execute(
+                    "SELECT MAX(revision), MAX(CASE WHEN kind = 'snapshot' THEN revision END) FROM revisions WHERE catalog = ?",
+                    (catalog,)
+                ).fetchone()
+
+                previous = self._load(connection, catalog, latest) if latest is not None else {}
+                previous_products = previous.get("Products", {})
+
+                delta = {
+                    "Header":  header,
+                    "Added":   {product: entry for product, entry in products.items() if product not in previous_products},
+                    "Changed": {product: entry for product, entry in products.items() if product in previous_products and previous_products[product] != entry},
+                    "Removed": [product for product in previous_products if product not in products],
+                }
+                if latest is not None and not any([delta["Added"], delta["Changed"], delta["Removed"]]):
+                    connection.execute(
+                        "UPDATE products SET last_seen = ? WHERE catalog = ? AND removed IS NULL",
+                        (timestamp, catalog)
+                    )
+                    connection.execute("COMMIT")
+                    return None
+
+                revision = 0 if latest is None else latest + 1
+                if last_snapshot is None or revision - last_snapshot >= self.snapshot_interval:
+                    kind, data = "snapshot", self._pack(contents)
+                else:
+                    kind, data = "delta", self._pack(delta)
+
+                connection.execute(
+                    "INSERT INTO revisions (catalog, revision, timestamp, kind, data) VALUES (?, ?, ?, ?, ?)",
+                    (catalog, revision, timestamp, kind, data)
+                )
+                connection.executemany(
+                    "INSERT INTO products (catalog, product_id, first_seen, first_revision, last_seen, removed) VALUES (?, ?, ?, ?, ?, NULL) "
+                    "ON CONFLICT(catalog, product_id) DO UPDATE SET removed = NULL",
+                    [(catalog, product, timestamp, revision, timestamp) for product in delta["Added"]]
+                )
+                # Mark removals first, so products no longer listed keep their last_seen
+                connection.executemany(
+                    "UPDATE products SET removed = ? WHERE catalog = ? AND product_id = ?",
+                    [(timestamp, catalog, product) for product in delta["Removed"]]
+                )
+                connection.execute(
+                    "UPDATE products SET last_seen = ? WHERE catalog = ? AND removed IS NULL",
+                    (timestamp, catalog)
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+        return revision
+
+
+    def catalogs(self) -> list:
+        """
+        Identifiers of every recorded catalog
+        """
+        with self._connect() as connection:
+            return [row[0] for row in connection.execute("SELECT DISTINCT catalog FROM revisions ORDER BY catalog")]
+
+
+    def revisions(self, catalog: str) -> list:
+        """
+        Recorded revisions of a catalog, oldest first
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT revision, timestamp, kind, LENGTH(data) FROM revisions WHERE catalog = ? ORDER BY revision",
+                (catalog,)
+            ).fetchall()
+
+        return [
+            {
+                "Revision":  revision,
+                "Timestamp": timestamp,
+                "Kind":      kind,
+                "Size":      size,
+            }
+            for revision, timestamp, kind, size in rows
+        ]
+
+
+    def reconstruct(self, catalog: str, timestamp: float = None, revision: int = None) -> dict:
+        """
+        Rebuild a catalog as it was at a point in time
+
+        Parameters:
+            catalog   (str):   Identifier of the catalog
+            timestamp (float): Rebuild the latest revision recorded at or before this time
+            revision  (int):   Rebuild a specific revision, takes precedence over timestamp
+
+        Returns:
+            dict: Catalog contents, or None if nothing was recorded by then
+        """
+        with self._connect() as connection:
+            if revision is None:
+                revision = connection.execute(
+                    "SELECT MAX(revision) FROM revisions WHERE catalog = ? AND timestamp <= ?",
+                    (catalog, timestamp if timestamp is not None else float("inf"))
+                ).fetchone()[0]
+                if revision is None:
+                    return None
+
+            return self._load(connection, catalog, revision)
+
+
+    def first_seen(self, product_id: str, catalog: str = None) -> dict:
+        """
+        When a product first appeared, in any catalog or a specific one
+
+        Returns:
+            dict: Catalog, Timestamp and Revision of the first appearance, or None if never seen
+        """
+        query = "SELECT catalog, first_seen, first_revision FROM products WHERE product_id = ?"
+        parameters = [product_id]
+        if catalog is not None:
+            query += " AND catalog = ?"
+            parameters.append(catalog)
+
+        with self._connect() as connection:
+            row = connection.execute(query + " ORDER BY first_seen LIMIT 1", parameters).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "Catalog":   row[0],
+            "Timestamp": row[1],
+            "Revision":  row[2],
+        }
+
+
+    def appearances(self, product_id: str) -> list:
+        """
+        Every catalog a product was listed in, with first and last sighting
+
+        Returns:
+            list: Catalog, FirstSeen, LastSeen and Removed (None if still listed) per catalog
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT catalog, first_seen, last_seen, removed FROM products WHERE product_id = ? ORDER BY first_seen",
+                (product_id,)
+            ).fetchall()
+
+        return [
+            {
+                "Catalog":   catalog,
+                "FirstSeen": first_seen,
+                "LastSeen":  last_seen,
+                "Removed":   removed,
+            }
+            for catalog, first_seen, last_seen, removed in rows
+        ]
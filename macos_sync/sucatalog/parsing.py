@@ -0,0 +1,164 @@
+"""
+parsing.py: Parse catalogs and product metadata in worker processes
+
+plistlib parsing of the large sucatalogs is CPU bound, so in-process it runs
+on one core at a time under the GIL. CatalogParser hands the raw bytes to a
+process pool instead. Workers return compact records rather than the full
+nested dicts, keeping pickling cheap:
+
+- Catalogs are reduced to their InstallAssistant products, each keeping only
+  the fields CatalogProducts reads (PostDate, the InstallAssistant and
+  metadata packages, English distribution and ServerMetadataURL)
+- Info.plist and MobileAsset plists are reduced to the properties used to
+  resolve version, build and seed
+
+Compact records keep the catalog's layout, so they can be passed to
+CatalogProducts as-is.
+"""
+
+import os
+import plistlib
+import multiprocessing
+import concurrent.futures
+
+from pathlib import Path
+
+from .products     import CatalogProducts
+from .distribution import parse_distribution
+
+
+# Packages whose fields are kept in compact catalogs, see CatalogProducts.resolve_product()
+RESOLVED_PACKAGES = ["InstallAssistant.pkg", "Info.plist", "com_apple_MobileAsset_MacSoftwareUpdate.plist"]
+
+# Asset properties kept in compact metadata plists
+ASSET_PROPERTIES = ["SupportedDeviceModels", "OSVersion", "Build"]
+
+
+def _compact_entry(entry: dict) -> dict:
+    compact = {
+        "PostDate":         entry["PostDate"],
+        "ExtendedMetaInfo": {"InstallAssistantPackageIdentifiers": entry["ExtendedMetaInfo"]["InstallAssistantPackageIdentifiers"]},
+    }
+
+    if "Packages" in entry:
+        compact["Packages"] = [
+            {key: package[key] for key in ["URL", "Size", "IntegrityDataURL", "IntegrityDataSize", "Digest"] if key in package}
+            for package in entry["Packages"]
+            if "URL" in package and Path(package["URL"]).name in RESOLVED_PACKAGES
+        ]
+
+    distributions = {language: url for language, url in entry.get("Distributions", {}).items() if language in ["English", "en"]}
+    if distributions:
+        compact["Distributions"] = distributions
+
+    if "ServerMetadataURL" in entry:
+        compact["ServerMetadataURL"] = entry["ServerMetadataURL"]
+
+    return compact
+
+
+def compact_catalog(data: bytes) -> dict:
+    """
+    Parse a catalog, keeping only compact InstallAssistant entries
+
+    Parameters:
+        data (bytes): Raw catalog plist
+
+    Returns:
+        dict: {"Products": {ProductID: entry}}
+    """
+    catalog  = plistlib.loads(data)
+    products = CatalogProducts(catalog)
+    return {
+        "Products": {
+            product: _compact_entry(entry)
+            for product, entry in catalog.get("Products", {}).items()
+            if products.is_install_assistant(product)
+        }
+    }
+
+
+def _compact_asset(asset: dict) -> dict:
+    compact = {key: asset[key] for key in ASSET_PROPERTIES if key in asset}
+    if "CatalogURL" in asset.get("BridgeVersionInfo", {}):
+        compact["BridgeVersionInfo"] = {"CatalogURL": asset["BridgeVersionInfo"]["CatalogURL"]}
+    return compact
+
+
+def compact_metadata(data: bytes) -> dict:
+    """
+    Parse an Info.plist or MobileAsset plist, keeping only the properties used to resolve a product
+
+    Returns:
+        dict: Compact plist, or None if the data isn't a plist
+    """
+    try:
+        contents = plistlib.loads(data)
+    except plistlib.InvalidFileException:
+        return None
+
+    compact = {}
+    if isinstance(contents.get("MobileAssetProperties"), dict):
+        compact["MobileAssetProperties"] = _compact_asset(contents["MobileAssetProperties"])
+    if isinstance(contents.get("Assets"), list):
+        compact["Assets"] = [_compact_asset(asset) for asset in contents["Assets"]]
+    if "CFBundleShortVersionString" in contents:
+        compact["CFBundleShortVersionString"] = contents["CFBundleShortVersionString"]
+    return compact
+
+
+class CatalogParser:
+    """
+    Process pool parsing catalogs and product metadata
+
+    Workers are spawned rather than forked, as the parent runs network threads.
+
+    Parameters:
+        workers (int): Worker processes, defaults to the CPU count
+
+    Usage:
+        >>> with CatalogParser(workers=4) as parser:
+        ...     catalog  = parser.parse_catalog(data)
+        ...     products = CatalogProducts(catalog, parser=parser).products
+    """
+
+    def __init__(self, workers: int = None) -> None:
+        self.workers: int = workers or os.cpu_count() or 1
+
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+
+    def __enter__(self) -> "CatalogParser":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def parse_catalog(self, data: bytes) -> dict:
+        """
+        Parse a catalog in a worker, see compact_catalog()
+        """
+        return self._executor.submit(compact_catalog, data).result()
+
+
+    def parse_metadata(self, data: bytes) -> dict:
+        """
+        Parse an Info.plist or MobileAsset plist in a worker, see compact_metadata()
+        """
+        return self._executor.submit(compact_metadata, data).result()
+
+
+    def parse_distribution(self, data: bytes) -> dict:
+        """
+        Resolve Title, Build and Version from a distribution file in a worker
+        """
+        return self._executor.submit(parse_distribution, data).result()
+
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
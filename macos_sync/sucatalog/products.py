@@ -2,19 +2,23 @@
 products.py: Parse products from Software Update Catalog
 """
 
-import re
 import plistlib
 
 import packaging.version
-import xml.etree.ElementTree as ET
 
 from pathlib   import Path
 from functools import cached_property
 
-from .url       import CatalogURL
-from .constants import CatalogVersion, SeedType
+from .url          import CatalogURL
+from .constants    import CatalogVersion, SeedType
+from .distribution import parse_distribution
 
 from ..network import utilities
+from .. import telemetry
+
+
+# Orders iter_products can yield products in
+PRODUCT_ORDERS = ["catalog", "newest", "oldest"]
 
 
 class CatalogProducts:
@@ -24,18 +28,21 @@ class CatalogProducts:
         install_assistants_only       (bool): Only list InstallAssistant products
         only_vmm_install_assistants   (bool): Only list VMM-x86_64-compatible InstallAssistant products
         max_install_assistant_version (CatalogVersion): Maximum InstallAssistant version to list
+        parser                        (CatalogParser):  Parse product metadata in worker processes, see parsing.py
     """
     def __init__(self,
                  catalog: dict,
                  install_assistants_only: bool = True,
                  only_vmm_install_assistants: bool = True,
-                 max_install_assistant_version: CatalogVersion = CatalogVersion.SEQUOIA
+                 max_install_assistant_version: CatalogVersion = CatalogVersion.SEQUOIA,
+                 parser: "CatalogParser" = None
                 ) -> None:
         self.catalog:             dict = catalog
         self.ia_only:             bool = install_assistants_only
         self.vmm_only:            bool = only_vmm_install_assistants
         self.max_ia_version: packaging = packaging.version.parse(f"{max_install_assistant_version.value}.99.99")
         self.max_ia_catalog: CatalogVersion = max_install_assistant_version
+        self.parser:         "CatalogParser" = parser
 
 
     def _legacy_parse_info_plist(self, data: dict) -> dict:
@@ -112,48 +119,19 @@ class CatalogProducts:
         return {}
 
 
-    def _parse_english_distributions(self, data: bytes) -> dict:
+    def _load_metadata(self, data: bytes) -> dict:
         """
-        Resolve Title, Build and Version from the English distribution file
+        Parse a metadata plist, in a worker process if a parser is set
+
+        Returns:
+            dict: Plist contents (compacted if parsed by a worker), or None if invalid
         """
+        if self.parser:
+            return self.parser.parse_metadata(data)
         try:
-            plist_contents = plistlib.loads(data)
+            return plistlib.loads(data)
         except plistlib.InvalidFileException:
-            plist_contents = None
-
-        try:
-            xml_contents = ET.fromstring(data)
-        except ET.ParseError:
-            xml_contents = None
-
-        _product_map = {
-            "Title":   None,
-            "Build":   None,
-            "Version": None,
-        }
-
-        if plist_contents:
-            if "macOSProductBuildVersion" in plist_contents:
-                _product_map["Build"] = plist_contents["macOSProductBuildVersion"]
-            if "macOSProductVersion" in plist_contents:
-                _product_map["Version"] = plist_contents["macOSProductVersion"]
-            if "BUILD" in plist_contents:
-                _product_map["Build"] = plist_contents["BUILD"]
-            if "VERSION" in plist_contents:
-                _product_map["Version"] = plist_contents["VERSION"]
-
-        if xml_contents:
-            # Fetch item title
-            item_title = xml_contents.find(".//title").text
-            if item_title in ["SU_TITLE", "MANUAL_TITLE", "MAN_TITLE"]:
-                # regex search the contents for the title
-                title_search = re.search(r'"SU_TITLE"\s*=\s*"(.*)";', data.decode("utf-8"))
-                if title_search:
-                    item_title = title_search.group(1)
-
-            _product_map["Title"] = item_title
-
-        return _product_map
+            return None
 
 
     def _build_installer_name(self, version: str, catalog: SeedType) -> str:
@@ -258,145 +236,217 @@ class CatalogProducts:
         """
         Returns a list of products from the sucatalog
         """
+        return sorted(self.iter_products(), key=lambda x: x["Version"])
 
-        catalog = self.catalog
 
-        _products = []
+    def iter_products(self,
+                      order: str = "catalog",
+                      seeds: list = None,
+                      min_version: str = None,
+                      max_version: str = None,
+                      xnu_major: int = None
+                     ):
+        """
+        Yield products from the sucatalog as each one's metadata is resolved
+
+        Ordering only uses the catalog entries, so it doesn't delay the first
+        product. Filters are applied once a product is resolved, as seed, version
+        and build are only known from its metadata.
+
+        Parameters:
+            order       (str):  'catalog' (as listed), 'newest' or 'oldest' PostDate first
+            seeds       (list): Only yield products from these SeedTypes
+            min_version (str):  Only yield products of at least this version
+            max_version (str):  Only yield products of at most this version
+            xnu_major   (int):  Only yield InstallAssistants of this XNU major version
+
+        Usage:
+            >>> products = CatalogProducts(catalog)
+            >>> latest = next(products.iter_products(order="newest", seeds=[SeedType.PublicRelease]), None)
+        """
+        if order not in PRODUCT_ORDERS:
+            raise ValueError(f"Unknown product order: {order}")
+
+        candidates = list(self.catalog["Products"])
+        if self.ia_only:
+            candidates = [product for product in candidates if self.is_install_assistant(product)]
+        if order != "catalog":
+            candidates.sort(key=lambda product: self.catalog["Products"][product]["PostDate"], reverse=order == "newest")
+
+        min_version = packaging.version.parse(min_version) if min_version else None
+        max_version = packaging.version.parse(max_version) if max_version else None
+
+        for product in candidates:
+            with telemetry.span("metadata_resolution", product=product):
+                _product_map = self.resolve_product(product)
+            if _product_map is None:
+                continue
 
-        for product in catalog["Products"]:
+            if seeds is not None and _product_map["Catalog"] not in seeds:
+                continue
 
-            # InstallAssistants.pkgs (macOS Installers) will have the following keys:
-            if self.ia_only:
-                if "ExtendedMetaInfo" not in catalog["Products"][product]:
+            if min_version or max_version:
+                try:
+                    version = packaging.version.parse(_product_map["Version"])
+                except packaging.version.InvalidVersion:
                     continue
-                if "InstallAssistantPackageIdentifiers" not in catalog["Products"][product]["ExtendedMetaInfo"]:
+                if min_version and version < min_version:
                     continue
-                if "SharedSupport" not in catalog["Products"][product]["ExtendedMetaInfo"]["InstallAssistantPackageIdentifiers"]:
+                if max_version and version > max_version:
                     continue
 
-            _product_map = {
-                "ProductID": product,
-                "PostDate":  catalog["Products"][product]["PostDate"],
-                "Title":     None,
-                "Build":     None,
-                "Version":   None,
-                "Catalog":   None,
-
-                # Optional keys if not InstallAssistant only:
-                # "Packages": None,
-
-                # Optional keys if InstallAssistant found:
-                # "InstallAssistant": {
-                #     "URL":       None,
-                #     "Size":      None,
-                #     "XNUMajor":  None,
-                #     "IntegrityDataURL":  None,
-                #     "IntegrityDataSize": None
-                # },
-            }
-
-            # InstallAssistant logic
-            if "Packages" in catalog["Products"][product]:
-                # Add packages to product map if not InstallAssistant only
-                if self.ia_only is False:
-                    _product_map["Packages"] = catalog["Products"][product]["Packages"]
-                for package in catalog["Products"][product]["Packages"]:
-                    if "URL" in package:
-                        if Path(package["URL"]).name == "InstallAssistant.pkg":
-                            _product_map["InstallAssistant"] = {
-                                "URL":               package["URL"],
-                                "Size":              package["Size"],
-                                "IntegrityDataURL":  package["IntegrityDataURL"],
-                                "IntegrityDataSize": package["IntegrityDataSize"]
-                            }
-
-                        if Path(package["URL"]).name not in ["Info.plist", "com_apple_MobileAsset_MacSoftwareUpdate.plist"]:
-                            continue
-
-                        net_obj = utilities.NetworkUtilities().get(package["URL"])
-                        if net_obj is None:
-                            continue
-
-                        contents = net_obj.content
-                        try:
-                            plist_contents = plistlib.loads(contents)
-                        except plistlib.InvalidFileException:
-                            continue
-
-                        if plist_contents:
-                            if Path(package["URL"]).name == "Info.plist":
-                                _product_map.update(self._legacy_parse_info_plist(plist_contents))
-                            else:
-                                _product_map.update(self._parse_mobile_asset_plist(plist_contents))
-
-            if _product_map["Version"] is not None:
-                _product_map["Title"] = self._build_installer_name(_product_map["Version"], _product_map["Catalog"])
-
-            # Fall back to English distribution if no version is found
-            if _product_map["Version"] is None:
-                url = None
-                if "Distributions" in catalog["Products"][product]:
-                    if "English" in catalog["Products"][product]["Distributions"]:
-                        url = catalog["Products"][product]["Distributions"]["English"]
-                    elif "en" in catalog["Products"][product]["Distributions"]:
-                        url = catalog["Products"][product]["Distributions"]["en"]
-
-                if url is None:
+            if xnu_major is not None:
+                if _product_map.get("InstallAssistant", {}).get("XNUMajor") != xnu_major:
                     continue
 
-                net_obj = utilities.NetworkUtilities().get(url)
-                if net_obj is None:
-                    continue
+            yield _product_map
 
-                contents = net_obj.content
 
-                _product_map.update(self._parse_english_distributions(contents))
+    def is_install_assistant(self, product: str) -> bool:
+        """
+        Check if a product is an InstallAssistant, without fetching any metadata
+        """
+        entry = self.catalog["Products"][product]
+        if "ExtendedMetaInfo" not in entry:
+            return False
+        if "InstallAssistantPackageIdentifiers" not in entry["ExtendedMetaInfo"]:
+            return False
+        if "SharedSupport" not in entry["ExtendedMetaInfo"]["InstallAssistantPackageIdentifiers"]:
+            return False
+        return True
 
-                if _product_map["Version"] is None:
-                    if "ServerMetadataURL" in catalog["Products"][product]:
-                        server_metadata_url = catalog["Products"][product]["ServerMetadataURL"]
 
-                        net_obj = utilities.NetworkUtilities().get(server_metadata_url)
-                        if net_obj is None:
-                            continue
+    def resolve_product(self, product: str) -> dict:
+        """
+        Resolve a single product's details, fetching its metadata as needed
 
-                        server_metadata_contents = net_obj.content
+        Parameters:
+            product (str): Product ID within the catalog
 
-                        try:
-                            server_metadata_plist = plistlib.loads(server_metadata_contents)
-                        except plistlib.InvalidFileException:
-                            pass
+        Returns:
+            dict: Product details, or None if the product is filtered out
+        """
 
-                        if "CFBundleShortVersionString" in server_metadata_plist:
-                            _product_map["Version"] = server_metadata_plist["CFBundleShortVersionString"]
+        catalog = self.catalog
 
+        # InstallAssistants.pkgs (macOS Installers) will have the following keys:
+        if self.ia_only:
+            if not self.is_install_assistant(product):
+                return None
 
-            if _product_map["Version"] is not None:
-                # Check if version is newer than the max version
-                if self.ia_only:
-                    try:
-                        if packaging.version.parse(_product_map["Version"]) > self.max_ia_version:
-                            continue
-                    except packaging.version.InvalidVersion:
-                        pass
+        _product_map = {
+            "ProductID": product,
+            "PostDate":  catalog["Products"][product]["PostDate"],
+            "Title":     None,
+            "Build":     None,
+            "Version":   None,
+            "Catalog":   None,
+
+            # Optional keys if not InstallAssistant only:
+            # "Packages": None,
+
+            # Optional keys if InstallAssistant found:
+            # "InstallAssistant": {
+            #     "URL":       None,
+            #     "Size":      None,
+            #     "XNUMajor":  None,
+            #     "IntegrityDataURL":  None,
+            #     "IntegrityDataSize": None
+            # },
+        }
 
-            if _product_map["Build"] is not None:
-                if "InstallAssistant" in _product_map:
-                    try:
-                        # Grab first 2 characters of build
-                        _product_map["InstallAssistant"]["XNUMajor"] = int(_product_map["Build"][:2])
-                    except ValueError:
-                        pass
+        # InstallAssistant logic
+        if "Packages" in catalog["Products"][product]:
+            # Add packages to product map if not InstallAssistant only
+            if self.ia_only is False:
+                _product_map["Packages"] = catalog["Products"][product]["Packages"]
+            for package in catalog["Products"][product]["Packages"]:
+                if "URL" in package:
+                    if Path(package["URL"]).name == "InstallAssistant.pkg":
+                        _product_map["InstallAssistant"] = {
+                            "URL":               package["URL"],
+                            "Size":              package["Size"],
+                            "IntegrityDataURL":  package["IntegrityDataURL"],
+                            "IntegrityDataSize": package["IntegrityDataSize"]
+                        }
+
+                    if Path(package["URL"]).name not in ["Info.plist", "com_apple_MobileAsset_MacSoftwareUpdate.plist"]:
+                        continue
+
+                    net_obj = utilities.NetworkUtilities().get(package["URL"])
+                    if net_obj is None:
+                        continue
+
+                    plist_contents = self._load_metadata(net_obj.content)
+
+                    if plist_contents:
+                        if Path(package["URL"]).name == "Info.plist":
+                            _product_map.update(self._legacy_parse_info_plist(plist_contents))
+                        else:
+                            _product_map.update(self._parse_mobile_asset_plist(plist_contents))
+
+        if _product_map["Version"] is not None:
+            _product_map["Title"] = self._build_installer_name(_product_map["Version"], _product_map["Catalog"])
+
+        # Fall back to English distribution if no version is found
+        if _product_map["Version"] is None:
+            url = None
+            if "Distributions" in catalog["Products"][product]:
+                if "English" in catalog["Products"][product]["Distributions"]:
+                    url = catalog["Products"][product]["Distributions"]["English"]
+                elif "en" in catalog["Products"][product]["Distributions"]:
+                    url = catalog["Products"][product]["Distributions"]["en"]
+
+            if url is None:
+                return None
+
+            net_obj = utilities.NetworkUtilities().get(url)
+            if net_obj is None:
+                return None
+
+            contents = net_obj.content
+
+            if self.parser:
+                _product_map.update(self.parser.parse_distribution(contents))
+            else:
+                _product_map.update(parse_distribution(contents))
 
-            # If version is still None, set to 0.0.0
             if _product_map["Version"] is None:
-                _product_map["Version"] = "0.0.0"
+                if "ServerMetadataURL" in catalog["Products"][product]:
+                    server_metadata_url = catalog["Products"][product]["ServerMetadataURL"]
+
+                    net_obj = utilities.NetworkUtilities().get(server_metadata_url)
+                    if net_obj is None:
+                        return None
+
+                    server_metadata_plist = self._load_metadata(net_obj.content)
 
-            _products.append(_product_map)
+                    if server_metadata_plist and "CFBundleShortVersionString" in server_metadata_plist:
+                        _product_map["Version"] = server_metadata_plist["CFBundleShortVersionString"]
 
-        _products = sorted(_products, key=lambda x: x["Version"])
 
-        return _products
+        if _product_map["Version"] is not None:
+            # Check if version is newer than the max version
+            if self.ia_only:
+                try:
+                    if packaging.version.parse(_product_map["Version"]) > self.max_ia_version:
+                        return None
+                except packaging.version.InvalidVersion:
+                    pass
+
+        if _product_map["Build"] is not None:
+            if "InstallAssistant" in _product_map:
+                try:
+                    # Grab first 2 characters of build
+                    _product_map["InstallAssistant"]["XNUMajor"] = int(_product_map["Build"][:2])
+                except ValueError:
+                    pass
+
+        # If version is still None, set to 0.0.0
+        if _product_map["Version"] is None:
+            _product_map["Version"] = "0.0.0"
+
+        return _product_map
 
 
     @cached_property
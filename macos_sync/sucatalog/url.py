@@ -17,6 +17,10 @@ from .constants import (
 )
 
 from ..network import utilities
+from .. import telemetry
+
+
+CATALOG_BASE_URL = "https://swscan.apple.com/content/catalogs"
 
 
 class CatalogURL:
@@ -27,15 +31,18 @@ class CatalogURL:
         version   (CatalogVersion):    Version of macOS
         seed      (SeedType):          Seed type
         extension (CatalogExtension):  Extension for the catalog URL
+        base_url  (str):               Catalog server, override to point at a local stand-in
     """
     def __init__(self,
                  version: CatalogVersion = CatalogVersion.SONOMA,
                  seed: SeedType = SeedType.PublicRelease,
-                 extension: CatalogExtension = CatalogExtension.PLIST
+                 extension: CatalogExtension = CatalogExtension.PLIST,
+                 base_url: str = CATALOG_BASE_URL
                  ) -> None:
         self.version   = version
         self.seed      = seed
         self.extension = extension
+        self.base_url  = base_url.rstrip("/")
 
         self.seed    = self._fix_seed_type()
         self.version = self._fix_version()
@@ -103,7 +110,7 @@ class CatalogURL:
         Constructs the catalog URL based on the seed type
         """
 
-        url: str = "https://swscan.apple.com/content/catalogs"
+        url: str = self.base_url
 
         if self.version == CatalogVersion.TIGER:
             url += "/index"
@@ -163,13 +170,31 @@ class CatalogURL:
         return self._construct_catalog_url()
 
 
+    @property
+    def url_data(self) -> bytes:
+        """
+        Return raw URL contents, ex. to be parsed by a CatalogParser
+        """
+        try:
+            with telemetry.span("catalog_fetch", url=self.url):
+                return utilities.NetworkUtilities().get(self.url).content
+        except Exception as e:
+            logging.error(f"Failed to fetch URL contents: {e}")
+            return None
+
+
     @property
     def url_contents(self) -> dict:
         """
         Return URL contents
         """
+        data = self.url_data
+        if data is None:
+            return None
+
         try:
-            return plistlib.loads(utilities.NetworkUtilities().get(self.url).content)
+            with telemetry.span("catalog_parse", url=self.url):
+                return plistlib.loads(data)
         except Exception as e:
-            logging.error(f"Failed to fetch URL contents: {e}")
+            logging.error(f"Failed to parse URL contents: {e}")
             return None
@@ -1,51 +1,270 @@
 """
-Goal is to download a single macOS installer and upload to archive.org
+Goal is to download macOS installers and upload them to archive.org
 """
 
 import time
-import internetarchive
+import urllib.parse
+import shutil
+import hashlib
+import logging
+import contextlib
+import concurrent.futures
 
 from pathlib import Path
 
-from . import sucatalog, integrity_verification
-from .network import download, human_fmt, NetworkUtilities
+from . import sucatalog, appledb, integrity_verification, audit, pipeline, planner, work_queue, telemetry, mirror
+from .archive import ArchiveLookup
+from .failure_registry import FailureRegistry, FailureClass, SyncFailure
+from .network import download, human_fmt, MultipartUpload, ArtifactCache, PREFLIGHT
+
+
+# Services the sync talks to, each can be overridden (ex. to run against macos_sync.standin)
+DEFAULT_ENDPOINTS = {
+    "Catalog": sucatalog.url.CATALOG_BASE_URL,
+    "AppleDB": appledb.APPLE_DB_URL,
+    "Archive": "https://archive.org",
+    "S3":      "https://s3.us.archive.org",
+}
+
+# AppleDB IPSWs that can't be synced, SUCatalog InstallAssistants of these builds are unaffected
+KNOWN_BAD_BUILDS = [
+    "20A5299w",
+    "20A5323l",
+
+    # Requires login
+    "23A5257q", # macOS 14.0 Developer Beta 1
+]
+
+# How SUCatalog products are discovered:
+# - newest:  metadata is resolved lazily, newest product first across all catalogs
+# - catalog: every product of a catalog is resolved before any is checked
+DISCOVERY_MODES = ["newest", "catalog"]
 
 
 class macOSSync:
 
-    def __init__(self, access_key: str, secret_key: str, target_version: str = None) -> None:
+    def __init__(self,
+                 access_key: str,
+                 secret_key: str,
+                 target_version: str = None,
+                 max_items: int = 1,
+                 disk_budget: int = None,
+                 work_dir: str = ".",
+                 time_budget: float = None,
+                 history_path: str = None,
+                 work_queue: work_queue.WorkQueue = None,
+                 multipart: bool = True,
+                 failure_registry_path: str = None,
+                 endpoints: dict = None,
+                 discovery: str = "newest",
+                 catalog_history_path: str = None,
+                 cache: ArtifactCache = None,
+                 sync_policy: str = "none",
+                 parse_workers: int = 0,
+                 appledb_cache_path: str = None
+                ) -> None:
+        if discovery not in DISCOVERY_MODES:
+            raise ValueError(f"Unknown discovery mode: {discovery}")
+
         self._access_key     = access_key
         self._secret_key     = secret_key
         self._target_version = target_version
+        self._max_items      = max_items
+        self._disk_budget    = disk_budget
+        self._work_dir       = Path(work_dir)
+        self._time_budget    = time_budget
+        self._history_path   = Path(history_path) if history_path else self._work_dir / "throughput_history.json"
+        self._work_queue     = work_queue
+        self._multipart      = multipart
+        self._discovery      = discovery
+        self._cache          = cache
+        self._sync_policy    = sync_policy
+        self._parse_workers  = parse_workers
+        self._appledb_cache  = Path(appledb_cache_path) if appledb_cache_path else self._work_dir / "appledb_cache.json"
 
         self._contributor = "khronokernel"
         self._collection  = "open_source_software"
 
+        self._endpoints = {**DEFAULT_ENDPOINTS, **(endpoints or {})}
+
+        self._archive = ArchiveLookup(self._endpoints["Archive"])
+
+        self._failures = FailureRegistry(failure_registry_path or self._work_dir / "failure_registry.json")
+        self._failures.seed(KNOWN_BAD_BUILDS, variant="AppleDB IPSW")
+
+        self._catalog_history = sucatalog.CatalogHistory(catalog_history_path) if catalog_history_path else None
+
 
     def latest_fetch_catalog(self) -> list:
-        contents = sucatalog.CatalogURL().url_contents
+        contents = sucatalog.CatalogURL(base_url=self._endpoints["Catalog"]).url_contents
         return sucatalog.CatalogProducts(contents).products
 
 
     def fetch_all_catalogs(self) -> list:
+        return list(self.iter_all_catalogs())
+
+
+    def iter_all_catalogs(self):
+        """
+        Yield unique products across every catalog as each catalog is parsed
+
+        Products are deduplicated by (Build, ProductID); the seeds of every catalog
+        listing a product are merged into 'Seeds' of the first-seen record, so
+        records already yielded keep gaining seeds as later catalogs are parsed.
+        """
         print("Fetching all catalogs")
-        catalog = []
+        seen = {}
+        with self._catalog_parser() as parser:
+            for version, variant in self._supported_catalogs():
+                print(f"  Fetching {version.name.lower().replace('_', ' ').title()} {variant.name}")
+                with telemetry.span("catalog", version=version.name, seed=variant.name):
+                    candidates = self._fetch_catalog_candidates((version, variant), parser)
+
+                # Newest first within each catalog, resolved as the pipeline consumes them
+                for product in sucatalog.CatalogProducts({"Products": candidates}, parser=parser).iter_products(order="newest"):
+                    key = (product['Build'], product['ProductID'])
+                    if key in seen:
+                        if variant not in seen[key]['Seeds']:
+                            seen[key]['Seeds'].append(variant)
+                        continue
+
+                    product['Seeds'] = [variant]
+                    seen[key] = product
+                    yield product
+
+
+    def _supported_catalogs(self) -> list:
+        """
+        (CatalogVersion, SeedType) of every catalog listing InstallAssistants, newest first
+        """
+        catalogs = []
         for version in sucatalog.CatalogVersion:
             if float(version.value) < 11.0:
                 break
-            for variant in sucatalog.SeedType:
-                print(f"  Fetching {version.name.lower().replace('_', ' ').title()} {variant.name}")
-                url = sucatalog.CatalogURL(version, variant)
-                catalog.extend(sucatalog.CatalogProducts(url.url_contents).products)
+            catalogs.extend((version, variant) for variant in sucatalog.SeedType)
+        return catalogs
 
-        # Deduplicate
-        catalog = list({product['Build']: product for product in catalog}.values())
 
-        return catalog
+    def _fetch_catalog(self, version: sucatalog.CatalogVersion, variant: sucatalog.SeedType) -> dict:
+        """
+        Fetch a catalog, recording it in the catalog history if enabled
+        """
+        contents = sucatalog.CatalogURL(version, variant, base_url=self._endpoints["Catalog"]).url_contents
+        if contents is None or self._catalog_history is None:
+            return contents
+
+        try:
+            self._catalog_history.record(f"{version.name}/{variant.name}", contents)
+        except Exception as e:
+            # Provenance is best effort, it shouldn't fail the sync
+            print(f"  Failed to record {version.name}/{variant.name} catalog history: {e}")
+
+        return contents
+
+
+    def _catalog_parser(self) -> contextlib.AbstractContextManager:
+        """
+        Process pool for catalog parsing if enabled, otherwise catalogs are parsed in-process
+        """
+        if not self._parse_workers:
+            return contextlib.nullcontext()
+        return sucatalog.CatalogParser(self._parse_workers)
+
+
+    def _fetch_catalog_candidates(self, catalog: tuple, parser: sucatalog.CatalogParser = None) -> dict:
+        """
+        Fetch a catalog, keeping only the raw entries of InstallAssistant products
+
+        With a parser, the catalog is parsed in a worker process which returns
+        compact entries. Catalog history needs the full catalog, so recording it
+        keeps parsing in-process.
+        """
+        version, variant = catalog
+        if parser and self._catalog_history is None:
+            catalog_url = sucatalog.CatalogURL(version, variant, base_url=self._endpoints["Catalog"])
+            data = catalog_url.url_data
+            if data is None:
+                return {}
+            try:
+                with telemetry.span("catalog_parse", url=catalog_url.url):
+                    return parser.parse_catalog(data)["Products"]
+            except Exception as e:
+                logging.error(f"Failed to parse URL contents: {e}")
+                return {}
+
+        contents = self._fetch_catalog(version, variant)
+        if contents is None:
+            return {}
+
+        products = sucatalog.CatalogProducts(contents)
+        return {
+            product: contents["Products"][product]
+            for product in contents["Products"]
+            if products.is_install_assistant(product)
+        }
+
+
+    def iter_newest_products(self):
+        """
+        Yield products across every catalog newest first, resolving metadata lazily
+
+        Catalogs are fetched in parallel and reduced to their raw InstallAssistant
+        entries, which carry PostDate. Metadata (and its network requests) is only
+        resolved as each product is consumed, so a run stopping after its first
+        pending item never resolves the rest.
+        """
+        print("Fetching all catalogs")
+        catalogs = self._supported_catalogs()
+
+        entries = {}
+        seeds   = {}
+        with self._catalog_parser() as parser:
+            # Fetching threads hand parsing to the pool's processes when enabled, keep both busy
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(4, self._parse_workers)) as executor:
+                for (version, variant), candidates in zip(catalogs, executor.map(lambda catalog: self._fetch_catalog_candidates(catalog, parser), catalogs)):
+                    # Reported from this thread, as prints from the fetching threads interleave
+                    print(f"  Fetched {version.name.lower().replace('_', ' ').title()} {variant.name}: {len(candidates)} installer(s)")
+                    for product, entry in candidates.items():
+                        entries.setdefault(product, entry)
+                        seeds.setdefault(product, [])
+                        if variant not in seeds[product]:
+                            seeds[product].append(variant)
+
+            for product in sucatalog.CatalogProducts({"Products": entries}, parser=parser).iter_products(order="newest"):
+                product['Seeds'] = seeds[product['ProductID']]
+                yield product
+
+
+    def mirror_catalogs(self, directory: Path, workers: int = 8) -> dict:
+        """
+        Mirror every package of every catalog, see mirror.PackageMirror
+
+        Returns:
+            dict: Summary of the mirror run
+        """
+        package_mirror = mirror.PackageMirror(directory, workers=workers)
+
+        print("Fetching all catalogs")
+        for version, variant in self._supported_catalogs():
+            print(f"  Fetching {version.name.lower().replace('_', ' ').title()} {variant.name}")
+            contents = self._fetch_catalog(version, variant)
+            if contents is None:
+                continue
+            package_mirror.add_catalog(contents, f"{version.name}/{variant.name}")
 
+        return package_mirror.run()
 
-    def is_installer_already_uploaded(self, build: str, type: str = "InstallAssistant.pkg") -> bool:
-        search = internetarchive.search_items(f"uploader:{self._contributor} title:({build} AND {type})").iter_as_items()
+
+    def is_installer_already_uploaded(self, build: str, type: str = "InstallAssistant.pkg", files: list = None) -> bool:
+        """
+        Check if a build was uploaded
+
+        Parameters:
+            build (str):  Build to look for
+            type  (str):  Installer type in the item's title
+            files (list): Files the item must hold, an item missing any was only partially uploaded
+        """
+        search = self._archive.search(f"uploader:{self._contributor} title:({build} AND {type})", fields=["identifier", "title"])
 
         # Ensure we don't accidentally get a partial match
         checks = [
@@ -55,10 +274,15 @@ class macOSSync:
         ]
 
         for result in search:
-            title = result.metadata['title']
-            for check in checks:
-                if check in title:
-                    return True
+            title = result['title']
+            if not any(check in title for check in checks):
+                continue
+            if files:
+                missing = [file for file in files if file not in self._archive.item_files(result['identifier'])]
+                if missing:
+                    print(f"  {result['identifier']} is missing {', '.join(missing)}")
+                    continue
+            return True
 
         return False
 
@@ -67,42 +291,55 @@ class macOSSync:
         """
         Check if an identifier is already in use
         """
-        search = internetarchive.get_item(identifier)
+        return self._archive.identifier_exists(identifier)
 
-        return search.exists
 
+    def download_item(self, url: str, directory: Path = None, generate_chunklist: bool = False, expected_size: int = None) -> None:
+        with telemetry.span("download_file", url=url):
+            self._download_item(url, directory, generate_chunklist, expected_size)
 
-    def download_item(self, url: str) -> None:
+
+    def _download_item(self, url: str, directory: Path = None, generate_chunklist: bool = False, expected_size: int = None) -> None:
         name = Path(url).name
+        path = Path(directory) / name if directory else Path(name)
+
+        # Payloads of a failed upload were verified and kept, see SyncPipeline._run_upload(),
+        # the identifier is chosen only once uploading starts
+        if path.exists() and (path.parent / "identifier.txt").exists():
+            print(f"  Reusing {name} from an interrupted upload")
+            return
+
         print(f"  Downloading {name}")
 
-        # Check if URL is 404
-        if NetworkUtilities(url).validate_link() is False:
+        # Check if URL is 404, unreachable hosts are only a transient download error
+        probe = PREFLIGHT.probe(url)
+        if probe["Status"] == 404:
             print(f"    {url} is a 404")
-            raise Exception(f"{url} is a 404")
+            raise SyncFailure(FailureClass.NOT_FOUND, f"{url} is a 404")
+        if probe["Error"] is not None:
+            print(f"    Failed to reach {url}: {probe['Error']}")
+            raise SyncFailure(FailureClass.DOWNLOAD_ERROR, f"Failed to reach {url}: {probe['Error']}")
 
-        download_obj = download.DownloadObject(url, name)
-        download_obj.download()
+        download_obj = download.DownloadObject(url, path, expected_size, cache=self._cache, sync_policy=self._sync_policy)
+        download_obj.download(generate_chunklist=generate_chunklist)
         while download_obj.is_active():
             print(f"    Percentage downloaded: {download_obj.get_percent():.2f}%", end="\r")
-            time.sleep(5)
+            # Wake as soon as the download finishes, rather than a fixed sleep
+            download_obj.active_thread.join(5)
 
         if not download_obj.download_complete:
             print("")
             print(f"Failed to download {name}")
             print(f"URL: {url}")
-            raise Exception(f"Failed to download {name}")
-
-        # Check if we downloaded an HTML file
-        if not name.endswith("html"):
-            # Check if content starts with '<!DOCTYPE html>'
-            with open(name, "r") as f:
-                try:
-                    if f.read(15) == "<!DOCTYPE html>":
-                        print(f"    {url} is a 404")
-                        raise Exception(f"{url} is a 404")
-                except UnicodeDecodeError:
-                    pass
+            # HTML error pages and unexpected payloads are rejected as the transfer starts
+            if isinstance(download_obj.failure, SyncFailure):
+                print(f"    {download_obj.failure}")
+                raise download_obj.failure
+            raise SyncFailure(FailureClass.DOWNLOAD_ERROR, f"Failed to download {name}")
+
+        if download_obj.from_cache:
+            print(f"    Reused from artifact cache")
+            return
 
         print("    Percentage downloaded: 100.00%")
         print(f"    Time elapsed: {(time.time() - download_obj.start_time):.2f} seconds")
@@ -115,11 +352,98 @@ class macOSSync:
 
         while chunk_obj.status == integrity_verification.ChunklistStatus.IN_PROGRESS:
             print(f"    Validating {chunk_obj.current_chunk} of {chunk_obj.total_chunks}")
-            time.sleep(5)
+            chunk_obj.active_thread.join(5)
 
         if chunk_obj.status == integrity_verification.ChunklistStatus.FAILURE:
             print(chunk_obj.error_msg)
-            raise Exception(f"Failed to validate {Path(file).name}")
+            self._discard_cached(file)
+            raise SyncFailure(FailureClass.HASH_MISMATCH, f"Failed to validate {Path(file).name}")
+
+
+    def _discard_cached(self, file: Path) -> None:
+        # Don't hand a payload that failed verification to the next run
+        if self._cache:
+            self._cache.discard_file(file)
+
+
+    def audit_archived_installers(self, samples: int = 8, limit: int = None) -> list:
+        """
+        Spot-check archived InstallAssistants via Range requests
+        """
+        print(f"Auditing archived installers ({samples} chunks per item)")
+
+        results = audit.ArchiveAudit(self._contributor, samples=samples, base_url=self._endpoints["Archive"]).audit(limit=limit)
+        for result in results:
+            print(f"  {result['Identifier']}: {result['Status'].name}")
+            print(f"    Sampled {result['Sampled']} of {result['TotalChunks']} chunks ({human_fmt(result['BytesRead'])}, {result['Coverage'] * 100:.3f}% of file)")
+            print(f"    Confidence: {result['Confidence'] * 100:.1f}%")
+            if result["Error"]:
+                print(f"    {result['Error']}")
+
+        failed = [result for result in results if result["Status"] != integrity_verification.ChunklistStatus.SUCCESS]
+        if failed:
+            raise Exception(f"{len(failed)} of {len(results)} archived installers failed audit")
+
+        return results
+
+
+    def item_identifier(self, directory: Path, identifier: str) -> str:
+        """
+        Identifier to upload a build to, appending '-1' while taken
+
+        The choice is kept in the build's directory, so an interrupted upload
+        resumes into the item it already created rather than a new one.
+        """
+        path = Path(directory) / "identifier.txt"
+        if path.exists():
+            return path.read_text().strip()
+
+        while self.is_identifier_already_in_use(identifier):
+            print(f"  Identifier {identifier} already in use, appending -1")
+            identifier += "-1"
+
+        path.write_text(identifier)
+        return identifier
+
+
+    def upload_files(self, identifier: str, files: list, metadata: dict) -> None:
+        """
+        Upload files to an archive.org item via parallel multipart uploads
+
+        Interrupted uploads resume from the parts already on the server
+        """
+        if not self._multipart:
+            # Imported lazily, as it's slow to load and only needed for this fallback
+            import internetarchive
+
+            responses = internetarchive.upload(
+                identifier=identifier,
+                files=[str(file) for file in files],
+                metadata=metadata,
+                access_key=self._access_key,
+                secret_key=self._secret_key,
+            )
+            for response in responses:
+                if response.status_code != 200:
+                    print(f"Failed to upload {identifier}")
+                    print(response.text)
+                    raise SyncFailure(FailureClass.UPLOAD_ERROR, f"Failed to upload {identifier}")
+            return
+
+        # Files completed by an earlier, interrupted attempt
+        uploaded = self._archive.item_files(identifier)
+
+        for file in files:
+            if uploaded.get(Path(file).name) == Path(file).stat().st_size:
+                print(f"  {Path(file).name} already uploaded")
+                continue
+
+            print(f"  Uploading {Path(file).name}")
+            upload_obj = MultipartUpload(identifier, file, self._access_key, self._secret_key, metadata, endpoint=self._endpoints["S3"])
+            if not upload_obj.upload():
+                print(f"Failed to upload {Path(file).name}")
+                print(upload_obj.error_msg)
+                raise SyncFailure(FailureClass.UPLOAD_ERROR, f"Failed to upload {identifier}")
 
 
     def generate_description(self, files: list, urls: list, post_date: str, product_id: str = None, catalog: str = None) -> str:
@@ -151,59 +475,182 @@ class macOSSync:
         return description
 
 
-    def iterate_catalog(self):
-        for product in self.fetch_all_catalogs():
-            build = product['Build']
-            name = f"{product['Title']} {product['Version']} ({product['Build']})"
+    def cleanup_item(self, item: dict) -> None:
+        """
+        Remove an item's working directory
+
+        Not called for failed uploads, whose payloads and multipart state are kept to resume
+        """
+        shutil.rmtree(item["Directory"], ignore_errors=True)
 
-            print(f"Checking {name}")
-            if self.is_installer_already_uploaded(build, "InstallAssistant.pkg"):
-                print(f"  {build} already uploaded, skipping")
+
+    def _run_planner(self) -> planner.RunPlanner:
+        """
+        Run planner modelling uploads against the configured S3 endpoint
+        """
+        return planner.RunPlanner(
+            planner.ThroughputHistory(self._history_path),
+            self._time_budget,
+            upload_host=urllib.parse.urlparse(self._endpoints["S3"]).hostname,
+        )
+
+
+    def _run_pipeline(self, discover, is_archived, download, verify, upload, resolve_size=None) -> list:
+        """
+        Run sync stages concurrently, bounded by the disk budget and item limit
+        """
+        self._work_dir.mkdir(parents=True, exist_ok=True)
+
+        if self._disk_budget:
+            disk_budget = pipeline.DiskBudget(self._disk_budget)
+        else:
+            disk_budget = pipeline.DiskBudget.from_free_space(self._work_dir)
+
+        print(f"Disk budget: {human_fmt(disk_budget.budget)}, syncing up to {self._max_items} item(s)")
+
+        run_planner = self._run_planner()
+        if self._time_budget:
+            print(f"Time budget: {self._time_budget / 60:.0f} minutes")
+
+        sync_pipeline = pipeline.SyncPipeline(
+            discover=discover,
+            is_archived=is_archived,
+            download=download,
+            verify=verify,
+            upload=upload,
+            cleanup=self.cleanup_item,
+            disk_budget=disk_budget,
+            max_items=self._max_items,
+            resolve_size=resolve_size,
+            planner=run_planner,
+            work_queue=self._work_queue,
+        )
+        try:
+            completed = sync_pipeline.run()
+        finally:
+            run_planner.history.save()
+            self._record_failures(sync_pipeline)
+
+        if sync_pipeline.deferred:
+            print(f"Deferred to next run: {', '.join(item['Build'] for item, _ in sync_pipeline.deferred)}")
+
+        if sync_pipeline.failures:
+            raise Exception(f"Failed to sync {', '.join(item['Build'] for item, _, _ in sync_pipeline.failures)}")
+
+        return completed
+
+
+    def _record_failures(self, sync_pipeline: pipeline.SyncPipeline) -> None:
+        """
+        Persist the outcome of a run, so failing builds are backed off
+        """
+        for item in sync_pipeline.completed:
+            self._failures.clear(item['Build'], item['URL'])
+
+        for item, stage, error in sync_pipeline.failures:
+            if isinstance(error, SyncFailure):
+                failure_class = error.failure_class
+            elif stage == pipeline.PipelineStage.DOWNLOAD:
+                failure_class = FailureClass.DOWNLOAD_ERROR
+            elif stage == pipeline.PipelineStage.UPLOAD:
+                failure_class = FailureClass.UPLOAD_ERROR
+            else:
+                # Discovery and archive lookups failing isn't the build's fault
+                continue
+            self._failures.record(item['Build'], item['URL'], failure_class, str(error))
+
+        self._failures.save()
+
+
+    def _is_backed_off(self, item: dict, variant: str) -> bool:
+        entry = self._failures.lookup(item['Build'], item['URL'], variant)
+        if entry is None:
+            return False
+
+        if entry['RetryAfter'] is None:
+            print(f"Skipping {item['Name']}: {entry['Class']}")
+        else:
+            print(f"Skipping {item['Name']}: {entry['Class']}, retrying after {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['RetryAfter']))}")
+        return True
+
+
+    def _discover_catalog_items(self):
+        # Items are handed to the pipeline as they're resolved, rather than after all are fetched
+        products = self.iter_newest_products() if self._discovery == "newest" else self.iter_all_catalogs()
+        for product in products:
+            item = {
+                "Build":     product['Build'],
+                "Name":      f"{product['Title']} {product['Version']} ({product['Build']})",
+                "Size":      product['InstallAssistant']['Size'] + product['InstallAssistant']['IntegrityDataSize'],
+                "URL":       product['InstallAssistant']['URL'],
+                "PostDate":  product['PostDate'],
+                "Directory": self._work_dir / product['Build'],
+                "Product":   product,
+            }
+            if self._is_backed_off(item, "SUCatalog"):
                 continue
 
-            print(f"  {name} not uploaded, downloading")
+            yield item
 
-            self.download_item(product['InstallAssistant']['URL'])
-            self.download_item(product['InstallAssistant']['IntegrityDataURL'])
 
-            print(f"  Verifying {name} InstallAssistant.pkg")
-            self.verify_integrity("InstallAssistant.pkg", "InstallAssistant.pkg.integrityDataV1")
+    def _is_catalog_item_uploaded(self, item: dict) -> bool:
+        print(f"Checking {item['Name']}")
+        if self.is_installer_already_uploaded(item['Build'], "InstallAssistant.pkg", ["InstallAssistant.pkg", "InstallAssistant.pkg.integrityDataV1"]):
+            print(f"  {item['Build']} already uploaded, skipping")
+            return True
 
-            # upload to archive.org
-            files = [
-                "InstallAssistant.pkg",
-                "InstallAssistant.pkg.integrityDataV1"
-            ]
+        print(f"  {item['Name']} not uploaded, queuing")
+        return False
 
-            identifier = f"macOS-{build}-InstallAssistant"
-            while self.is_identifier_already_in_use(identifier):
-                print(f"  Identifier {identifier} already in use, appending -1")
-                identifier += "-1"
 
-            responses = internetarchive.upload(
-                identifier=identifier,
-                files=files,
-                metadata={
-                    'collection': self._collection,
-                    'title':      f"{product['Title']} {product['Version']} ({product['Build']}) InstallAssistant.pkg",
-                    'mediatype':  'software',
-                    'description': self.generate_description(files, [product['InstallAssistant']['URL'], product['InstallAssistant']['IntegrityDataURL']], product['PostDate'], product['ProductID'], product['Catalog'].name if hasattr(product['Catalog'], 'name') else None),
-                },
-                access_key=self._access_key,
-                secret_key=self._secret_key,
-            )
+    def _download_catalog_item(self, item: dict) -> None:
+        product = item['Product']
+        print(f"Downloading {item['Name']}")
+        self.download_item(product['InstallAssistant']['URL'], item['Directory'], expected_size=product['InstallAssistant']['Size'])
+        self.download_item(product['InstallAssistant']['IntegrityDataURL'], item['Directory'], expected_size=product['InstallAssistant']['IntegrityDataSize'])
 
-            for response in responses:
-                if response.status_code != 200:
-                    print(f"Failed to upload {build}")
-                    print(response.text)
-                    raise Exception(f"Failed to upload {build}")
 
+    def _verify_catalog_item(self, item: dict) -> None:
+        print(f"  Verifying {item['Name']} InstallAssistant.pkg")
+        self.verify_integrity(item['Directory'] / "InstallAssistant.pkg", item['Directory'] / "InstallAssistant.pkg.integrityDataV1")
 
-            print(f"  {build} uploaded")
 
-            # Only upload one installer at a time
-            return
+    def _upload_catalog_item(self, item: dict) -> None:
+        product = item['Product']
+        build   = item['Build']
+
+        files = [
+            "InstallAssistant.pkg",
+            "InstallAssistant.pkg.integrityDataV1"
+        ]
+
+        identifier = self.item_identifier(item['Directory'], f"macOS-{build}-InstallAssistant")
+
+        self.upload_files(
+            identifier=identifier,
+            files=[item['Directory'] / file for file in files],
+            metadata={
+                'collection': self._collection,
+                'title':      f"{product['Title']} {product['Version']} ({product['Build']}) InstallAssistant.pkg",
+                'mediatype':  'software',
+                'description': self.generate_description(files, [product['InstallAssistant']['URL'], product['InstallAssistant']['IntegrityDataURL']], product['PostDate'], product['ProductID'], product['Catalog'].name if hasattr(product['Catalog'], 'name') else None),
+            },
+        )
+
+        print(f"  {build} uploaded")
+
+
+    def iterate_catalog(self):
+        """
+        Sync InstallAssistants from the Software Update Catalogs
+        """
+        return self._run_pipeline(
+            discover=self._discover_catalog_items,
+            is_archived=self._is_catalog_item_uploaded,
+            download=self._download_catalog_item,
+            verify=self._verify_catalog_item,
+            upload=self._upload_catalog_item,
+        )
 
 
     def fetch_apple_db_items(self) -> dict:
@@ -223,62 +670,50 @@ class macOSSync:
 
         print(f"APPLEDB: Getting installers for variant: {variant}")
 
-        apple_db = NetworkUtilities().get("https://api.appledb.dev/main.json")
-        if apple_db is None:
-            return installers
-
-        apple_db = apple_db.json()
-        for group in apple_db:
-            if group != "ios":
+        for item in appledb.AppleDBCatalog(self._appledb_cache, self._endpoints["AppleDB"]).entries("macOS", variant):
+            if "build" not in item:
+                continue
+            if "version" not in item:
+                continue
+            if "sources" not in item:
                 continue
-            for item in apple_db[group]:
-                if "osStr" not in item:
-                    continue
-                if item["osStr"] != "macOS":
-                    continue
-                if "build" not in item:
-                    continue
-                if "version" not in item:
-                    continue
-                if "sources" not in item:
-                    continue
 
-                if self._target_version:
-                    if not item["version"].startswith(self._target_version):
-                        continue
+            if self._target_version:
+                if not item["version"].startswith(self._target_version):
+                    continue
 
-                name = "macOS"
-                if "appledbWebImage" in item:
-                    if "id" in item["appledbWebImage"]:
-                        name += " " + item["appledbWebImage"]["id"]
+            name = "macOS"
+            if "appledbWebImage" in item:
+                if "id" in item["appledbWebImage"]:
+                    name += " " + item["appledbWebImage"]["id"]
 
-                for source in item["sources"]:
-                    if "links" not in source:
-                        continue
+            for source in item["sources"]:
+                if "links" not in source:
+                    continue
 
-                    hash = None
-                    if "hashes" in source:
-                        if "sha1" in source["hashes"]:
-                            hash = source["hashes"]["sha1"]
+                hash = None
+                if "hashes" in source:
+                    if "sha1" in source["hashes"]:
+                        hash = source["hashes"]["sha1"]
 
-                    for entry in source["links"]:
-                        if "url" not in entry:
-                            continue
-                        if entry["url"].endswith(variant) is False:
+                for entry in source["links"]:
+                    if "url" not in entry:
+                        continue
+                    if entry["url"].endswith(variant) is False:
+                        continue
+                    if "preferred" in entry:
+                        if entry["preferred"] is False:
                             continue
-                        if "preferred" in entry:
-                            if entry["preferred"] is False:
-                                continue
-
-                        installers.append({
-                            "Name":      name,
-                            "Version":   item["version"],
-                            "Build":     item["build"],
-                            "URL":       entry["url"],
-                            "Variant":   "Beta" if item["beta"] else "Public",
-                            "Date":      item["released"],
-                            "Hash":      hash,
-                        })
+
+                    installers.append({
+                        "Name":      name,
+                        "Version":   item["version"],
+                        "Build":     item["build"],
+                        "URL":       entry["url"],
+                        "Variant":   "Beta" if item["beta"] else "Public",
+                        "Date":      item["released"],
+                        "Hash":      hash,
+                    })
 
         # Deduplicate builds
         installers = list({installer['Build']: installer for installer in installers}.values())
@@ -289,82 +724,154 @@ class macOSSync:
         return installers
 
 
-    def iterate_apple_db(self):
-        """
-        Fetch IPSWs
-        """
-        known_bad_builds = [
-            "20A5299w",
-            "20A5323l",
+    def _discover_apple_db_items(self):
+        # Newest first, so a limited run syncs the most relevant installers
+        installers = sorted(self.fetch_apple_db_items(), key=lambda installer: str(installer['Date']), reverse=True)
+        for installer in installers:
+            item = {
+                "Build":     installer['Build'],
+                "Name":      f"{installer['Name']} {installer['Version']} ({installer['Build']})",
+                "Size":      None,
+                "URL":       installer['URL'],
+                "PostDate":  installer['Date'],
+                "Directory": self._work_dir / installer['Build'],
+                "Installer": installer,
+            }
+            if self._is_backed_off(item, "AppleDB IPSW"):
+                continue
 
-            # Requires login
-            "23A5257q", # macOS 14.0 Developer Beta 1
-        ]
+            yield item
 
-        for installer in self.fetch_apple_db_items():
-            build = installer['Build']
-            name = f"{installer['Name']} {installer['Version']} ({build})"
 
-            if build in known_bad_builds:
-                continue
+    def _resolve_apple_db_item_size(self, item: dict) -> int:
+        # The probe is reused when the item is downloaded
+        return PREFLIGHT.probe(item['Installer']['URL'])["ContentLength"] or 0
 
-            print(f"Checking {name}")
-            if self.is_installer_already_uploaded(build, "UniversalMac.ipsw"):
-                print(f"  {build} already uploaded, skipping")
-                continue
 
-            print(f"  {name} not uploaded, downloading")
-            file_name = Path(installer['URL']).name
-            self.download_item(installer['URL'])
-
-            # Compare hash if available
-            if installer['Hash']:
-                print(f"  Verifying {name} UniversalMac.ipsw")
-                import hashlib
-                sha1 = hashlib.sha1()
-                with open(file_name, "rb") as f:
-                    while True:
-                        data = f.read(65536)
-                        if not data:
-                            break
-                        sha1.update(data)
-
-                if sha1.hexdigest() != installer['Hash']:
-                    print(f"  Hash mismatch for {name}")
-                    print(f"  Expected: {installer['Hash']}")
-                    print(f"  Got:      {sha1.hexdigest()}")
-                    raise Exception(f"Hash mismatch for {name}")
-
-                print(f"  Hash verified")
-
-            # upload to archive.org
-            files = [file_name]
-
-            identifier = f"macOS-{build}-UniversalMac"
-            while self.is_identifier_already_in_use(identifier):
-                print(f"  Identifier {identifier} already in use, appending -1")
-                identifier += "-1"
+    def _is_apple_db_item_uploaded(self, item: dict) -> bool:
+        print(f"Checking {item['Name']}")
+        file_name = Path(item['Installer']['URL']).name
+        if self.is_installer_already_uploaded(item['Build'], "UniversalMac.ipsw", [file_name, f"{file_name}.chunklist"]):
+            print(f"  {item['Build']} already uploaded, skipping")
+            return True
 
-            responses = internetarchive.upload(
-                identifier=identifier,
-                files=files,
-                metadata={
-                    'collection': self._collection,
-                    'title':      f"{name} UniversalMac.ipsw",
-                    'mediatype':  'software',
-                    'description': self.generate_description(files, [installer['URL']], installer['Date']),
-                },
-                access_key=self._access_key,
-                secret_key=self._secret_key,
-            )
+        print(f"  {item['Name']} not uploaded, queuing")
+        return False
 
-            for response in responses:
-                if response.status_code != 200:
-                    print(f"Failed to upload {build}")
-                    print(response.text)
-                    raise Exception(f"Failed to upload {build}")
 
-            print(f"  {build} uploaded")
+    def _download_apple_db_item(self, item: dict) -> None:
+        print(f"Downloading {item['Name']}")
+        self.download_item(item['Installer']['URL'], item['Directory'], generate_chunklist=True)
 
-            # Only upload one installer at a time
+
+    def _verify_apple_db_item(self, item: dict) -> None:
+        installer = item['Installer']
+
+        # Compare hash if available
+        if not installer['Hash']:
             return
+
+        print(f"  Verifying {item['Name']} UniversalMac.ipsw")
+        sha1 = hashlib.sha1()
+        with open(item['Directory'] / Path(installer['URL']).name, "rb") as f:
+            while True:
+                data = f.read(65536)
+                if not data:
+                    break
+                sha1.update(data)
+                telemetry.count("bytes", len(data))
+
+        if sha1.hexdigest() != installer['Hash']:
+            print(f"  Hash mismatch for {item['Name']}")
+            print(f"  Expected: {installer['Hash']}")
+            print(f"  Got:      {sha1.hexdigest()}")
+            self._discard_cached(item['Directory'] / Path(installer['URL']).name)
+            raise SyncFailure(FailureClass.HASH_MISMATCH, f"Hash mismatch for {item['Name']}")
+
+        print(f"  Hash verified")
+
+
+    def _upload_apple_db_item(self, item: dict) -> None:
+        installer = item['Installer']
+        build     = item['Build']
+        file_name = Path(installer['URL']).name
+
+        # upload to archive.org, alongside a generated chunklist for later chunk-level verification
+        files = [
+            file_name,
+            f"{file_name}.chunklist"
+        ]
+
+        identifier = self.item_identifier(item['Directory'], f"macOS-{build}-UniversalMac")
+
+        self.upload_files(
+            identifier=identifier,
+            files=[item['Directory'] / file for file in files],
+            metadata={
+                'collection': self._collection,
+                'title':      f"{item['Name']} UniversalMac.ipsw",
+                'mediatype':  'software',
+                'description': self.generate_description(files, [installer['URL']], installer['Date']),
+            },
+        )
+
+        print(f"  {build} uploaded")
+
+
+    def iterate_apple_db(self):
+        """
+        Fetch IPSWs
+        """
+        return self._run_pipeline(
+            discover=self._discover_apple_db_items,
+            is_archived=self._is_apple_db_item_uploaded,
+            download=self._download_apple_db_item,
+            verify=self._verify_apple_db_item,
+            upload=self._upload_apple_db_item,
+            resolve_size=self._resolve_apple_db_item_size,
+        )
+
+
+    def plan(self, variant: str = "SUCatalog") -> list:
+        """
+        Resolve what a run would sync, without downloading or uploading any payloads
+
+        Parameters:
+            variant (str): 'SUCatalog' or 'AppleDB IPSW'
+
+        Returns:
+            list: Pending items, newest first, with sizes and estimated transfer times
+        """
+        if variant == "SUCatalog":
+            discover, is_archived, resolve_size = self._discover_catalog_items, self._is_catalog_item_uploaded, None
+        elif variant == "AppleDB IPSW":
+            discover, is_archived, resolve_size = self._discover_apple_db_items, self._is_apple_db_item_uploaded, self._resolve_apple_db_item_size
+        else:
+            raise ValueError(f"Unknown variant: {variant}")
+
+        run_planner = self._run_planner()
+
+        pending = []
+        seen    = set()
+        for item in discover():
+            if item['Build'] in seen:
+                continue
+            seen.add(item['Build'])
+
+            if is_archived(item):
+                continue
+            if item['Size'] is None:
+                item['Size'] = resolve_size(item)
+
+            in_run = len([entry for entry in pending if entry['InRun']]) < self._max_items and run_planner.admit(item)
+            pending.append({
+                "Build":            item['Build'],
+                "Name":             item['Name'],
+                "URL":              item['URL'],
+                "PostDate":         str(item['PostDate']),
+                "Size":             item['Size'],
+                "EstimatedSeconds": run_planner.estimate(item),
+                "InRun":            in_run,
+            })
+
+        return pending
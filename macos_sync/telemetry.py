@@ -0,0 +1,195 @@
+"""
+telemetry.py: Lightweight timing spans and counters
+
+Spans nest per thread; work handed to another thread can be attached to its
+originating span by passing it as 'parent'. Counters (bytes, requests, etc.)
+are added to the innermost open span of the calling thread.
+
+At the end of a run, spans can be exported as a JSON trace, or aggregated into
+a Prometheus textfile (for node_exporter's textfile collector).
+
+Usage:
+    >>> from macos_sync import telemetry
+    >>> with telemetry.span("download", build="22G720"):
+    ...     telemetry.count("bytes", len(chunk))
+    >>> telemetry.TELEMETRY.export_json("trace.json")
+    >>> telemetry.TELEMETRY.export_prometheus("macos_sync.prom")
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+from pathlib import Path
+
+
+class Span:
+    """
+    A timed unit of work
+
+    Parameters:
+        name       (str):  Span name, ex. 'download'
+        parent     (Span): Enclosing span, None for a root span
+        attributes (dict): Additional details, ex. build or URL
+    """
+
+    def __init__(self, name: str, parent: "Span" = None, attributes: dict = None) -> None:
+        self.name:       str  = name
+        self.parent:     Span = parent
+        self.attributes: dict = attributes or {}
+        self.counters:   dict = {}
+        self.children:   list = []
+        self.thread:     str  = threading.current_thread().name
+
+        self.start: float = time.time()
+        self.end:   float = None
+
+
+    @property
+    def duration(self) -> float:
+        """
+        Seconds elapsed, up to now if the span is still open
+        """
+        return (self.end or time.time()) - self.start
+
+
+    def count(self, key: str, value: float = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def to_dict(self) -> dict:
+        return {
+            "Name":       self.name,
+            "Thread":     self.thread,
+            "Start":      self.start,
+            "Duration":   self.duration,
+            "Attributes": {key: str(value) for key, value in self.attributes.items()},
+            "Counters":   dict(self.counters),
+            "Children":   [child.to_dict() for child in list(self.children)],
+        }
+
+
+class Telemetry:
+    """
+    Collects spans for a run
+    """
+
+    def __init__(self) -> None:
+        self.roots: list = []
+
+        self._local = threading.local()
+        self._lock  = threading.Lock()
+
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+
+    def current(self) -> Span:
+        """
+        Innermost open span of the calling thread
+        """
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+
+    @contextlib.contextmanager
+    def span(self, name: str, parent: Span = None, **attributes):
+        """
+        Time a block of work
+
+        Parameters:
+            name   (str):  Span name
+            parent (Span): Parent span, defaults to the calling thread's current span
+            **attributes:  Details to record with the span
+        """
+        parent = parent or self.current()
+        span = Span(name, parent, attributes)
+        if parent:
+            parent.children.append(span)
+        else:
+            with self._lock:
+                self.roots.append(span)
+
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.time()
+            stack.pop()
+
+
+    def count(self, key: str, value: float = 1) -> None:
+        """
+        Add to a counter on the calling thread's current span, no-op outside of spans
+        """
+        span = self.current()
+        if span:
+            span.count(key, value)
+
+
+    def spans(self) -> list:
+        """
+        Every recorded span, flattened
+        """
+        result = []
+        pending = list(self.roots)
+        while pending:
+            span = pending.pop()
+            result.append(span)
+            pending.extend(span.children)
+        return result
+
+
+    def export_json(self, path: Path) -> None:
+        """
+        Write every span as a nested JSON trace
+        """
+        Path(path).write_text(json.dumps([span.to_dict() for span in self.roots], indent=4))
+
+
+    def export_prometheus(self, path: Path, prefix: str = "macos_sync") -> None:
+        """
+        Write span totals per name in Prometheus text format
+
+        Written atomically, as node_exporter may read the file at any time
+        """
+        totals = {}
+        for span in self.spans():
+            entry = totals.setdefault(span.name, {"count": 0, "seconds": 0.0, "counters": {}})
+            entry["count"]   += 1
+            entry["seconds"] += span.duration
+            for key, value in span.counters.items():
+                entry["counters"][key] = entry["counters"].get(key, 0) + value
+
+        lines = [
+            f"# HELP {prefix}_span_duration_seconds Time spent in each span",
+            f"# TYPE {prefix}_span_duration_seconds summary",
+        ]
+        for name, entry in sorted(totals.items()):
+            lines.append(f'{prefix}_span_duration_seconds_sum{{span="{name}"}} {entry["seconds"]}')
+            lines.append(f'{prefix}_span_duration_seconds_count{{span="{name}"}} {entry["count"]}')
+
+        counter_names = sorted({key for entry in totals.values() for key in entry["counters"]})
+        for counter in counter_names:
+            lines.append(f"# HELP {prefix}_span_{counter}_total Total {counter} recorded in each span")
+            lines.append(f"# TYPE {prefix}_span_{counter}_total counter")
+            for name, entry in sorted(totals.items()):
+                if counter in entry["counters"]:
+                    lines.append(f'{prefix}_span_{counter}_total{{span="{name}"}} {entry["counters"][counter]}')
+
+        temp_path = Path(f"{path}.tmp")
+        temp_path.write_text("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+
+TELEMETRY = Telemetry()
+
+span    = TELEMETRY.span
+count   = TELEMETRY.count
+current = TELEMETRY.current
@@ -0,0 +1,356 @@
+"""
+work_queue.py: Claim builds across multiple sync workers
+
+Workers claim a build before downloading it, holding an expiring lease that
+is renewed while transferring. Should a worker die, its lease expires and
+another worker may claim the build; completed builds are never handed out
+again, avoiding double uploads while archive.org's search index catches up.
+
+Backends:
+- SQLiteWorkQueue:    Single SQLite database shared by all workers
+- FileLeaseWorkQueue: One lease file per build in a shared directory
+
+Additional backends subclass WorkQueue and register in WORK_QUEUE_BACKENDS.
+"""
+
+import os
+import abc
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+import contextlib
+
+from pathlib import Path
+
+
+class WorkQueue(abc.ABC):
+    """
+    Base class for work queues
+
+    Parameters:
+        worker        (str):   Identifier of this worker, defaults to hostname and PID
+        lease_seconds (float): How long a claim lasts without a heartbeat
+    """
+
+    def __init__(self, worker: str = None, lease_seconds: float = 15 * 60) -> None:
+        self.worker:        str   = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds: float = lease_seconds
+
+
+    @abc.abstractmethod
+    def claim(self, key: str) -> bool:
+        """
+        Claim a build, succeeds if unclaimed, previously released, or its lease expired
+
+        Returns:
+            bool: True if this worker now holds the claim
+        """
+
+
+    @abc.abstractmethod
+    def heartbeat(self, key: str) -> bool:
+        """
+        Extend this worker's lease on a build
+
+        Returns:
+            bool: False if the lease was lost (ex. it expired and was claimed by another worker)
+        """
+
+
+    @abc.abstractmethod
+    def release(self, key: str) -> None:
+        """
+        Give up a claim so another worker may retry the build
+        """
+
+
+    @abc.abstractmethod
+    def complete(self, key: str) -> None:
+        """
+        Mark a build as done, it will not be claimed again
+        """
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    Work queue backed by a SQLite database
+
+    Parameters:
+        path (Path): Database file, created if missing
+    """
+
+    def __init__(self, path: Path, worker: str = None, lease_seconds: float = 15 * 60) -> None:
+        super().__init__(worker, lease_seconds)
+        self.path: Path = Path(path)
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "key TEXT PRIMARY KEY, worker TEXT, expires REAL, state TEXT, attempts INTEGER DEFAULT 0"
+                ")"
+            )
+
+
+    def _connect(self) -> contextlib.closing:
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        return contextlib.closing(sqlite3.connect(self.path, timeout=60, isolation_level=None))
+
+
+    def claim(self, key: str) -> bool:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT worker, expires, state FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                worker, expires, state = row
+                if state == "done":
+                    connection.execute("COMMIT")
+                    return False
+                if state == "claimed" and expires > now and worker != self.worker:
+                    connection.execute("COMMIT")
+                    return False
+
+            connection.execute(
+                "INSERT INTO leases (key, worker, expires, state, attempts) VALUES (?, ?, ?, 'claimed', 1) "
+                "ON CONFLICT(key) DO UPDATE SET worker = excluded.worker, expires = excluded.expires, state = 'claimed', attempts = attempts + 1",
+                (key, self.worker, now + self.lease_seconds)
+            )
+            connection.execute("COMMIT")
+
+        return True
+
+
+    def heartbeat(self, key: str) -> bool:
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE leases SET expires = ? WHERE key = ? AND worker = ? AND state = 'claimed'",
+                (time.time() + self.lease_seconds, key, self.worker)
+            )
+            return cursor.rowcount == 1
+
+
+    def release(self, key: str) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE leases SET state = 'released', expires = 0 WHERE key = ? AND worker = ? AND state = 'claimed'",
+                (key, self.worker)
+            )
+
+
+    def complete(self, key: str) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE leases SET state = 'done' WHERE key = ? AND worker = ?",
+                (key, self.worker)
+            )
+
+
+class FileLeaseWorkQueue(WorkQueue):
+    """
+    Work queue backed by lease files, for directories shared between workers (ex. NFS)
+
+    Claims rely on exclusive file creation, and expired leases are taken over by
+    atomically renaming them away, so only one contending worker can succeed. The
+    renamed file is checked to be the expired lease that was read, and restored if
+    another worker's fresh lease was moved instead. Heartbeats and releases
+    likewise rename the lease away before checking it is still this worker's.
+
+    Parameters:
+        directory (Path): Directory to hold lease files, created if missing
+    """
+
+    def __init__(self, directory: Path, worker: str = None, lease_seconds: float = 15 * 60) -> None:
+        super().__init__(worker, lease_seconds)
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+
+    def _lease_path(self, key: str) -> Path:
+        return self.directory / f"{key}.lease"
+
+
+    def _done_path(self, key: str) -> Path:
+        return self.directory / f"{key}.done"
+
+
+    def _take_lease(self, key: str, purpose: str) -> tuple:
+        """
+        Rename the lease to a name private to this worker, so no other worker can change it meanwhile
+
+        Returns:
+            tuple: (private path, parsed lease or None if unreadable), None if there was no lease
+        """
+        path = self.directory / f"{key}.lease.{self.worker}.{purpose}"
+        try:
+            os.rename(self._lease_path(key), path)
+        except FileNotFoundError:
+            return None
+
+        try:
+            return path, json.loads(path.read_text())
+        except json.JSONDecodeError:
+            return path, None
+
+
+    def _restore_lease(self, key: str, path: Path) -> bool:
+        """
+        Put a taken lease back, unless a worker claimed the build meanwhile
+
+        Returns:
+            bool: True if restored
+        """
+        try:
+            os.link(path, self._lease_path(key))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            path.unlink()
+
+
+    def claim(self, key: str) -> bool:
+        if self._done_path(key).exists():
+            return False
+
+        try:
+            contents = self._lease_path(key).read_text()
+            lease = json.loads(contents)
+        except (FileNotFoundError, json.JSONDecodeError):
+            lease = None
+
+        if lease is not None:
+            if lease["Worker"] == self.worker:
+                return self.heartbeat(key)
+            if lease["Expires"] > time.time():
+                return False
+
+            # Expired, only one worker can rename the stale lease away
+            expired_path = self.directory / f"{key}.lease.{self.worker}.expired"
+            try:
+                os.rename(self._lease_path(key), expired_path)
+            except FileNotFoundError:
+                return False
+
+            # Another worker may have taken over first, in which case the rename moved
+            # its fresh lease rather than the expired one. Put it back without clobbering
+            if expired_path.read_text() != contents:
+                try:
+                    os.link(expired_path, self._lease_path(key))
+                except FileExistsError:
+                    pass
+                expired_path.unlink()
+                return False
+            expired_path.unlink()
+
+        try:
+            descriptor = os.open(self._lease_path(key), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+
+        with os.fdopen(descriptor, "w") as file:
+            file.write(json.dumps({"Worker": self.worker, "Expires": time.time() + self.lease_seconds}))
+
+        return True
+
+
+    def heartbeat(self, key: str) -> bool:
+        taken = self._take_lease(key, "heartbeat")
+        if taken is None:
+            return False
+
+        path, lease = taken
+        if lease is None or lease["Worker"] != self.worker:
+            self._restore_lease(key, path)
+            return False
+
+        path.write_text(json.dumps({"Worker": self.worker, "Expires": time.time() + self.lease_seconds}))
+        return self._restore_lease(key, path)
+
+
+    def release(self, key: str) -> None:
+        taken = self._take_lease(key, "release")
+        if taken is None:
+            return
+
+        path, lease = taken
+        if lease is None or lease["Worker"] != self.worker:
+            self._restore_lease(key, path)
+            return
+
+        path.unlink()
+
+
+    def complete(self, key: str) -> None:
+        self._done_path(key).write_text(self.worker)
+        self.release(key)
+
+
+WORK_QUEUE_BACKENDS = {
+    "sqlite": SQLiteWorkQueue,
+    "file":   FileLeaseWorkQueue,
+}
+
+
+class LeaseKeeper:
+    """
+    Periodically heartbeat every build this worker holds
+
+    Parameters:
+        work_queue (WorkQueue): Queue holding the leases
+        interval   (float):     Seconds between heartbeats, defaults to a third of the lease
+    """
+
+    def __init__(self, work_queue: WorkQueue, interval: float = None) -> None:
+        self.work_queue: WorkQueue = work_queue
+        self.interval:   float     = interval or work_queue.lease_seconds / 3
+
+        self._keys   = set()
+        self._lost   = set()
+        self._lock   = threading.Lock()
+        self._stop   = threading.Event()
+        self._thread = None
+
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            self._keys.add(key)
+
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._keys.discard(key)
+            self._lost.discard(key)
+
+
+    def is_lost(self, key: str) -> bool:
+        """
+        Whether a heartbeat found the lease taken over, the build must then be abandoned
+        """
+        with self._lock:
+            return key in self._lost
+
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                keys = list(self._keys)
+            for key in keys:
+                if not self.work_queue.heartbeat(key):
+                    logging.warning(f"Lost lease on {key}")
+                    with self._lock:
+                        self._keys.discard(key)
+                        self._lost.add(key)
+
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
@@ -1,6 +1,13 @@
 
+import sys
+import json
+import time
 import argparse
+import contextlib
 import macos_sync.sync
+import macos_sync.profiling
+import macos_sync.telemetry
+import macos_sync.work_queue
 
 if __name__ == "__main__":
 
@@ -10,17 +17,98 @@ if __name__ == "__main__":
     parser.add_argument('--secret_key',     type=str, help='Internet Archive secret key')
     parser.add_argument('--variant',        type=str, help='AppleDB IPSW vs SUCatalog backup', default='AppleDB IPSW')
     parser.add_argument('--target_version', type=str, help='Target version for IPSW backup',   default=None)
+    parser.add_argument('--max_items',      type=int, help='Maximum installers to sync per run', default=1)
+    parser.add_argument('--disk_budget',    type=float, help='Disk budget in GB, defaults to 90%% of free space', default=None)
+    parser.add_argument('--work_dir',       type=str, help='Directory to download installers to', default='.')
+    parser.add_argument('--time_budget',    type=float, help='Minutes the run may take, items that won\'t finish in time are deferred', default=None)
+    parser.add_argument('--history',        type=str, help='Throughput history file used to estimate transfer times', default=None)
+    parser.add_argument('--work_queue',     type=str, help='Shared work queue location, lets multiple workers sync without overlap', default=None)
+    parser.add_argument('--work_queue_backend', type=str, help='Work queue backend', choices=macos_sync.work_queue.WORK_QUEUE_BACKENDS.keys(), default='sqlite')
+    parser.add_argument('--failures',       type=str, help='Failure registry used to back off failing builds, defaults to the work directory', default=None)
+    parser.add_argument('--appledb_cache',  type=str, help='AppleDB entries cached between runs, so an unchanged main.json costs no transfer, defaults to the work directory', default=None)
+    parser.add_argument('--discovery',      type=str, help='SUCatalog discovery, newest resolves products lazily and stops once enough are pending', choices=macos_sync.sync.DISCOVERY_MODES, default='newest')
+    parser.add_argument('--parse_workers',  type=int, help='Parse catalogs in this many worker processes, 0 parses in-process', default=0)
+    parser.add_argument('--catalog_history', type=str, help='Record every fetched catalog to this history database', default=None)
+    parser.add_argument('--cache',          type=str, help='Artifact cache directory, payloads already downloaded are reused from it', default=None)
+    parser.add_argument('--cache_size',     type=float, help='Artifact cache size limit in GB, unlimited by default', default=None)
+    parser.add_argument('--cache_min_free', type=float, help='Free space in GB to leave on the cache\'s disk, evicting least recently used payloads', default=20)
+    parser.add_argument('--fsync',          type=str, help='When downloads are flushed to disk, interval bounds dirty pages on small runners', choices=macos_sync.network.SYNC_POLICIES, default='none')
+    parser.add_argument('--http_connections', type=int, help='Pooled HTTP connections per host', default=16)
+    parser.add_argument('--http_timeout',   type=float, help='Default HTTP read timeout in seconds', default=60)
+    parser.add_argument('--no_multipart',   action='store_true', help='Upload with the internetarchive library instead of parallel multipart uploads')
+    parser.add_argument('--plan',           action='store_true', help='List pending installers and estimated transfer times without downloading')
+    parser.add_argument('--json',           action='store_true', help='Emit the plan as JSON')
+    parser.add_argument('--trace',          type=str, help='Write a JSON trace of timing spans at run end', default=None)
+    parser.add_argument('--metrics',        type=str, help='Write span metrics as a Prometheus textfile at run end', default=None)
+    parser.add_argument('--profile',        type=str, help='Profile the run, report is written to the work directory', choices=macos_sync.profiling.PROFILERS.keys(), default=None)
+    parser.add_argument('--sample_interval', type=float, help='Sample all thread stacks every N seconds, report is written to the work directory', default=None)
+    parser.add_argument('--mirror',         type=str, help='Mirror every catalog package to this directory instead of syncing', default=None)
+    parser.add_argument('--mirror_workers', type=int, help='Concurrent downloads of small packages when mirroring', default=8)
+    parser.add_argument('--audit',          action='store_true', help='Spot-check archived InstallAssistants instead of syncing')
+    parser.add_argument('--audit_samples',  type=int, help='Chunks to verify per archived item', default=8)
 
     args = parser.parse_args()
 
+    macos_sync.network.TRANSPORT.configure(pool_maxsize=args.http_connections, timeout=(10, args.http_timeout))
+
     sync_obj = macos_sync.sync.macOSSync(
         access_key=args.access_key,
         secret_key=args.secret_key,
-        target_version=args.target_version
+        target_version=args.target_version,
+        max_items=args.max_items,
+        disk_budget=int(args.disk_budget * 1000 * 1000 * 1000) if args.disk_budget else None,
+        work_dir=args.work_dir,
+        time_budget=args.time_budget * 60 if args.time_budget else None,
+        history_path=args.history,
+        work_queue=macos_sync.work_queue.WORK_QUEUE_BACKENDS[args.work_queue_backend](args.work_queue) if args.work_queue else None,
+        multipart=not args.no_multipart,
+        failure_registry_path=args.failures,
+        discovery=args.discovery,
+        catalog_history_path=args.catalog_history,
+        cache=macos_sync.network.ArtifactCache(
+            args.cache,
+            max_size=int(args.cache_size * 1000 * 1000 * 1000) if args.cache_size else None,
+            min_free=int(args.cache_min_free * 1000 * 1000 * 1000),
+        ) if args.cache else None,
+        sync_policy=args.fsync,
+        parse_workers=args.parse_workers,
+        appledb_cache_path=args.appledb_cache
     )
-    if args.variant == 'AppleDB IPSW':
-        sync_obj.iterate_apple_db()
-    elif args.variant == 'SUCatalog':
-        sync_obj.iterate_catalog()
-    else:
-        raise ValueError(f'Unknown variant: {args.variant}')
\ No newline at end of file
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    profilers = contextlib.ExitStack()
+    if args.profile:
+        profilers.enter_context(macos_sync.profiling.PROFILERS[args.profile](f"{args.work_dir}/profile-{args.profile}-{timestamp}.txt"))
+    if args.sample_interval:
+        profilers.enter_context(macos_sync.profiling.StackSampler(f"{args.work_dir}/profile-samples-{timestamp}.txt", interval=args.sample_interval))
+
+    try:
+        with profilers:
+            if args.plan:
+                # Keep stdout clean for JSON consumers
+                with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+                    pending = sync_obj.plan(args.variant)
+
+                if args.json:
+                    print(json.dumps(pending, indent=4))
+                else:
+                    print(f"{len(pending)} pending installer(s):")
+                    for item in pending:
+                        print(f"  {'*' if item['InRun'] else ' '} {item['Name']}: {macos_sync.network.human_fmt(item['Size'])}, ~{item['EstimatedSeconds'] / 60:.1f} minutes")
+                    print("* Would be synced this run")
+            elif args.mirror:
+                sync_obj.mirror_catalogs(args.mirror, workers=args.mirror_workers)
+            elif args.audit:
+                sync_obj.audit_archived_installers(samples=args.audit_samples)
+            elif args.variant == 'AppleDB IPSW':
+                sync_obj.iterate_apple_db()
+            elif args.variant == 'SUCatalog':
+                sync_obj.iterate_catalog()
+            else:
+                raise ValueError(f'Unknown variant: {args.variant}')
+    finally:
+        http_stats = macos_sync.network.TRANSPORT.stats()
+        print(f"HTTP: {http_stats['Requests']} request(s) over {http_stats['NewConnections']} connection(s) ({http_stats['ReuseRatio'] * 100:.0f}% reused), {http_stats['DNSLookups']} DNS lookup(s)", file=sys.stderr if args.json else sys.stdout)
+        if args.trace:
+            macos_sync.telemetry.TELEMETRY.export_json(args.trace)
+        if args.metrics:
+            macos_sync.telemetry.TELEMETRY.export_prometheus(args.metrics)
\ No newline at end of file